@@ -0,0 +1,190 @@
+"""Show query plans and timings for the hot leave/audit queries before and
+after the indexes from migrations 3f9c2a7d41b8, c47e1b9d2a63 and d2a7c5e8f1b3.
+
+Runs against a throwaway SQLite database seeded with synthetic data, so it
+needs nothing beyond the standard library:
+
+    python benchmarks/index_plans.py [--employees 5000] [--leaves 200000] [--audit 500000]
+
+Point the same queries at PostgreSQL with EXPLAIN ANALYZE to check a
+production-sized database.
+"""
+import argparse
+import random
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+
+SCHEMA = """
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY,
+    username VARCHAR(80) NOT NULL,
+    role VARCHAR(8) NOT NULL,
+    manager_id INTEGER REFERENCES users(id)
+);
+CREATE TABLE user_hierarchy (
+    ancestor_id INTEGER NOT NULL REFERENCES users(id),
+    descendant_id INTEGER NOT NULL REFERENCES users(id),
+    depth INTEGER NOT NULL,
+    PRIMARY KEY (ancestor_id, descendant_id)
+);
+CREATE TABLE leave_requests (
+    id INTEGER PRIMARY KEY,
+    employee_id INTEGER NOT NULL REFERENCES users(id),
+    leave_type VARCHAR(9) NOT NULL,
+    start_date DATE NOT NULL,
+    end_date DATE NOT NULL,
+    status VARCHAR(9),
+    created_at DATETIME,
+    updated_at DATETIME
+);
+CREATE TABLE audit_logs (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    action VARCHAR(100) NOT NULL,
+    entity_type VARCHAR(50) NOT NULL,
+    timestamp DATETIME
+);
+"""
+
+# Keep in sync with migrations/versions/3f9c2a7d41b8_*.py, c47e1b9d2a63_*.py
+# and d2a7c5e8f1b3_*.py
+INDEXES = [
+    "CREATE INDEX ix_users_manager_id ON users (manager_id)",
+    "CREATE INDEX ix_user_hierarchy_descendant_depth ON user_hierarchy (descendant_id, depth)",
+    "CREATE INDEX ix_leave_requests_employee_status_created ON leave_requests (employee_id, status, created_at)",
+    "CREATE INDEX ix_leave_requests_employee_created ON leave_requests (employee_id, created_at)",
+    "CREATE INDEX ix_leave_requests_status_created ON leave_requests (status, created_at)",
+    "CREATE INDEX ix_leave_requests_start_date ON leave_requests (start_date)",
+    "CREATE INDEX ix_leave_requests_end_start ON leave_requests (end_date, start_date)",
+    "CREATE INDEX ix_leave_requests_employee_end ON leave_requests (employee_id, end_date, start_date)",
+    "CREATE INDEX ix_audit_logs_timestamp ON audit_logs (timestamp)",
+    "CREATE INDEX ix_audit_logs_user_timestamp ON audit_logs (user_id, timestamp)",
+]
+
+# hierarchy.in_org(): everyone below a manager, from the closure table
+IN_ORG = "(SELECT descendant_id FROM user_hierarchy WHERE ancestor_id = :director AND depth > 0)"
+
+# (name, sql, params) mirroring the ORM queries in the blueprints
+QUERIES = [
+    ('manager.leave_requests (pending)',
+     f"SELECT lr.* FROM leave_requests lr WHERE lr.employee_id IN {IN_ORG} AND lr.status = 'PENDING' "
+     "ORDER BY lr.created_at DESC LIMIT 10", {}),
+    ('hierarchy.ancestor_id_set',
+     "SELECT ancestor_id FROM user_hierarchy WHERE descendant_id = :manager", {}),
+    ('employee.my_leaves',
+     "SELECT * FROM leave_requests WHERE employee_id = :employee "
+     "ORDER BY created_at DESC LIMIT 10", {}),
+    ('employee.my_leaves (status filter)',
+     "SELECT * FROM leave_requests WHERE employee_id = :employee AND status = 'APPROVED' "
+     "ORDER BY created_at DESC LIMIT 10", {}),
+    ('manager.dashboard (admin, pending)',
+     "SELECT * FROM leave_requests WHERE status = 'PENDING' "
+     "ORDER BY created_at DESC LIMIT 5", {}),
+    ('generate_monthly_report',
+     "SELECT * FROM leave_requests WHERE start_date >= :month_start AND start_date <= :month_end", {}),
+    ('team_calendar (org)',
+     "SELECT lr.* FROM leave_requests lr JOIN users u ON lr.employee_id = u.id "
+     f"WHERE u.id IN {IN_ORG} AND lr.status IN ('APPROVED', 'PENDING') "
+     "AND lr.start_date <= :month_end AND lr.end_date >= :month_start", {}),
+    ('staffing check (team)',
+     "SELECT lr.* FROM leave_requests lr JOIN users u ON lr.employee_id = u.id "
+     "WHERE u.manager_id = :manager AND lr.status IN ('APPROVED', 'PENDING') "
+     "AND lr.start_date <= :month_end AND lr.end_date >= :month_start", {}),
+    ('team_calendar (everyone)',
+     "SELECT * FROM leave_requests WHERE status IN ('APPROVED', 'PENDING') "
+     "AND start_date <= :month_end AND end_date >= :month_start", {}),
+    ('admin.audit_logs',
+     "SELECT * FROM audit_logs ORDER BY timestamp DESC LIMIT 20 OFFSET 0", {}),
+]
+
+STATUSES = ['PENDING', 'APPROVED', 'REJECTED', 'CANCELLED']
+LEAVE_TYPES = ['SICK', 'VACATION', 'PERSONAL', 'MATERNITY', 'PATERNITY', 'EMERGENCY']
+
+
+def seed(conn, employees, leaves, audit):
+    rng = random.Random(42)
+    # Directors, then managers reporting to them, then employees
+    managers = max(1, employees // 25)
+    directors = max(1, managers // 10)
+    users = [(i, f'director{i}', 'MANAGER', None) for i in range(1, directors + 1)]
+    users += [(i, f'manager{i}', 'MANAGER', rng.randint(1, directors))
+              for i in range(directors + 1, directors + managers + 1)]
+    users += [(i, f'employee{i}', 'EMPLOYEE', rng.randint(directors + 1, directors + managers))
+              for i in range(directors + managers + 1, directors + managers + employees + 1)]
+    conn.executemany("INSERT INTO users VALUES (?, ?, ?, ?)", users)
+
+    manager_of = {user_id: manager_id for user_id, _, _, manager_id in users}
+    hierarchy = []
+    for user_id in manager_of:
+        ancestor, depth = user_id, 0
+        while ancestor is not None:
+            hierarchy.append((ancestor, user_id, depth))
+            ancestor, depth = manager_of[ancestor], depth + 1
+    conn.executemany("INSERT INTO user_hierarchy VALUES (?, ?, ?)", hierarchy)
+    bosses = directors + managers
+
+    first_day = date(2020, 1, 1)
+    now = datetime(2026, 1, 1)
+    rows = []
+    for i in range(1, leaves + 1):
+        start = first_day + timedelta(days=rng.randint(0, 6 * 365))
+        created = datetime.combine(start, datetime.min.time()) - timedelta(days=rng.randint(1, 60))
+        rows.append((i, rng.randint(bosses + 1, bosses + employees), rng.choice(LEAVE_TYPES),
+                     start.isoformat(), (start + timedelta(days=rng.randint(0, 10))).isoformat(),
+                     rng.choice(STATUSES), created.isoformat(' '), created.isoformat(' ')))
+    conn.executemany("INSERT INTO leave_requests VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    rows = []
+    for i in range(1, audit + 1):
+        ts = now - timedelta(seconds=rng.randint(0, 3 * 365 * 86400))
+        rows.append((i, rng.randint(1, bosses + employees), 'employee_dashboard_viewed', 'system',
+                     ts.isoformat(' ')))
+    conn.executemany("INSERT INTO audit_logs VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    return {'director': 1, 'manager': directors + 1, 'employee': bosses + 1,
+            'month_start': '2024-03-01', 'month_end': '2024-03-31'}
+
+
+def run_queries(conn, params, repeat):
+    results = {}
+    for name, sql, extra in QUERIES:
+        args = dict(params, **extra)
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", args)]
+        started = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, args).fetchall()
+        elapsed_ms = (time.perf_counter() - started) * 1000 / repeat
+        results[name] = (plan, elapsed_ms)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--employees', type=int, default=5000)
+    parser.add_argument('--leaves', type=int, default=200000)
+    parser.add_argument('--audit', type=int, default=500000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(':memory:')
+    conn.executescript(SCHEMA)
+    params = seed(conn, args.employees, args.leaves, args.audit)
+
+    before = run_queries(conn, params, args.repeat)
+    for statement in INDEXES:
+        conn.execute(statement)
+    conn.execute("ANALYZE")
+    after = run_queries(conn, params, args.repeat)
+
+    for name, _, _ in QUERIES:
+        plan_before, ms_before = before[name]
+        plan_after, ms_after = after[name]
+        print(f"== {name}")
+        print(f"   before ({ms_before:8.2f} ms): " + " | ".join(plan_before))
+        print(f"   after  ({ms_after:8.2f} ms): " + " | ".join(plan_after))
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""add leave request and audit log indexes
+
+Revision ID: 3f9c2a7d41b8
+Revises: 
+Create Date: 2026-10-17 10:12:44.318205
+
+Indexes for the hot listing, dashboard and report queries. Databases
+created with ``run.py create-db`` already have them, so every index is
+created with if_not_exists and the migration is safe to run on either.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d41b8'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_users_manager_id', 'users', ['manager_id'], unique=False, if_not_exists=True)
+    op.create_index('ix_leave_requests_employee_status_created', 'leave_requests',
+                    ['employee_id', 'status', 'created_at'], unique=False, if_not_exists=True)
+    op.create_index('ix_leave_requests_employee_created', 'leave_requests',
+                    ['employee_id', 'created_at'], unique=False, if_not_exists=True)
+    op.create_index('ix_leave_requests_status_created', 'leave_requests',
+                    ['status', 'created_at'], unique=False, if_not_exists=True)
+    op.create_index('ix_leave_requests_start_date', 'leave_requests',
+                    ['start_date'], unique=False, if_not_exists=True)
+    op.create_index('ix_audit_logs_timestamp', 'audit_logs', ['timestamp'], unique=False, if_not_exists=True)
+    op.create_index('ix_audit_logs_user_timestamp', 'audit_logs',
+                    ['user_id', 'timestamp'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_audit_logs_user_timestamp', table_name='audit_logs')
+    op.drop_index('ix_audit_logs_timestamp', table_name='audit_logs')
+    op.drop_index('ix_leave_requests_start_date', table_name='leave_requests')
+    op.drop_index('ix_leave_requests_status_created', table_name='leave_requests')
+    op.drop_index('ix_leave_requests_employee_created', table_name='leave_requests')
+    op.drop_index('ix_leave_requests_employee_status_created', table_name='leave_requests')
+    op.drop_index('ix_users_manager_id', table_name='users')
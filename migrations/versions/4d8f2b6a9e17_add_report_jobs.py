@@ -0,0 +1,48 @@
+"""add report jobs
+
+Revision ID: 4d8f2b6a9e17
+Revises: 9b4e1f7a2c60
+Create Date: 2026-10-17 22:31:48.904512
+
+Background PDF report jobs. The table starts empty; rows are written
+when a report is queued.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d8f2b6a9e17'
+down_revision = '9b4e1f7a2c60'
+branch_labels = None
+depends_on = None
+
+REPORT_JOB_STATUSES = ('QUEUED', 'RUNNING', 'DONE', 'FAILED')
+
+
+def upgrade():
+    op.create_table(
+        'report_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('job_key', sa.String(length=64), nullable=False),
+        sa.Column('report_type', sa.String(length=20), nullable=False),
+        sa.Column('params', sa.JSON(), nullable=False),
+        sa.Column('status', sa.Enum(*REPORT_JOB_STATUSES, name='reportjobstatus'), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=True),
+        sa.Column('artifact_path', sa.String(length=500), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('requested_by', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['requested_by'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_report_jobs_job_key', 'report_jobs', ['job_key'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_report_jobs_job_key', table_name='report_jobs')
+    op.drop_table('report_jobs')
+    sa.Enum(name='reportjobstatus').drop(op.get_bind(), checkfirst=True)
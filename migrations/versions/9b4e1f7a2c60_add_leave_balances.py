@@ -0,0 +1,99 @@
+"""add leave balances
+
+Revision ID: 9b4e1f7a2c60
+Revises: d2a7c5e8f1b3
+Create Date: 2026-10-17 22:14:06.318275
+
+Ledger of pending and used leave days per employee, leave type and year.
+It is backfilled the way ``run.py rebuild-balances`` fills it: pending and
+approved requests are charged their working days, split over the years
+they fall in, skipping WORKING_WEEKEND and the holidays of
+HOLIDAY_CALENDAR.
+
+"""
+from datetime import date, datetime, timedelta
+from alembic import op
+from flask import current_app
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4e1f7a2c60'
+down_revision = 'd2a7c5e8f1b3'
+branch_labels = None
+depends_on = None
+
+LEAVE_TYPES = ('SICK', 'VACATION', 'PERSONAL', 'MATERNITY', 'PATERNITY', 'EMERGENCY')
+
+
+def working_days(start_date, end_date, weekend, holidays):
+    days = 0
+    day = start_date
+    while day <= end_date:
+        if day.weekday() not in weekend and day not in holidays:
+            days += 1
+        day += timedelta(days=1)
+    return days
+
+
+def upgrade():
+    # The enum type already exists for leave_requests
+    leave_type = postgresql.ENUM(*LEAVE_TYPES, name='leavetype', create_type=False)
+    op.create_table(
+        'leave_balances',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('employee_id', sa.Integer(), nullable=False),
+        sa.Column('leave_type', leave_type, nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('days_pending', sa.Integer(), nullable=False),
+        sa.Column('days_used', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['employee_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('employee_id', 'leave_type', 'year', name='uq_leave_balances_employee_type_year')
+    )
+
+    bind = op.get_bind()
+    weekend = set(current_app.config.get('WORKING_WEEKEND', (5, 6)))
+    holidays_table = sa.table('holidays', sa.column('calendar', sa.String), sa.column('date', sa.Date))
+    holidays = {row.date for row in bind.execute(
+        sa.select(holidays_table.c.date)
+        .where(holidays_table.c.calendar == current_app.config.get('HOLIDAY_CALENDAR', 'default'))
+    )}
+
+    leave_requests = sa.table('leave_requests', sa.column('employee_id', sa.Integer),
+                              sa.column('leave_type', sa.String), sa.column('status', sa.String),
+                              sa.column('start_date', sa.Date), sa.column('end_date', sa.Date))
+    rows = bind.execute(sa.select(
+        leave_requests.c.employee_id, leave_requests.c.leave_type, leave_requests.c.status,
+        leave_requests.c.start_date, leave_requests.c.end_date
+    ).where(leave_requests.c.status.in_(['PENDING', 'APPROVED'])))
+
+    totals = {}
+    for employee_id, leave_type, status, start_date, end_date in rows:
+        for year in range(start_date.year, end_date.year + 1):
+            days = working_days(max(start_date, date(year, 1, 1)), min(end_date, date(year, 12, 31)),
+                                weekend, holidays)
+            pending, used = totals.get((employee_id, leave_type, year), (0, 0))
+            if status == 'PENDING':
+                pending += days
+            else:
+                used += days
+            totals[(employee_id, leave_type, year)] = (pending, used)
+
+    if totals:
+        leave_balances = sa.table('leave_balances', sa.column('employee_id', sa.Integer),
+                                  sa.column('leave_type', sa.String), sa.column('year', sa.Integer),
+                                  sa.column('days_pending', sa.Integer), sa.column('days_used', sa.Integer),
+                                  sa.column('updated_at', sa.DateTime))
+        now = datetime.utcnow()
+        op.bulk_insert(leave_balances, [
+            {'employee_id': employee_id, 'leave_type': leave_type, 'year': year,
+             'days_pending': pending, 'days_used': used, 'updated_at': now}
+            for (employee_id, leave_type, year), (pending, used) in totals.items()
+        ])
+
+
+def downgrade():
+    op.drop_table('leave_balances')
@@ -0,0 +1,97 @@
+"""partition audit logs by month
+
+Revision ID: a81d5c3e9f20
+Revises: 3f9c2a7d41b8
+Create Date: 2026-10-17 14:03:51.902417
+
+On PostgreSQL audit_logs becomes a table range partitioned by month on
+timestamp. It gets a partition for every month that has rows, partitions
+for the next three months, and a default partition. Existing rows are
+copied across. Tables created by ``run.py create-db`` after this change
+are already partitioned and are left alone. On other databases the only
+change is that timestamp becomes NOT NULL.
+
+"""
+from datetime import date, datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a81d5c3e9f20'
+down_revision = '3f9c2a7d41b8'
+branch_labels = None
+depends_on = None
+
+PARTITIONS_AHEAD = 3
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def is_partitioned(bind):
+    relkind = bind.execute(sa.text("SELECT relkind FROM pg_class WHERE oid = to_regclass('audit_logs')")).scalar()
+    return relkind == 'p'
+
+
+def upgrade():
+    bind = op.get_bind()
+    op.execute('UPDATE audit_logs SET "timestamp" = CURRENT_TIMESTAMP WHERE "timestamp" IS NULL')
+
+    if bind.dialect.name != 'postgresql':
+        with op.batch_alter_table('audit_logs') as batch_op:
+            batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=False)
+        return
+    if is_partitioned(bind):
+        return
+
+    op.execute('ALTER TABLE audit_logs RENAME TO audit_logs_unpartitioned')
+    op.execute('ALTER TABLE audit_logs_unpartitioned RENAME CONSTRAINT audit_logs_pkey TO audit_logs_unpartitioned_pkey')
+    op.execute('DROP INDEX IF EXISTS ix_audit_logs_timestamp')
+    op.execute('DROP INDEX IF EXISTS ix_audit_logs_user_timestamp')
+    op.execute('CREATE TABLE audit_logs (LIKE audit_logs_unpartitioned INCLUDING DEFAULTS, '
+               'PRIMARY KEY (id, "timestamp")) PARTITION BY RANGE ("timestamp")')
+    op.execute('ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs.id')
+    op.execute('CREATE TABLE audit_logs_default PARTITION OF audit_logs DEFAULT')
+
+    today = datetime.utcnow().date()
+    oldest = bind.execute(sa.text('SELECT min("timestamp") FROM audit_logs_unpartitioned')).scalar()
+    month = date(oldest.year, oldest.month, 1) if oldest else date(today.year, today.month, 1)
+    last = add_months(date(today.year, today.month, 1), PARTITIONS_AHEAD)
+    while month <= last:
+        op.execute(f"CREATE TABLE audit_logs_p{month:%Y_%m} PARTITION OF audit_logs "
+                   f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')")
+        month = add_months(month, 1)
+
+    op.execute('INSERT INTO audit_logs SELECT * FROM audit_logs_unpartitioned')
+    op.execute('DROP TABLE audit_logs_unpartitioned')
+    op.execute('ALTER TABLE audit_logs ADD FOREIGN KEY (user_id) REFERENCES users (id)')
+    op.create_index('ix_audit_logs_timestamp', 'audit_logs', ['timestamp'], unique=False)
+    op.create_index('ix_audit_logs_user_timestamp', 'audit_logs', ['user_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    # Entries already moved to archive files are not restored
+    bind = op.get_bind()
+
+    if bind.dialect.name != 'postgresql':
+        with op.batch_alter_table('audit_logs') as batch_op:
+            batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=True)
+        return
+    if not is_partitioned(bind):
+        return
+
+    op.execute('ALTER TABLE audit_logs RENAME TO audit_logs_partitioned')
+    op.execute('ALTER TABLE audit_logs_partitioned RENAME CONSTRAINT audit_logs_pkey TO audit_logs_partitioned_pkey')
+    op.execute('DROP INDEX ix_audit_logs_timestamp')
+    op.execute('DROP INDEX ix_audit_logs_user_timestamp')
+    op.execute('CREATE TABLE audit_logs (LIKE audit_logs_partitioned INCLUDING DEFAULTS, PRIMARY KEY (id))')
+    op.execute('ALTER TABLE audit_logs ALTER COLUMN "timestamp" DROP NOT NULL')
+    op.execute('ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs.id')
+    op.execute('INSERT INTO audit_logs SELECT * FROM audit_logs_partitioned')
+    op.execute('DROP TABLE audit_logs_partitioned')
+    op.execute('ALTER TABLE audit_logs ADD FOREIGN KEY (user_id) REFERENCES users (id)')
+    op.create_index('ix_audit_logs_timestamp', 'audit_logs', ['timestamp'], unique=False)
+    op.create_index('ix_audit_logs_user_timestamp', 'audit_logs', ['user_id', 'timestamp'], unique=False)
@@ -0,0 +1,41 @@
+"""add user search trigram indexes
+
+Revision ID: b6e3f0c9d4a1
+Revises: f81c3a6e0b52
+Create Date: 2026-10-17 20:12:40.318275
+
+GIN trigram indexes for the /api/users/search typeahead, on the
+lower-cased username, email and "first last" name. PostgreSQL only: it
+enables the pg_trgm extension, and other databases use the in-memory
+prefix index, so nothing is created there.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e3f0c9d4a1'
+down_revision = 'f81c3a6e0b52'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    'ix_users_username_trgm': 'lower(username)',
+    'ix_users_email_trgm': 'lower(email)',
+    'ix_users_full_name_trgm': "lower(first_name || ' ' || last_name)",
+}
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, expression in INDEXES.items():
+        op.execute(f'CREATE INDEX IF NOT EXISTS {name} ON users USING gin (({expression}) gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for name in INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS {name}')
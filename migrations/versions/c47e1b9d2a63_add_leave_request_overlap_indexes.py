@@ -0,0 +1,31 @@
+"""add leave request overlap indexes
+
+Revision ID: c47e1b9d2a63
+Revises: a81d5c3e9f20
+Create Date: 2026-10-17 16:21:08.553710
+
+Indexes for the team calendar's date range overlap query. Like the
+earlier index migration it uses if_not_exists, so databases created with
+``run.py create-db`` are left as they are.
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47e1b9d2a63'
+down_revision = 'a81d5c3e9f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_leave_requests_end_start', 'leave_requests',
+                    ['end_date', 'start_date'], unique=False, if_not_exists=True)
+    op.create_index('ix_leave_requests_employee_end', 'leave_requests',
+                    ['employee_id', 'end_date', 'start_date'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_leave_requests_employee_end', table_name='leave_requests')
+    op.drop_index('ix_leave_requests_end_start', table_name='leave_requests')
@@ -0,0 +1,50 @@
+"""add user hierarchy
+
+Revision ID: d2a7c5e8f1b3
+Revises: b6e3f0c9d4a1
+Create Date: 2026-10-17 21:02:17.540913
+
+Closure table of the manager tree. It is filled from users.manager_id
+with a recursive CTE, which PostgreSQL and SQLite both run.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7c5e8f1b3'
+down_revision = 'b6e3f0c9d4a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'user_hierarchy',
+        sa.Column('ancestor_id', sa.Integer(), nullable=False),
+        sa.Column('descendant_id', sa.Integer(), nullable=False),
+        sa.Column('depth', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['ancestor_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['descendant_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id')
+    )
+    op.create_index('ix_user_hierarchy_descendant_depth', 'user_hierarchy',
+                    ['descendant_id', 'depth'], unique=False)
+
+    op.execute("""
+        INSERT INTO user_hierarchy (ancestor_id, descendant_id, depth)
+        WITH RECURSIVE chain (ancestor_id, descendant_id, depth) AS (
+            SELECT id, id, 0 FROM users
+            UNION ALL
+            SELECT users.manager_id, chain.descendant_id, chain.depth + 1
+            FROM chain JOIN users ON users.id = chain.ancestor_id
+            WHERE users.manager_id IS NOT NULL
+        )
+        SELECT ancestor_id, descendant_id, depth FROM chain
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_user_hierarchy_descendant_depth', table_name='user_hierarchy')
+    op.drop_table('user_hierarchy')
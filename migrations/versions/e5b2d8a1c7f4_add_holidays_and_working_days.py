@@ -0,0 +1,59 @@
+"""add holidays and leave request working days
+
+Revision ID: e5b2d8a1c7f4
+Revises: c47e1b9d2a63
+Create Date: 2026-10-17 17:48:30.114926
+
+Adds the holidays table and leave_requests.working_days. Existing rows
+are backfilled counting Monday to Friday, as no holidays exist yet; run
+``run.py refresh-working-days`` afterwards when WORKING_WEEKEND is not
+Saturday/Sunday, and ``run.py rebuild-balances`` to re-charge balances
+in working days.
+
+"""
+from datetime import timedelta
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b2d8a1c7f4'
+down_revision = 'c47e1b9d2a63'
+branch_labels = None
+depends_on = None
+
+
+def weekdays(start_date, end_date):
+    full_weeks, remainder = divmod((end_date - start_date).days + 1, 7)
+    extra = sum(1 for offset in range(remainder) if (start_date + timedelta(days=offset)).weekday() < 5)
+    return full_weeks * 5 + extra
+
+
+def upgrade():
+    op.create_table(
+        'holidays',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('calendar', sa.String(length=50), nullable=False),
+        sa.Column('date', sa.Date(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('calendar', 'date', name='uq_holidays_calendar_date')
+    )
+    op.add_column('leave_requests', sa.Column('working_days', sa.Integer(), nullable=True))
+
+    bind = op.get_bind()
+    leave_requests = sa.table('leave_requests', sa.column('id', sa.Integer), sa.column('start_date', sa.Date),
+                              sa.column('end_date', sa.Date), sa.column('working_days', sa.Integer))
+    rows = bind.execute(sa.select(leave_requests.c.id, leave_requests.c.start_date, leave_requests.c.end_date))
+    values = [{'request_id': row.id, 'days': weekdays(row.start_date, row.end_date)} for row in rows]
+    if values:
+        bind.execute(
+            leave_requests.update().where(leave_requests.c.id == sa.bindparam('request_id'))
+            .values(working_days=sa.bindparam('days')),
+            values
+        )
+
+
+def downgrade():
+    op.drop_column('leave_requests', 'working_days')
+    op.drop_table('holidays')
@@ -0,0 +1,137 @@
+"""add leave rollups
+
+Revision ID: f81c3a6e0b52
+Revises: e5b2d8a1c7f4
+Create Date: 2026-10-17 19:05:12.662384
+
+Monthly rollup tables and their refresh watermark. They are backfilled
+the way ``run.py refresh-rollups --full`` fills them: each request counts
+once in the month it starts, and its working days, skipping
+WORKING_WEEKEND and the holidays of HOLIDAY_CALENDAR, are split over the
+months they fall in. After that leave writes keep them current.
+
+"""
+from datetime import datetime, timedelta
+from alembic import op
+from flask import current_app
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f81c3a6e0b52'
+down_revision = 'e5b2d8a1c7f4'
+branch_labels = None
+depends_on = None
+
+LEAVE_TYPES = ('SICK', 'VACATION', 'PERSONAL', 'MATERNITY', 'PATERNITY', 'EMERGENCY')
+LEAVE_STATUSES = ('PENDING', 'APPROVED', 'REJECTED', 'CANCELLED')
+
+# manager_id recorded for employees without a manager, as in app.rollups
+UNASSIGNED = 0
+
+
+def working_days(start_date, end_date, weekend, holidays):
+    days = 0
+    day = start_date
+    while day <= end_date:
+        if day.weekday() not in weekend and day not in holidays:
+            days += 1
+        day += timedelta(days=1)
+    return days
+
+
+def next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def backfill(bind):
+    weekend = set(current_app.config.get('WORKING_WEEKEND', (5, 6)))
+    holidays_table = sa.table('holidays', sa.column('calendar', sa.String), sa.column('date', sa.Date))
+    holidays = {row.date for row in bind.execute(
+        sa.select(holidays_table.c.date)
+        .where(holidays_table.c.calendar == current_app.config.get('HOLIDAY_CALENDAR', 'default'))
+    )}
+
+    users = sa.table('users', sa.column('id', sa.Integer), sa.column('manager_id', sa.Integer))
+    leave_requests = sa.table('leave_requests', sa.column('id', sa.Integer), sa.column('employee_id', sa.Integer),
+                              sa.column('leave_type', sa.String), sa.column('status', sa.String),
+                              sa.column('start_date', sa.Date), sa.column('end_date', sa.Date))
+    rows = bind.execute(sa.select(
+        leave_requests.c.id, users.c.manager_id, leave_requests.c.leave_type, leave_requests.c.status,
+        leave_requests.c.start_date, leave_requests.c.end_date
+    ).select_from(leave_requests.join(users, leave_requests.c.employee_id == users.c.id)))
+
+    entries, totals = [], {}
+    for request_id, manager_id, leave_type, status, start_date, end_date in rows:
+        manager_id = manager_id or UNASSIGNED
+        entries.append({'request_id': request_id, 'manager_id': manager_id, 'leave_type': leave_type,
+                        'status': status, 'start_date': start_date, 'end_date': end_date})
+        month = start_date.replace(day=1)
+        while month <= end_date:
+            days = working_days(max(start_date, month), min(end_date, next_month(month) - timedelta(days=1)),
+                                weekend, holidays)
+            requests, total_days = totals.get((month, manager_id, leave_type, status), (0, 0))
+            requests += 1 if month == start_date.replace(day=1) else 0
+            totals[(month, manager_id, leave_type, status)] = (requests, total_days + days)
+            month = next_month(month)
+
+    leave_rollup_entries = sa.table('leave_rollup_entries', sa.column('request_id', sa.Integer),
+                                    sa.column('manager_id', sa.Integer), sa.column('leave_type', sa.String),
+                                    sa.column('status', sa.String), sa.column('start_date', sa.Date),
+                                    sa.column('end_date', sa.Date))
+    leave_rollups = sa.table('leave_rollups', sa.column('month', sa.Date), sa.column('manager_id', sa.Integer),
+                             sa.column('leave_type', sa.String), sa.column('status', sa.String),
+                             sa.column('requests', sa.Integer), sa.column('days', sa.Integer))
+    rollup_state = sa.table('rollup_state', sa.column('name', sa.String), sa.column('watermark', sa.DateTime))
+    if entries:
+        op.bulk_insert(leave_rollup_entries, entries)
+        op.bulk_insert(leave_rollups, [
+            {'month': month, 'manager_id': manager_id, 'leave_type': leave_type, 'status': status,
+             'requests': requests, 'days': days}
+            for (month, manager_id, leave_type, status), (requests, days) in totals.items()
+        ])
+    # Later refresh-rollups runs are incremental from here
+    op.bulk_insert(rollup_state, [{'name': 'leave_rollups', 'watermark': datetime.utcnow()}])
+
+
+def upgrade():
+    # The enum types already exist for leave_requests
+    leave_type = postgresql.ENUM(*LEAVE_TYPES, name='leavetype', create_type=False)
+    leave_status = postgresql.ENUM(*LEAVE_STATUSES, name='leavestatus', create_type=False)
+    op.create_table(
+        'leave_rollups',
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('manager_id', sa.Integer(), nullable=False),
+        sa.Column('leave_type', leave_type, nullable=False),
+        sa.Column('status', leave_status, nullable=False),
+        sa.Column('requests', sa.Integer(), nullable=False),
+        sa.Column('days', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('month', 'manager_id', 'leave_type', 'status')
+    )
+    op.create_index('ix_leave_rollups_manager_id', 'leave_rollups', ['manager_id'], unique=False)
+    op.create_table(
+        'leave_rollup_entries',
+        sa.Column('request_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('manager_id', sa.Integer(), nullable=False),
+        sa.Column('leave_type', leave_type, nullable=False),
+        sa.Column('status', leave_status, nullable=False),
+        sa.Column('start_date', sa.Date(), nullable=False),
+        sa.Column('end_date', sa.Date(), nullable=False),
+        sa.PrimaryKeyConstraint('request_id')
+    )
+    op.create_table(
+        'rollup_state',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('watermark', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+    backfill(op.get_bind())
+
+
+def downgrade():
+    op.drop_table('rollup_state')
+    op.drop_table('leave_rollup_entries')
+    op.drop_index('ix_leave_rollups_manager_id', table_name='leave_rollups')
+    op.drop_table('leave_rollups')
@@ -1,18 +1,29 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, make_response
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context, send_file
 from flask_login import login_required, current_user
 from app import db
-from app.models import User, LeaveRequest, AuditLog, LeaveStatus, UserRole, LeaveType
-from app.forms import UserEditForm, ReportForm, CreateUserForm
+from app.models import User, LeaveRequest, LeaveStatus, UserRole
+from app.forms import UserEditForm, ReportForm, CreateUserForm, UserImportForm
 from app.decorators import admin_required, log_activity
-from sqlalchemy import func, and_, or_
-from datetime import datetime, timedelta
-import pandas as pd
+from app.reports import build_report, data_version, pdf_filename
+from app.report_jobs import report_jobs
+from app.report_cache import report_cache, cache_key
+from app.caching import identity_cache, user_directory
+from app.team_calendar import team_calendar
+from app.audit_store import audit_store
+from app import user_import
+from app import hierarchy
+from app.pagination import keyset_paginate
+from app import analytics
+from app import rollups
+from datetime import datetime
 import io
-from weasyprint import HTML
 import csv
 
 admin_bp = Blueprint('admin', __name__)
 
+# Bytes of CSV buffered before each chunk is sent to the client
+CSV_CHUNK_SIZE = 64 * 1024
+
 @admin_bp.route('/profile')
 @login_required
 def profile():
@@ -23,12 +34,11 @@ def profile():
 @login_required
 @admin_required
 def dashboard():
-    page = request.args.get('page', 1, type=int)
-    per_page = 10
-    users = User.query.order_by(User.id.desc()).paginate(page=page, per_page=per_page, error_out=False)
+    users = keyset_paginate(User.query, (User.id,), cursor=request.args.get('cursor'), per_page=10)
     form = ReportForm()
+    leave_stats = rollups.status_counts()
     log_activity('admin_dashboard_viewed')
-    return render_template('admin/dashboard.html', users=users, form=form)
+    return render_template('admin/dashboard.html', users=users, form=form, leave_stats=leave_stats)
 
 @admin_bp.route('/add_user', methods=['GET', 'POST'])
 @login_required
@@ -47,7 +57,10 @@ def add_user():
         )
         user.set_password(form.password.data)
         db.session.add(user)
+        db.session.flush()
+        hierarchy.add_users([user.id])
         db.session.commit()
+        user_directory.invalidate()
         log_activity('user_created', 'user', user.id, new_values={
             'username': user.username,
             'email': user.email,
@@ -59,16 +72,47 @@ def add_user():
         return redirect(url_for('admin.manage_users'))
     return render_template('admin/addnewuser.html', form=form)
 
+@admin_bp.route('/import_users', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def import_users():
+    form = UserImportForm()
+    result = None
+    if form.validate_on_submit():
+        upload = form.file.data
+        try:
+            rows = list(user_import.read_rows(io.BytesIO(upload.read()), upload.filename))
+        except Exception as e:
+            flash(f'Could not read {upload.filename}: {e}', 'danger')
+            return render_template('admin/import_users.html', form=form, result=None,
+                                   required=user_import.REQUIRED_COLUMNS, optional=user_import.OPTIONAL_COLUMNS)
+        
+        result = user_import.import_users(rows)
+        log_activity('users_imported', 'user', new_values={
+            'filename': upload.filename,
+            'created': result.created,
+            'errors': len(result.errors)
+        }, sync=True)
+        
+        if result.created:
+            flash(f'{result.created} user(s) imported successfully', 'success')
+        if result.errors:
+            flash(f'{len(result.errors)} row(s) were not imported, see the report below', 'warning')
+    
+    return render_template('admin/import_users.html', form=form, result=result,
+                           required=user_import.REQUIRED_COLUMNS, optional=user_import.OPTIONAL_COLUMNS)
+
 @admin_bp.route('/manage_users')
 @login_required
 @admin_required
 def manage_users():
-    page = request.args.get('page', 1, type=int)
-    per_page = 10
+    # The find-a-user box submits the picked id
+    picked = request.args.get('user', type=int)
+    if picked:
+        return redirect(url_for('admin.edit_user', user_id=picked))
     
-    users = User.query.paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    users = keyset_paginate(User.query, (User.id,), cursor=request.args.get('cursor'), per_page=10,
+                            descending=False, with_total=request.args.get('count') == '1')
     
     log_activity('users_management_viewed')
     
@@ -101,8 +145,14 @@ def edit_user(user_id):
             user.manager_id = form.manager_id.data
         else:
             user.manager_id = None
+        if user.manager_id != old_values['manager_id']:
+            hierarchy.move_user(user.id, user.manager_id)
+            rollups.record_employee_change(user.id)
             
         db.session.commit()
+        identity_cache.invalidate(user.id)
+        user_directory.invalidate()
+        team_calendar.invalidate_teams([old_values['manager_id'], user.manager_id])
         
         new_values = {
             'username': user.username,
@@ -151,6 +201,9 @@ def delete_user(user_id):
     log_activity('user_deactivated', 'user', user.id, old_values, new_values)
 
     db.session.commit()
+    identity_cache.invalidate(user.id)
+    user_directory.invalidate()
+    team_calendar.invalidate_teams([user.manager_id])
     
     flash('User deactivated successfully', 'success')
     return redirect(url_for('admin.manage_users'))
@@ -160,16 +213,50 @@ def delete_user(user_id):
 @login_required
 @admin_required
 def audit_logs():
-    page = request.args.get('page', 1, type=int)
-    per_page = 20
-    
-    logs = AuditLog.query.order_by(AuditLog.timestamp.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    start = request.args.get('start', type=parse_date)
+    end = request.args.get('end', type=parse_date)
+    logs = audit_store.search(start=start, end=end, cursor=request.args.get('cursor'), per_page=20,
+                              with_total=request.args.get('count') == '1')
     
     log_activity('audit_logs_viewed')
     
-    return render_template('admin/audit_logs.html', logs=logs)
+    return render_template('admin/audit_logs.html', logs=logs, start=start, end=end)
+
+
+@admin_bp.route('/analytics')
+@login_required
+@admin_required
+def leave_analytics():
+    year = request.args.get('year', datetime.now().year, type=int)
+    if year not in analytics.YEARS:
+        flash(f'Year must be between {analytics.YEARS.start} and {analytics.YEARS.stop - 1}', 'danger')
+        year = datetime.now().year
+    results = analytics.compute(year)
+    
+    log_activity('analytics_viewed', new_values={'year': year})
+    
+    return render_template('admin/analytics.html', year=year,
+                           absence_rate=analytics.absence_rate_by_team(results['absence_rate']),
+                           bradford=analytics.records(results['bradford'].head(20)),
+                           leave_type_mix=analytics.records(results['leave_type_mix']),
+                           approval_latency=analytics.records(results['approval_latency']))
+
+@admin_bp.route('/analytics/<metric>')
+@login_required
+@admin_required
+def leave_analytics_data(metric):
+    """JSON rows for one metric: absence_rate, bradford, leave_type_mix or approval_latency"""
+    if metric not in analytics.METRICS:
+        return jsonify({'error': f'Unknown metric: {metric}'}), 404
+    year = request.args.get('year', datetime.now().year, type=int)
+    if year not in analytics.YEARS:
+        return jsonify({'error': f'year must be between {analytics.YEARS.start} and {analytics.YEARS.stop - 1}'}), 400
+    frame = analytics.compute(year, [metric])[metric]
+    return jsonify({'year': year, 'metric': metric, 'rows': analytics.records(frame)})
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
 
 @admin_bp.route('/reports', methods=['GET', 'POST'])
 @login_required
@@ -198,157 +285,67 @@ def reports():
 
 
 def generate_monthly_report(month, year, format_type, manager_id=None):
-    # Query leave requests for the specified month and year
-    start_date = datetime(year, month, 1)
-    if month == 12:
-        end_date = datetime(year + 1, 1, 1) - timedelta(days=1)
-    else:
-        end_date = datetime(year, month + 1, 1) - timedelta(days=1)
+    params = {'month': month, 'year': year, 'manager_id': manager_id or None}
+    return generate_report_response('monthly', params, format_type, 'monthly_report_generated')
 
-    query = LeaveRequest.query.filter(
-        and_(LeaveRequest.start_date >= start_date.date(),
-             LeaveRequest.start_date <= end_date.date())
-    )
 
-    if manager_id:
-        employee_ids = [e.id for e in User.query.get(manager_id).employees]
-        query = query.filter(LeaveRequest.employee_id.in_(employee_ids))
+def generate_team_report(manager_id, format_type):
+    return generate_report_response('team', {'manager_id': manager_id}, format_type, 'team_report_generated')
 
-    leaves = query.all()
-    
-    data = []
-    for leave in leaves:
-        data.append({
-            'Employee': leave.employee.full_name,
-            'Leave Type': leave.leave_type.value.title(),
-            'Start Date': leave.start_date.strftime('%Y-%m-%d'),
-            'End Date': leave.end_date.strftime('%Y-%m-%d'),
-            'Duration': leave.duration,
-            'Status': leave.status.value.title(),
-            'Approved By': leave.approver.full_name if leave.approver else 'N/A'
-        })
-    
-    log_activity('monthly_report_generated', new_values={'month': month, 'year': year, 'format': format_type})
-    
-    if format_type == 'csv':
-        return generate_csv_response(data, f'monthly_report_{month}_{year}.csv')
-    else:
-        return generate_pdf_response(data, f'Monthly Leave Report - {datetime(year, month, 1).strftime("%B %Y")}')
 
+def generate_user_report(employee_id, format_type):
+    return generate_report_response('user', {'employee_id': employee_id}, format_type, 'user_report_generated')
 
-def generate_team_report(manager_id, format_type):
-    if manager_id:
-        manager = User.query.get(manager_id)
-        if not manager:
-            flash('Selected manager not found', 'error')
-            return redirect(url_for('admin.reports'))
-        employees = manager.employees
-        title = f'Team Report - {manager.full_name}'
-        filename_prefix = f'team_report_{manager.full_name.replace(" ", "_").lower()}'
-    else:
-        employees = User.query.filter_by(role=UserRole.EMPLOYEE).all()
-        title = 'All Teams Report'
-        filename_prefix = 'all_teams_report'
+
+def generate_report_response(report_type, params, format_type, action):
+    """Serve a cached report if the data is unchanged; otherwise stream CSV
+    reports directly and queue PDF reports as background jobs"""
+    try:
+        title, filename_prefix, columns, rows = build_report(report_type, params)
+    except LookupError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('admin.reports'))
     
-    data = []
-    for employee in employees:
-        leaves = LeaveRequest.query.filter_by(employee_id=employee.id).all()
-        for leave in leaves:
-            data.append({
-                'Employee': employee.full_name,
-                'Manager': employee.manager.full_name if employee.manager else 'N/A',
-                'Leave Type': leave.leave_type.value.title(),
-                'Start Date': leave.start_date.strftime('%Y-%m-%d'),
-                'End Date': leave.end_date.strftime('%Y-%m-%d'),
-                'Duration': leave.duration,
-                'Status': leave.status.value.title()
-            })
+    log_activity(action, new_values=dict(params, format=format_type))
     
-    log_activity('team_report_generated', new_values={'manager_id': manager_id, 'format': format_type})
+    key = cache_key(report_type, params, format_type, data_version(report_type, params), title)
     
     if format_type == 'csv':
-        return generate_csv_response(data, f'{filename_prefix}.csv')
-    else:
-        return generate_pdf_response(data, title)
-
-
-def generate_user_report(employee_id, format_type):
-    if employee_id:
-        employee = User.query.get(employee_id)
-        if not employee:
-            flash('Selected employee not found', 'error')
-            return redirect(url_for('admin.reports'))
-        leaves = LeaveRequest.query.filter_by(employee_id=employee_id).all()
-        title = f'User Report - {employee.full_name}'
-        filename_prefix = f'user_report_{employee.full_name.replace(" ", "_").lower()}'
-    else:
-        leaves = LeaveRequest.query.all()
-        title = 'All Users Report'
-        filename_prefix = 'all_users_report'
+        filename = f'{filename_prefix}.csv'
+        cached = report_cache.get(key, 'csv')
+        if cached is not None:
+            return send_file(cached, mimetype='text/csv', as_attachment=True, download_name=filename)
+        return generate_csv_response(columns, rows, filename, cache_key=key)
     
-    data = []
-    for leave in leaves:
-        data.append({
-            'Employee': leave.employee.full_name,
-            'Leave Type': leave.leave_type.value.title(),
-            'Start Date': leave.start_date.strftime('%Y-%m-%d'),
-            'End Date': leave.end_date.strftime('%Y-%m-%d'),
-            'Duration': leave.duration,
-            'Status': leave.status.value.title(),
-            'Reason': leave.reason or 'N/A'
-        })
+    cached = report_cache.get(key, 'pdf')
+    if cached is not None:
+        return send_file(cached, mimetype='application/pdf', as_attachment=True, download_name=pdf_filename(title))
     
-    log_activity('user_report_generated', new_values={'employee_id': employee_id, 'format': format_type})
-    
-    if format_type == 'csv':
-        return generate_csv_response(data, f'{filename_prefix}.csv')
-    else:
-        return generate_pdf_response(data, title)
+    job = report_jobs.submit(report_type, params, current_user, key)
+    flash(f'"{title}" is being generated. It will be available for download here when ready.', 'info')
+    return redirect(url_for('main.report_job', job_id=job.id))
 
 
-def generate_csv_response(data, filename):
-    output = io.StringIO()
-    if data:
-        writer = csv.DictWriter(output, fieldnames=data[0].keys())
-        writer.writeheader()
-        writer.writerows(data)
+def generate_csv_response(columns, rows, filename, cache_key=None):
+    """Stream rows as CSV, flushing roughly CSV_CHUNK_SIZE bytes at a time.
+    With a cache_key the output is also written to the report cache."""
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= CSV_CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+        yield buffer.getvalue()
     
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
+    chunks = generate()
+    if cache_key:
+        chunks = report_cache.store_stream(cache_key, 'csv', chunks)
+    
+    response = Response(stream_with_context(chunks), mimetype='text/csv')
     response.headers['Content-Disposition'] = f'attachment; filename={filename}'
     return response
 
-
-def generate_pdf_response(data, title):
-    df = pd.DataFrame(data) if data else pd.DataFrame()
-    html_string = f'''
-    <html>
-    <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; margin: 20px; }}
-            h1 {{ color: #333; text-align: center; margin-bottom: 20px; }}
-            .report-info {{ text-align: center; margin-bottom: 30px; color: #666; }}
-            table {{ border-collapse: collapse; width: 100%; margin-top: 20px; }}
-            th, td {{ border: 1px solid #ddd; padding: 12px; text-align: left; font-size: 12px; }}
-            th {{ background-color: #f2f2f2; font-weight: bold; }}
-            tr:nth-child(even) {{ background-color: #f9f9f9; }}
-            .no-data {{ text-align: center; color: #666; margin-top: 50px; font-style: italic; }}
-        </style>
-    </head>
-    <body>
-        <h1>{title}</h1>
-        <div class="report-info">
-            <p>Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-            <p>Total Records: {len(data) if data else 0}</p>
-        </div>
-        {df.to_html(index=False, table_id='report-table', classes='table', escape=False) if not df.empty else '<div class="no-data"><p>No data available for the selected criteria</p></div>'}
-    </body>
-    </html>
-    '''
-    
-    pdf = HTML(string=html_string).write_pdf()
-    
-    response = make_response(pdf)
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename={title.replace(" ", "_").lower()}.pdf'
-    return response
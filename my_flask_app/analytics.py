@@ -0,0 +1,221 @@
+import json
+import numpy as np
+import pandas as pd
+from datetime import MAXYEAR, MINYEAR, date
+from functools import cached_property
+from sqlalchemy import func
+from app import db
+from app.models import LeaveRequest, LeaveStatus, LeaveType, UserRole
+from app.reports import Employee, Manager
+from app.working_days import working_calendar
+from app import rollups
+
+# Unplanned absence counted by the Bradford factor
+BRADFORD_LEAVE_TYPES = (LeaveType.SICK, LeaveType.EMERGENCY)
+
+# Years compute() accepts; the working calendar also needs the next January 1st
+YEARS = range(MINYEAR, MAXYEAR)
+
+# Stands in for the missing manager_id of employees without a team
+UNASSIGNED = 0
+
+LEAVE_COLUMNS = ['id', 'employee_id', 'employee_name', 'manager_id', 'leave_type', 'status',
+                 'start_date', 'end_date', 'created_at', 'approval_date']
+ROLLUP_COLUMNS = ['month', 'manager_id', 'leave_type', 'status', 'requests', 'days']
+
+
+def load_leaves(year):
+    """Every leave request overlapping ``year`` as a DataFrame, from one query"""
+    query = db.session.query(
+        LeaveRequest.id,
+        LeaveRequest.employee_id,
+        (Employee.first_name + ' ' + Employee.last_name).label('employee_name'),
+        Employee.manager_id,
+        LeaveRequest.leave_type,
+        LeaveRequest.status,
+        LeaveRequest.start_date,
+        LeaveRequest.end_date,
+        LeaveRequest.created_at,
+        LeaveRequest.approval_date
+    ).join(Employee, LeaveRequest.employee_id == Employee.id).filter(
+        LeaveRequest.start_date <= date(year, 12, 31),
+        LeaveRequest.end_date >= date(year, 1, 1)
+    )
+    frame = pd.DataFrame.from_records(query.all(), columns=LEAVE_COLUMNS)
+    frame['manager_id'] = frame['manager_id'].fillna(UNASSIGNED).astype(int)
+    frame['leave_type'] = frame['leave_type'].map({leave_type: leave_type.value for leave_type in LeaveType})
+    frame['status'] = frame['status'].map({status: status.value for status in LeaveStatus})
+    for column in ['start_date', 'end_date', 'created_at', 'approval_date']:
+        frame[column] = pd.to_datetime(frame[column])
+    return frame
+
+
+def load_rollups(year):
+    """The year's monthly rollup rows as a DataFrame with an integer month column"""
+    frame = pd.DataFrame.from_records(rollups.year_rows(year), columns=ROLLUP_COLUMNS)
+    frame['month'] = pd.to_datetime(frame['month']).dt.month
+    frame['leave_type'] = frame['leave_type'].map({leave_type: leave_type.value for leave_type in LeaveType})
+    frame['status'] = frame['status'].map({status: status.value for status in LeaveStatus})
+    return frame
+
+
+def load_teams():
+    """Active employees per manager, with the manager's name, as a DataFrame"""
+    query = db.session.query(
+        Employee.manager_id,
+        (Manager.first_name + ' ' + Manager.last_name).label('team'),
+        func.count(Employee.id)
+    ).outerjoin(Manager, Employee.manager_id == Manager.id).filter(
+        Employee.role == UserRole.EMPLOYEE,
+        Employee.is_active.is_(True)
+    ).group_by(Employee.manager_id, Manager.first_name, Manager.last_name)
+    teams = pd.DataFrame.from_records(query.all(), columns=['manager_id', 'team', 'headcount'])
+    teams['manager_id'] = teams['manager_id'].fillna(UNASSIGNED).astype(int)
+    teams['team'] = teams['team'].fillna('No manager')
+    return teams.set_index('manager_id')
+
+
+class YearCalendar:
+    """Working-day flags and month numbers for every day of a year, as arrays"""
+
+    def __init__(self, year):
+        self.year = year
+        self.first_day = np.datetime64(f'{year}-01-01', 'D')
+        self.working = np.array(working_calendar.year_flags(year), dtype=bool)
+        days = self.first_day + np.arange(len(self.working))
+        self.month = days.astype('datetime64[M]').astype(int) % 12 + 1
+
+    def working_days_per_month(self):
+        return pd.Series(self.working.astype(int)).groupby(self.month).sum()
+
+    def explode(self, frame):
+        """(row, day) index pairs for every working day each leave covers in the year.
+
+        Built with np.repeat over the clipped ranges, so no Python loop runs
+        over leaves or days.
+        """
+        starts = np.maximum((frame['start_date'].values.astype('datetime64[D]') - self.first_day).astype(int), 0)
+        ends = np.minimum((frame['end_date'].values.astype('datetime64[D]') - self.first_day).astype(int),
+                          len(self.working) - 1)
+        lengths = np.maximum(ends - starts + 1, 0)
+        rows = np.repeat(np.arange(len(frame)), lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        days = np.repeat(starts, lengths) + offsets
+        keep = self.working[days]
+        return rows[keep], days[keep]
+
+    def days_in_year(self, frame):
+        """Working days each leave covers within the year"""
+        rows, _ = self.explode(frame)
+        return np.bincount(rows, minlength=len(frame))
+
+
+def absence_rate(rollup_rows, teams, calendar):
+    """Approved absence days / (headcount x working days), per team and month.
+
+    Absence days come from the monthly rollups. Headcount is the team's
+    current number of active employees.
+    """
+    approved = rollup_rows[rollup_rows['status'] == LeaveStatus.APPROVED.value]
+    absent = approved.groupby(['manager_id', 'month'])['days'].sum()
+
+    grid = pd.MultiIndex.from_product([teams.index, range(1, 13)], names=['manager_id', 'month'])
+    result = pd.DataFrame(index=grid).reset_index()
+    result['absence_days'] = absent.reindex(grid, fill_value=0).values
+    result = result.join(teams, on='manager_id')
+    result['working_days'] = result['month'].map(calendar.working_days_per_month())
+    capacity = result['headcount'] * result['working_days']
+    result['rate'] = (result['absence_days'] / capacity.where(capacity > 0)).fillna(0).round(4)
+    return result[['manager_id', 'team', 'month', 'headcount', 'working_days', 'absence_days', 'rate']]
+
+
+def bradford_factors(leaves, calendar, limit=None):
+    """Bradford factor S^2 x D per employee over approved unplanned absence,
+    where S is the number of spells and D the working days taken in the year"""
+    unplanned = leaves[(leaves['status'] == LeaveStatus.APPROVED.value) &
+                       leaves['leave_type'].isin([leave_type.value for leave_type in BRADFORD_LEAVE_TYPES])]
+    unplanned = unplanned.assign(days=calendar.days_in_year(unplanned))
+    unplanned = unplanned[unplanned['days'] > 0]
+    result = unplanned.groupby(['employee_id', 'employee_name']).agg(
+        spells=('id', 'count'), days=('days', 'sum')
+    ).reset_index()
+    result['score'] = result['spells'] ** 2 * result['days']
+    result = result.sort_values(['score', 'employee_name'], ascending=[False, True])
+    return result.head(limit) if limit else result
+
+
+def leave_type_mix(rollup_rows):
+    """Approved requests (by start month) and working days per leave type,
+    with each type's share of days, from the monthly rollups"""
+    approved = rollup_rows[rollup_rows['status'] == LeaveStatus.APPROVED.value]
+    result = approved.groupby('leave_type').agg(requests=('requests', 'sum'), days=('days', 'sum'))
+    result = result.reindex([leave_type.value for leave_type in LeaveType], fill_value=0).reset_index()
+    total = result['days'].sum()
+    result['share'] = (result['days'] / total).round(4) if total else 0.0
+    return result
+
+
+def approval_latency(leaves, teams):
+    """Hours from submission to decision for reviewed requests, per team"""
+    decided = leaves[leaves['approval_date'].notna() &
+                     leaves['status'].isin([LeaveStatus.APPROVED.value, LeaveStatus.REJECTED.value])]
+    decided = decided.assign(hours=(decided['approval_date'] - decided['created_at']).dt.total_seconds() / 3600)
+    result = decided.groupby('manager_id')['hours'].agg(
+        requests='count', mean_hours='mean', median_hours='median',
+        p90_hours=lambda hours: hours.quantile(0.9)
+    ).round(1).reset_index()
+    result['team'] = result['manager_id'].map(teams['team']).fillna('No manager')
+    return result[['manager_id', 'team', 'requests', 'mean_hours', 'median_hours', 'p90_hours']]
+
+
+def absence_rate_by_team(frame):
+    """absence_rate() reshaped to one dict per team holding its twelve monthly rates"""
+    rates = frame.pivot(index='manager_id', columns='month', values='rate')
+    teams = frame.drop_duplicates('manager_id').set_index('manager_id')
+    return [{'manager_id': int(manager_id), 'team': teams.at[manager_id, 'team'],
+             'headcount': int(teams.at[manager_id, 'headcount']), 'rates': rates.loc[manager_id].tolist()}
+            for manager_id in teams.sort_values('team').index]
+
+
+def records(frame):
+    """DataFrame rows as JSON-ready dicts, NumPy scalars and NaN converted"""
+    return json.loads(frame.to_json(orient='records'))
+
+
+class AnalyticsData:
+    """Inputs shared by the metrics of one year, each loaded on first use"""
+
+    def __init__(self, year):
+        self.year = year
+
+    @cached_property
+    def leaves(self):
+        return load_leaves(self.year)
+
+    @cached_property
+    def rollup_rows(self):
+        return load_rollups(self.year)
+
+    @cached_property
+    def teams(self):
+        return load_teams()
+
+    @cached_property
+    def calendar(self):
+        return YearCalendar(self.year)
+
+
+# Team and type totals read the rollups; metrics that need individual
+# requests load the year's rows
+METRICS = {
+    'absence_rate': lambda data: absence_rate(data.rollup_rows, data.teams, data.calendar),
+    'bradford': lambda data: bradford_factors(data.leaves, data.calendar),
+    'leave_type_mix': lambda data: leave_type_mix(data.rollup_rows),
+    'approval_latency': lambda data: approval_latency(data.leaves, data.teams),
+}
+
+
+def compute(year, metrics=None):
+    """{metric: DataFrame} for the named metrics (all by default), sharing their inputs"""
+    data = AnalyticsData(year)
+    return {name: METRICS[name](data) for name in (metrics or METRICS)}
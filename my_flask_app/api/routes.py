@@ -0,0 +1,23 @@
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from app.models import UserRole
+from app.user_search import user_search, hit_dict
+
+api_bp = Blueprint('api', __name__)
+
+@api_bp.route('/users/search')
+@login_required
+def search_users():
+    """Typeahead lookup: ?q= (at least USER_SEARCH_MIN_CHARS characters),
+    optional limit, role (employee, manager or admin) and, for admins,
+    inactive=1 to include deactivated users"""
+    term = request.args.get('q', '')
+    try:
+        role = UserRole(request.args['role']) if request.args.get('role') else None
+    except ValueError:
+        return jsonify({'error': 'unknown role'}), 400
+    include_inactive = current_user.is_admin() and request.args.get('inactive') == '1'
+    
+    hits = user_search.search(current_user, term, limit=request.args.get('limit', type=int),
+                              role=role, include_inactive=include_inactive)
+    return jsonify({'query': term, 'results': [hit_dict(hit) for hit in hits]})
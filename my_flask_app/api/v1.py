@@ -0,0 +1,300 @@
+import hashlib
+import json
+from datetime import date
+from functools import wraps
+from flask import Blueprint, Response, request, url_for
+from flask_login import current_user
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from werkzeug.datastructures import MultiDict
+from app import db
+from app.models import User, LeaveRequest, LeaveStatus
+from app.forms import LeaveRequestForm
+from app.stats import leave_status_counts
+from app.pagination import keyset_paginate
+from app.hierarchy import in_org
+from app.permissions import can_approve_leave
+from app.reviews import REVIEW_STATUSES, review_requests
+from app import balances
+from app import leave_actions
+from app import rollups
+
+api_v1_bp = Blueprint('api_v1', __name__)
+
+MAX_PER_PAGE = 100
+
+
+def compact_json(payload, status=200, headers=None):
+    return Response(json.dumps(payload, separators=(',', ':')), status=status, headers=headers,
+                    mimetype='application/json')
+
+
+def error(status, message, **extra):
+    return compact_json(dict(extra, error=message), status)
+
+
+def api_login_required(f):
+    """login_required answering 401 JSON instead of redirecting to the login page"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return error(401, 'authentication required')
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def json_body():
+    """The request's JSON object, or None. Writes must send JSON, which a
+    cross-site form post cannot, so session cookies are safe without a CSRF token"""
+    if not request.is_json:
+        return None
+    body = request.get_json(silent=True)
+    return body if isinstance(body, dict) else None
+
+
+def leave_dict(leave_request, employee_name=None):
+    item = {
+        'id': leave_request.id,
+        'employee_id': leave_request.employee_id,
+        'leave_type': leave_request.leave_type.value,
+        'status': leave_request.status.value,
+        'start_date': leave_request.start_date.isoformat(),
+        'end_date': leave_request.end_date.isoformat(),
+        'working_days': leave_request.duration,
+        'reason': leave_request.reason,
+        'manager_comments': leave_request.manager_comments,
+        'approved_by': leave_request.approved_by,
+        'approval_date': leave_request.approval_date.isoformat() if leave_request.approval_date else None,
+        'created_at': leave_request.created_at.isoformat() if leave_request.created_at else None,
+        'updated_at': leave_request.updated_at.isoformat() if leave_request.updated_at else None
+    }
+    if employee_name is not None:
+        item['employee_name'] = employee_name
+    return item
+
+
+def item_etag(request_id, updated_at):
+    return f'{request_id}-{updated_at.isoformat() if updated_at else "-"}'
+
+
+def not_modified(etag):
+    """304 response when the client already holds ``etag``, otherwise None"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def with_etag(response, etag):
+    response.set_etag(etag)
+    # Clients may keep the body but must revalidate before reusing it
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def form_for(body, leave_request=None):
+    """LeaveRequestForm fed from a JSON body; a PATCH keeps the fields it leaves out"""
+    values = {}
+    if leave_request is not None:
+        values = {
+            'leave_type': leave_request.leave_type.value,
+            'start_date': leave_request.start_date.isoformat(),
+            'end_date': leave_request.end_date.isoformat(),
+            'reason': leave_request.reason or ''
+        }
+    values.update((field, str(body[field])) for field in ('leave_type', 'start_date', 'end_date', 'reason')
+                  if body.get(field) is not None)
+    return LeaveRequestForm(employee=current_user, original_request=leave_request,
+                            formdata=MultiDict(values), meta={'csrf': False})
+
+
+def visible_requests():
+    """Query of the leave requests the caller may read"""
+    if current_user.is_admin():
+        return LeaveRequest.query
+    if current_user.is_manager():
+        return LeaveRequest.query.filter(in_org(LeaveRequest.employee_id, current_user.id))
+    return LeaveRequest.query.filter(LeaveRequest.employee_id == current_user.id)
+
+
+def can_read(employee_id):
+    return employee_id == current_user.id or can_approve_leave(current_user, employee_id)
+
+
+@api_v1_bp.route('/leave_requests')
+@api_login_required
+def list_leave_requests():
+    """Newest first, keyset paginated: ?status=&employee_id=&cursor=&per_page=
+
+    The ETag covers the row count and latest updated_at of the whole
+    filtered list, so an unchanged list is answered with 304 after one
+    aggregate query and before any row is loaded.
+    """
+    query = visible_requests()
+    status = request.args.get('status')
+    if status:
+        try:
+            query = query.filter(LeaveRequest.status == LeaveStatus(status))
+        except ValueError:
+            return error(400, 'unknown status')
+    employee_id = request.args.get('employee_id', type=int)
+    if employee_id:
+        query = query.filter(LeaveRequest.employee_id == employee_id)
+    per_page = max(1, min(request.args.get('per_page', 20, type=int) or 20, MAX_PER_PAGE))
+
+    count, latest_request, latest_employee = query.join(
+        User, LeaveRequest.employee_id == User.id
+    ).with_entities(
+        func.count(LeaveRequest.id), func.max(LeaveRequest.updated_at), func.max(User.updated_at)
+    ).one()
+    version = ':'.join([str(current_user.id), str(count)] +
+                       [ts.isoformat() if ts else '-' for ts in (latest_request, latest_employee)] +
+                       [f'{key}={value}' for key, value in sorted(request.args.items())])
+    etag = hashlib.sha1(version.encode('utf-8')).hexdigest()
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
+    page = keyset_paginate(query.options(joinedload(LeaveRequest.employee)),
+                           (LeaveRequest.created_at, LeaveRequest.id),
+                           cursor=request.args.get('cursor'), per_page=per_page)
+    return with_etag(compact_json({
+        'items': [leave_dict(leave_request, leave_request.employee.full_name) for leave_request in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor
+    }), etag)
+
+
+@api_v1_bp.route('/leave_requests', methods=['POST'])
+@api_login_required
+def create_leave_request():
+    if not current_user.is_employee():
+        return error(403, 'only employees can apply for leave')
+    body = json_body()
+    if body is None:
+        return error(400, 'expected a JSON object')
+
+    form = form_for(body)
+    if not form.validate():
+        return error(422, 'invalid leave request', fields=form.errors)
+
+    leave_request = leave_actions.apply_leave(current_user, form)
+    payload = leave_dict(leave_request)
+    if form.staffing_warning:
+        payload['warning'] = form.staffing_warning
+    location = url_for('api_v1.get_leave_request', request_id=leave_request.id)
+    return with_etag(compact_json(payload, 201, {'Location': location}),
+                     item_etag(leave_request.id, leave_request.updated_at))
+
+
+@api_v1_bp.route('/leave_requests/<int:request_id>')
+@api_login_required
+def get_leave_request(request_id):
+    # Permission and freshness come from two columns, the row is loaded only on a miss
+    row = db.session.query(LeaveRequest.employee_id, LeaveRequest.updated_at).filter(
+        LeaveRequest.id == request_id).first()
+    if row is None or not can_read(row.employee_id):
+        return error(404, 'leave request not found')
+    etag = item_etag(request_id, row.updated_at)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
+    leave_request = LeaveRequest.query.get(request_id)
+    return with_etag(compact_json(leave_dict(leave_request)), etag)
+
+
+def own_request(request_id):
+    """(leave_request, None) for the caller's own request, else (None, error response).
+    A stale If-Match is refused with 412, so edits never overwrite unseen changes."""
+    leave_request = LeaveRequest.query.get(request_id)
+    if leave_request is None or leave_request.employee_id != current_user.id:
+        return None, error(404, 'leave request not found')
+    if request.if_match and not request.if_match.contains(item_etag(leave_request.id, leave_request.updated_at)):
+        return None, error(412, 'leave request has changed')
+    return leave_request, None
+
+
+@api_v1_bp.route('/leave_requests/<int:request_id>', methods=['PATCH'])
+@api_login_required
+def update_leave_request(request_id):
+    leave_request, failure = own_request(request_id)
+    if failure is not None:
+        return failure
+    if not leave_request.can_be_edited:
+        return error(409, 'this leave request cannot be edited')
+    body = json_body()
+    if body is None:
+        return error(400, 'expected a JSON object')
+
+    form = form_for(body, leave_request)
+    if not form.validate():
+        return error(422, 'invalid leave request', fields=form.errors)
+
+    leave_actions.update_leave(leave_request, form)
+    payload = leave_dict(leave_request)
+    if form.staffing_warning:
+        payload['warning'] = form.staffing_warning
+    return with_etag(compact_json(payload), item_etag(leave_request.id, leave_request.updated_at))
+
+
+@api_v1_bp.route('/leave_requests/<int:request_id>/cancel', methods=['POST'])
+@api_login_required
+def cancel_leave_request(request_id):
+    leave_request, failure = own_request(request_id)
+    if failure is not None:
+        return failure
+    if not leave_request.can_be_cancelled:
+        return error(409, 'this leave request cannot be cancelled')
+
+    leave_actions.cancel_leave(leave_request)
+    return with_etag(compact_json(leave_dict(leave_request)), item_etag(leave_request.id, leave_request.updated_at))
+
+
+@api_v1_bp.route('/leave_requests/review', methods=['POST'])
+@api_login_required
+def review_leave_requests():
+    """Approve or reject pending requests: {"request_ids": [...], "action":
+    "approve" | "reject", "comments": "..."}. Answers with the ids that were
+    reviewed and those skipped as missing, not reviewable or not pending."""
+    if not (current_user.is_manager() or current_user.is_admin()):
+        return error(403, 'only managers and admins can review leave')
+    body = json_body()
+    if body is None:
+        return error(400, 'expected a JSON object')
+    action = body.get('action')
+    if action not in REVIEW_STATUSES:
+        return error(422, 'action must be "approve" or "reject"')
+    try:
+        request_ids = [int(request_id) for request_id in body.get('request_ids') or []]
+    except (TypeError, ValueError):
+        return error(422, 'request_ids must be a list of ids')
+    if not request_ids:
+        return error(422, 'request_ids must be a list of ids')
+    comments = body.get('comments')
+    if comments is not None and (not isinstance(comments, str) or len(comments) > 500):
+        return error(422, 'comments must be text of at most 500 characters')
+
+    reviewed, skipped = review_requests(current_user, request_ids, action, comments)
+    return compact_json({'reviewed': reviewed, 'skipped': skipped})
+
+
+@api_v1_bp.route('/stats')
+@api_login_required
+def stats():
+    """Requests per status (own, the caller's org, or everyone), plus the
+    current year's balances for employees"""
+    if current_user.is_employee():
+        payload = {'counts': leave_status_counts(employee_id=current_user.id)}
+        payload['balances'] = {leave_type.value: values for leave_type, values
+                               in balances.get_balances(current_user.id, date.today().year).items()}
+    elif current_user.is_manager():
+        payload = {'counts': rollups.status_counts(manager_id=current_user.id)}
+    else:
+        payload = {'counts': rollups.status_counts()}
+
+    response = compact_json(payload)
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
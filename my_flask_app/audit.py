@@ -0,0 +1,135 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from app import db
+from app.models import AuditLog
+
+
+class AuditWriter:
+    """Buffers audit log entries in-process and writes them with bulk inserts.
+
+    Entries are flushed by a background thread once AUDIT_BATCH_SIZE entries
+    are queued or AUDIT_FLUSH_INTERVAL seconds have passed, and whatever is
+    left in the buffer is written on shutdown. Actions listed in
+    AUDIT_SYNC_ACTIONS bypass the buffer and are committed before the
+    request continues.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._worker = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('AUDIT_ASYNC', True)
+        app.config.setdefault('AUDIT_BATCH_SIZE', 100)
+        app.config.setdefault('AUDIT_FLUSH_INTERVAL', 2.0)
+        app.config.setdefault('AUDIT_SYNC_ACTIONS', {
+            'login_successful',
+            'login_locked_out',
+            'logout',
+            'user_registered',
+            'user_created',
+            'user_updated',
+            'user_deactivated',
+        })
+        self.app = app
+        app.extensions['audit_writer'] = self
+        atexit.register(self.shutdown)
+
+    def is_sync_action(self, action):
+        return action in self.app.config['AUDIT_SYNC_ACTIONS']
+
+    def record(self, entry, sync=False):
+        """Queue a single audit entry, or write it immediately when sync is set"""
+        if sync or not self.app.config['AUDIT_ASYNC']:
+            db.session.add(AuditLog(**entry))
+            db.session.commit()
+            return
+        self._ensure_worker()
+        self._queue.put(entry)
+
+    def record_many(self, entries, sync=False):
+        """Queue several audit entries, or write them with one bulk insert
+        committed together with the rest of the current session"""
+        if not entries:
+            return
+        if sync or not self.app.config['AUDIT_ASYNC']:
+            db.session.execute(AuditLog.__table__.insert(), entries)
+            db.session.commit()
+            return
+        self._ensure_worker()
+        for entry in entries:
+            self._queue.put(entry)
+
+    def flush(self):
+        """Write every queued entry from the calling thread"""
+        if self._queue is None:
+            return
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write(batch)
+
+    def shutdown(self):
+        self._stop.set()
+        if self._worker is not None and self._pid == os.getpid():
+            self._worker.join(timeout=self.app.config['AUDIT_FLUSH_INTERVAL'] + 5)
+        self.flush()
+
+    def _ensure_worker(self):
+        # Gunicorn forks workers after the app is created, so every process
+        # needs its own queue and writer thread.
+        if self._pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._worker.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._worker = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._write(batch)
+
+    def _collect_batch(self):
+        batch_size = self.app.config['AUDIT_BATCH_SIZE']
+        deadline = time.monotonic() + self.app.config['AUDIT_FLUSH_INTERVAL']
+        batch = []
+        while len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        with self.app.app_context():
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(AuditLog.__table__.insert(), batch)
+            except Exception:
+                self.app.logger.exception('Failed to write %d audit log entries', len(batch))
+
+
+audit_writer = AuditWriter()
@@ -0,0 +1,382 @@
+import gzip
+import json
+import os
+import re
+import shutil
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import event, func, select, text
+from app import db
+from app.models import AuditLog, User
+from app.pagination import after_cursor, cursor_matches, decode_cursor, page_from_rows
+
+PARTITION_NAME = re.compile(r'^audit_logs_p(\d{4})_(\d{2})$')
+ARCHIVE_NAME = re.compile(r'^audit_logs_(\d{4})_(\d{2})\.jsonl\.gz$')
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'audit_logs_p{month:%Y_%m}'
+
+
+def is_partitioned(conn):
+    """True when audit_logs is a native PostgreSQL partitioned table"""
+    if conn.dialect.name != 'postgresql':
+        return False
+    relkind = conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('audit_logs')")).scalar()
+    return relkind == 'p'
+
+
+def partition_months(conn):
+    """Months that have their own partition, oldest first"""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass('audit_logs')"
+    )).scalars()
+    months = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def create_partition(conn, month):
+    """Create and attach the partition for ``month``.
+
+    Rows that already landed in the default partition for that month are
+    moved across first, otherwise PostgreSQL refuses to attach it.
+    """
+    name = partition_name(month)
+    start, end = month.isoformat(), add_months(month, 1).isoformat()
+    conn.execute(text(f'CREATE TABLE {name} (LIKE audit_logs INCLUDING DEFAULTS)'))
+    conn.execute(text(
+        f'WITH moved AS (DELETE FROM audit_logs_default '
+        f'WHERE "timestamp" >= :start AND "timestamp" < :end RETURNING *) '
+        f'INSERT INTO {name} SELECT * FROM moved'
+    ), {'start': start, 'end': end})
+    conn.execute(text(f"ALTER TABLE audit_logs ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+
+
+@event.listens_for(AuditLog.__table__, 'after_create')
+def _partition_new_table(target, conn, **kw):
+    # create_all() can only emit a plain table, because the ORM primary key is
+    # id alone and a partitioned table needs the partition key in it. Swap the
+    # fresh, empty table for a partitioned one with the same columns.
+    if conn.dialect.name != 'postgresql':
+        return
+    conn.execute(text('ALTER TABLE audit_logs RENAME TO audit_logs_unpartitioned'))
+    conn.execute(text('ALTER TABLE audit_logs_unpartitioned RENAME CONSTRAINT audit_logs_pkey '
+                      'TO audit_logs_unpartitioned_pkey'))
+    conn.execute(text('DROP INDEX ix_audit_logs_timestamp'))
+    conn.execute(text('DROP INDEX ix_audit_logs_user_timestamp'))
+    conn.execute(text('CREATE TABLE audit_logs (LIKE audit_logs_unpartitioned INCLUDING DEFAULTS, '
+                      'PRIMARY KEY (id, "timestamp")) PARTITION BY RANGE ("timestamp")'))
+    conn.execute(text('ALTER SEQUENCE audit_logs_id_seq OWNED BY audit_logs.id'))
+    conn.execute(text('DROP TABLE audit_logs_unpartitioned'))
+    conn.execute(text('ALTER TABLE audit_logs ADD FOREIGN KEY (user_id) REFERENCES users (id)'))
+    conn.execute(text('CREATE INDEX ix_audit_logs_timestamp ON audit_logs ("timestamp")'))
+    conn.execute(text('CREATE INDEX ix_audit_logs_user_timestamp ON audit_logs (user_id, "timestamp")'))
+    conn.execute(text('CREATE TABLE audit_logs_default PARTITION OF audit_logs DEFAULT'))
+    current = month_start(datetime.utcnow())
+    ahead = audit_store.app.config['AUDIT_PARTITIONS_AHEAD'] if audit_store.app else 3
+    for offset in range(ahead + 1):
+        create_partition(conn, add_months(current, offset))
+
+
+class ArchivedAuditLog:
+    """An audit entry read back from an archive file.
+
+    Carries the same attributes as AuditLog so the audit log templates can
+    render it, but is never attached to a session.
+    """
+
+    archived = True
+
+    def __init__(self, record):
+        self.id = record['id']
+        self.user_id = record['user_id']
+        self.action = record['action']
+        self.entity_type = record['entity_type']
+        self.entity_id = record['entity_id']
+        self.old_values = record['old_values']
+        self.new_values = record['new_values']
+        self.ip_address = record['ip_address']
+        self.user_agent = record['user_agent']
+        self.timestamp = datetime.fromisoformat(record['timestamp'])
+        self.user = None
+
+
+class AuditStore:
+    """Month-partitioned audit log storage with archival to compressed files.
+
+    On PostgreSQL audit_logs is range partitioned by month on timestamp,
+    with a default partition catching rows outside the prepared months.
+    SQLite has no partitioning, so there the months are ranges of the one
+    table and the timestamp index does the pruning.
+
+    Months older than AUDIT_RETENTION_MONTHS are written to gzipped JSON
+    lines files in AUDIT_ARCHIVE_DIR and then dropped (PostgreSQL) or
+    deleted (SQLite). Archive files older than AUDIT_ARCHIVE_RETENTION_MONTHS
+    are deleted; set it to None to keep them forever. search() reads live
+    and archived months together, opening only the archive files that the
+    requested range and page need.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('AUDIT_ARCHIVE_DIR', os.path.join(app.instance_path, 'audit_archive'))
+        app.config.setdefault('AUDIT_RETENTION_MONTHS', 6)
+        app.config.setdefault('AUDIT_ARCHIVE_RETENTION_MONTHS', 84)
+        app.config.setdefault('AUDIT_PARTITIONS_AHEAD', 3)
+        self.app = app
+        app.extensions['audit_store'] = self
+
+    @property
+    def directory(self):
+        return self.app.config['AUDIT_ARCHIVE_DIR']
+
+    def archive_path(self, month):
+        return os.path.join(self.directory, f'audit_logs_{month:%Y_%m}.jsonl.gz')
+
+    def archived_months(self):
+        """Months with an archive file, oldest first"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        months = []
+        for name in names:
+            match = ARCHIVE_NAME.match(name)
+            if match:
+                months.append(date(int(match.group(1)), int(match.group(2)), 1))
+        return sorted(months)
+
+    def ensure_partitions(self, today=None):
+        """Create partitions for the current month and AUDIT_PARTITIONS_AHEAD
+        months after it. Returns the names of the partitions created."""
+        current = month_start(today or datetime.utcnow())
+        created = []
+        with db.engine.begin() as conn:
+            if not is_partitioned(conn):
+                return created
+            existing = set(partition_months(conn))
+            for offset in range(self.app.config['AUDIT_PARTITIONS_AHEAD'] + 1):
+                month = add_months(current, offset)
+                if month not in existing:
+                    create_partition(conn, month)
+                    created.append(partition_name(month))
+        return created
+
+    def live_months(self):
+        """Months that still have rows or a partition in the database, oldest first"""
+        with db.engine.connect() as conn:
+            months = set(partition_months(conn)) if is_partitioned(conn) else set()
+            oldest = conn.execute(select(func.min(AuditLog.timestamp))).scalar()
+        if oldest is not None:
+            month = month_start(oldest)
+            newest = month_start(datetime.utcnow())
+            while month <= newest:
+                months.add(month)
+                month = add_months(month, 1)
+        return sorted(months)
+
+    def retention_plan(self, today=None):
+        """Return (months to archive, archived months to delete) under the
+        configured retention policy"""
+        current = month_start(today or datetime.utcnow())
+        live_cutoff = add_months(current, 1 - self.app.config['AUDIT_RETENTION_MONTHS'])
+        to_archive = [month for month in self.live_months() if month < live_cutoff]
+
+        to_delete = []
+        keep_months = self.app.config['AUDIT_ARCHIVE_RETENTION_MONTHS']
+        if keep_months is not None:
+            archive_cutoff = add_months(current, -keep_months)
+            # Includes months archived in this same run that are already too old
+            archived = set(self.archived_months()) | set(to_archive)
+            to_delete = sorted(month for month in archived if month < archive_cutoff)
+        return to_archive, to_delete
+
+    def archive_month(self, month):
+        """Move one month of audit entries from the database to its archive
+        file. Returns the number of entries archived."""
+        start = datetime.combine(month, time.min)
+        end = datetime.combine(add_months(month, 1), time.min)
+        table = AuditLog.__table__
+        in_month = (table.c.timestamp >= start) & (table.c.timestamp < end)
+
+        with db.engine.begin() as conn:
+            rows = conn.execution_options(stream_results=True).execute(
+                select(table).where(in_month).order_by(table.c.timestamp, table.c.id))
+            count = self._append_archive(month, rows)
+
+            if is_partitioned(conn):
+                if month in partition_months(conn):
+                    conn.execute(text(f'ALTER TABLE audit_logs DETACH PARTITION {partition_name(month)}'))
+                    conn.execute(text(f'DROP TABLE {partition_name(month)}'))
+                conn.execute(text('DELETE FROM audit_logs_default WHERE "timestamp" >= :start AND "timestamp" < :end'),
+                             {'start': start, 'end': end})
+            else:
+                conn.execute(table.delete().where(in_month))
+        return count
+
+    def delete_archive(self, month):
+        try:
+            os.remove(self.archive_path(month))
+        except FileNotFoundError:
+            pass
+
+    def apply_retention(self, today=None):
+        """Prepare upcoming partitions, archive expired months and delete
+        expired archives. Returns a summary for the CLI."""
+        created = self.ensure_partitions(today)
+        to_archive, to_delete = self.retention_plan(today)
+        archived = {month: self.archive_month(month) for month in to_archive}
+        for month in to_delete:
+            self.delete_archive(month)
+        return {'created': created, 'archived': archived, 'deleted': to_delete}
+
+    def read_archive(self, month):
+        """Yield the entries archived for ``month`` as ArchivedAuditLog objects"""
+        path = self.archive_path(month)
+        if not os.path.exists(path):
+            return
+        seen = set()
+        with gzip.open(path, 'rt', encoding='utf-8') as fh:
+            for line in fh:
+                record = json.loads(line)
+                # A retried archive run can append a month's rows twice
+                if record['id'] in seen:
+                    continue
+                seen.add(record['id'])
+                yield ArchivedAuditLog(record)
+
+    def search(self, start=None, end=None, cursor=None, per_page=20, with_total=False):
+        """Keyset-paginated audit entries between two dates (inclusive),
+        newest first, drawn from both the database and the archive"""
+        columns = (AuditLog.timestamp, AuditLog.id)
+        values, direction = decode_cursor(cursor)
+        if values is not None and not cursor_matches(columns, values):
+            values, direction = None, 'next'
+        descending = direction == 'next'
+        limit = per_page + 1
+
+        lower = datetime.combine(start, time.min) if start else None
+        upper = datetime.combine(end + timedelta(days=1), time.min) if end else None
+
+        query = AuditLog.query
+        if lower is not None:
+            query = query.filter(AuditLog.timestamp >= lower)
+        if upper is not None:
+            query = query.filter(AuditLog.timestamp < upper)
+        total = None
+        if with_total:
+            total = query.order_by(None).count() + sum(
+                1 for _ in self._archived_entries(lower, upper, None, True, None))
+
+        if values is not None:
+            # The plain bound on timestamp is what lets PostgreSQL prune
+            # partitions; the row comparison does the exact seek.
+            bound = AuditLog.timestamp <= values[0] if descending else AuditLog.timestamp >= values[0]
+            query = query.filter(bound, after_cursor(columns, values, descending))
+        order = [c.desc() if descending else c.asc() for c in columns]
+        live = query.order_by(*order).limit(limit).all()
+
+        # A full page of live rows means archived rows only matter if they
+        # sort before the last of them
+        stop = live[-1] if len(live) == limit else None
+        archived = []
+        for entry in self._archived_entries(lower, upper, values, descending, stop):
+            archived.append(entry)
+            if len(archived) == limit:
+                break
+
+        def key(entry):
+            return [entry.timestamp, entry.id]
+
+        rows = sorted(live + archived, key=key, reverse=descending)[:limit]
+        self._attach_users([row for row in rows if isinstance(row, ArchivedAuditLog)])
+        return page_from_rows(rows, key, values, direction, per_page, total=total)
+
+    def _archived_entries(self, lower, upper, values, descending, stop):
+        """Archived entries within [lower, upper) that sort after the cursor
+        ``values`` and before ``stop``, in seek order. Months are read one at a
+        time, so iteration can end before later archive files are opened."""
+        months = self.archived_months()
+        if lower is not None:
+            months = [m for m in months if add_months(m, 1) > lower.date()]
+        if upper is not None:
+            months = [m for m in months if datetime.combine(m, time.min) < upper]
+        if values is not None:
+            edge = month_start(values[0])
+            months = [m for m in months if (m <= edge if descending else m >= edge)]
+        if stop is not None:
+            edge = month_start(stop.timestamp)
+            months = [m for m in months if (m >= edge if descending else m <= edge)]
+        if descending:
+            months.reverse()
+
+        cursor_key = (values[0], values[1]) if values is not None else None
+        stop_key = (stop.timestamp, stop.id) if stop is not None else None
+        for month in months:
+            entries = []
+            for entry in self.read_archive(month):
+                if lower is not None and entry.timestamp < lower:
+                    continue
+                if upper is not None and entry.timestamp >= upper:
+                    continue
+                entry_key = (entry.timestamp, entry.id)
+                if cursor_key is not None and not (entry_key < cursor_key if descending else entry_key > cursor_key):
+                    continue
+                if stop_key is not None and not (entry_key > stop_key if descending else entry_key < stop_key):
+                    continue
+                entries.append(entry)
+            entries.sort(key=lambda e: (e.timestamp, e.id), reverse=descending)
+            yield from entries
+
+    def _append_archive(self, month, rows):
+        """Write rows as a new gzip member and append it to the month's
+        archive file, so a partial write never corrupts earlier members"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.archive_path(month)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        count = 0
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as fh:
+            for row in rows:
+                record = dict(row._mapping)
+                record['timestamp'] = record['timestamp'].isoformat()
+                fh.write(json.dumps(record, separators=(',', ':')) + '\n')
+                count += 1
+
+        if not count:
+            os.remove(tmp_path)
+        elif os.path.exists(path):
+            with open(path, 'ab') as dst, open(tmp_path, 'rb') as src:
+                shutil.copyfileobj(src, dst)
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+        return count
+
+    def _attach_users(self, entries):
+        user_ids = {entry.user_id for entry in entries if entry.user_id is not None}
+        if not user_ids:
+            return
+        users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))}
+        for entry in entries:
+            entry.user = users.get(entry.user_id)
+
+
+audit_store = AuditStore()
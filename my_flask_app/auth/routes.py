@@ -1,11 +1,15 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, make_response, current_app
 from flask_login import login_user, logout_user, login_required
 from app import db
 from app.models import User, UserRole
 from app.forms import LoginForm, RegistrationForm
 from app.decorators import log_activity
+from app.rate_limit import login_rate_limiter
+from app.caching import user_directory
+from app import hierarchy
 from flask_login import current_user
 from werkzeug.urls import url_parse
+import math
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -16,8 +20,21 @@ def login():
     
     form = LoginForm()
     if form.validate_on_submit():
+        ip = request.remote_addr
+        retry_after = login_rate_limiter.retry_after(ip, form.username.data)
+        if retry_after:
+            flash(f'Too many failed login attempts. Try again in {math.ceil(retry_after)} seconds.', 'danger')
+            response = make_response(render_template('auth/login.html', title='Sign In', form=form), 429)
+            response.headers['Retry-After'] = str(math.ceil(retry_after))
+            return response
+        
         user = User.query.filter_by(username=form.username.data).first()
         if user and user.check_password(form.password.data) and user.is_active:
+            login_rate_limiter.record_success(form.username.data)
+            if user.password_needs_rehash():
+                # Upgrade hashes made with an older method or cost
+                user.set_password(form.password.data)
+                db.session.commit()
             login_user(user, remember=form.remember_me.data)
             log_activity('login_successful')
             next_page = request.args.get('next')
@@ -25,6 +42,13 @@ def login():
                 next_page = url_for('main.dashboard')
             return redirect(next_page)
         else:
+            locked = login_rate_limiter.record_failure(ip, form.username.data)
+            if locked:
+                current_app.logger.warning('Login lockout (%s) for username %r from %s',
+                                           ', '.join(locked), form.username.data, ip)
+                if user is not None:
+                    log_activity('login_locked_out', 'user', user.id, user_id=user.id,
+                                 new_values={'scopes': locked, 'ip_address': ip})
             flash('Invalid username or password', 'danger')
     
     return render_template('auth/login.html', title='Sign In', form=form)
@@ -57,7 +81,10 @@ def register():
             user.manager_id = form.manager_id.data
             
         db.session.add(user)
+        db.session.flush()
+        hierarchy.add_users([user.id])
         db.session.commit()
+        user_directory.invalidate()
         
         log_activity('user_registered', 'user', user.id, 
                     new_values={'username': user.username, 'role': user.role.value})
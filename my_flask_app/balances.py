@@ -0,0 +1,182 @@
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import LeaveBalance, LeaveRequest, LeaveStatus, LeaveType
+from app.working_days import working_calendar
+from datetime import date
+
+# Yearly allowance per leave type, in days. None means no limit is enforced.
+# Override with the LEAVE_ENTITLEMENTS config key.
+DEFAULT_ENTITLEMENTS = {
+    LeaveType.SICK.value: 12,
+    LeaveType.VACATION.value: 20,
+    LeaveType.PERSONAL.value: 5,
+    LeaveType.MATERNITY.value: 180,
+    LeaveType.PATERNITY.value: 15,
+    LeaveType.EMERGENCY.value: None,
+}
+
+
+def entitlement(leave_type):
+    entitlements = current_app.config.get('LEAVE_ENTITLEMENTS', DEFAULT_ENTITLEMENTS)
+    return entitlements.get(leave_type.value)
+
+
+def leave_days(start_date, end_date):
+    """Number of leave days charged for a date range: its working days"""
+    return working_calendar.count(start_date, end_date)
+
+
+def snapshot(leave_request):
+    """Capture the fields of a request that affect balances, before changing it"""
+    return (leave_request.leave_type, leave_request.status,
+            leave_request.start_date, leave_request.end_date)
+
+
+def _contributions(leave_type, status, start_date, end_date):
+    """Split a request into {(leave_type, year): (pending_days, used_days)}"""
+    if status not in (LeaveStatus.PENDING, LeaveStatus.APPROVED):
+        return {}
+
+    contributions = {}
+    for year in range(start_date.year, end_date.year + 1):
+        days = leave_days(max(start_date, date(year, 1, 1)), min(end_date, date(year, 12, 31)))
+        if status == LeaveStatus.PENDING:
+            contributions[(leave_type, year)] = (days, 0)
+        else:
+            contributions[(leave_type, year)] = (0, days)
+    return contributions
+
+
+def record_change(leave_request, before=None):
+    """Apply the balance delta between ``before`` and the request's current state.
+
+    ``before`` is the value of snapshot() taken before the change, or None for
+    a new request. The ledger rows are updated in the caller's session, so
+    they are committed together with the request itself.
+    """
+    record_changes([(leave_request, before)])
+
+
+def record_changes(changes):
+    """record_change() for a batch of (leave_request, before) pairs.
+
+    Deltas are summed per employee, leave type and year first, so each
+    ledger row is updated once however many of its requests changed. The
+    requests' stored working_days are refreshed here too, as every change
+    to their dates passes through this function.
+    """
+    deltas = {}
+    for leave_request, before in changes:
+        leave_request.working_days = leave_days(leave_request.start_date, leave_request.end_date)
+        if before is not None:
+            for (leave_type, year), (pending, used) in _contributions(*before).items():
+                key = (leave_request.employee_id, leave_type, year)
+                old_pending, old_used = deltas.get(key, (0, 0))
+                deltas[key] = (old_pending - pending, old_used - used)
+        for (leave_type, year), (pending, used) in _contributions(*snapshot(leave_request)).items():
+            key = (leave_request.employee_id, leave_type, year)
+            old_pending, old_used = deltas.get(key, (0, 0))
+            deltas[key] = (old_pending + pending, old_used + used)
+
+    for (employee_id, leave_type, year), (pending, used) in deltas.items():
+        if pending or used:
+            _apply_delta(employee_id, leave_type, year, pending, used)
+
+
+def _apply_delta(employee_id, leave_type, year, pending, used):
+    """Update-then-insert one ledger row. The insert runs in a savepoint so a
+    concurrent first write for the same row only costs a retry."""
+    def update():
+        return LeaveBalance.query.filter_by(
+            employee_id=employee_id, leave_type=leave_type, year=year
+        ).update({
+            LeaveBalance.days_pending: LeaveBalance.days_pending + pending,
+            LeaveBalance.days_used: LeaveBalance.days_used + used
+        }, synchronize_session=False)
+
+    if update():
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(LeaveBalance(employee_id=employee_id, leave_type=leave_type, year=year,
+                                        days_pending=pending, days_used=used))
+    except IntegrityError:
+        update()
+
+
+def get_balances(employee_id, year):
+    """Return {LeaveType: {'entitlement', 'pending', 'used', 'remaining'}} for one year"""
+    rows = {row.leave_type: row for row in LeaveBalance.query.filter_by(employee_id=employee_id, year=year)}
+
+    balances = {}
+    for leave_type in LeaveType:
+        row = rows.get(leave_type)
+        pending = row.days_pending if row else 0
+        used = row.days_used if row else 0
+        allowance = entitlement(leave_type)
+        balances[leave_type] = {
+            'entitlement': allowance,
+            'pending': pending,
+            'used': used,
+            'remaining': None if allowance is None else allowance - pending - used
+        }
+    return balances
+
+
+def check_allowance(employee_id, leave_type, start_date, end_date, original=None):
+    """Return [(year, requested, remaining)] for each year the request would overdraw.
+
+    ``original`` is the snapshot() of a request being edited, whose current
+    days are given back before checking the new range.
+    """
+    allowance = entitlement(leave_type)
+    if allowance is None:
+        return []
+
+    requested = _contributions(leave_type, LeaveStatus.PENDING, start_date, end_date)
+    refunds = _contributions(*original) if original is not None else {}
+    years = [year for _, year in requested]
+
+    rows = {row.year: row for row in LeaveBalance.query.filter(
+        LeaveBalance.employee_id == employee_id,
+        LeaveBalance.leave_type == leave_type,
+        LeaveBalance.year.in_(years)
+    )}
+
+    overdrawn = []
+    for key, (days, _) in requested.items():
+        year = key[1]
+        row = rows.get(year)
+        booked = (row.days_pending + row.days_used) if row else 0
+        booked -= sum(refunds.get(key, (0, 0)))
+        remaining = allowance - booked
+        if days > remaining:
+            overdrawn.append((year, days, max(remaining, 0)))
+    return overdrawn
+
+
+def rebuild_balances():
+    """Recompute the whole ledger from leave_requests. Returns the number of rows written."""
+    totals = {}
+    query = LeaveRequest.query.filter(
+        LeaveRequest.status.in_([LeaveStatus.PENDING, LeaveStatus.APPROVED])
+    ).with_entities(
+        LeaveRequest.employee_id, LeaveRequest.leave_type, LeaveRequest.status,
+        LeaveRequest.start_date, LeaveRequest.end_date
+    )
+    for employee_id, leave_type, status, start_date, end_date in query.yield_per(1000):
+        for (lt, year), (pending, used) in _contributions(leave_type, status, start_date, end_date).items():
+            old_pending, old_used = totals.get((employee_id, lt, year), (0, 0))
+            totals[(employee_id, lt, year)] = (old_pending + pending, old_used + used)
+
+    LeaveBalance.query.delete(synchronize_session=False)
+    rows = [
+        {'employee_id': employee_id, 'leave_type': leave_type, 'year': year,
+         'days_pending': pending, 'days_used': used}
+        for (employee_id, leave_type, year), (pending, used) in totals.items()
+    ]
+    if rows:
+        db.session.bulk_insert_mappings(LeaveBalance, rows)
+    db.session.commit()
+    return len(rows)
@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from app import db
+from app.models import User
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+
+class SharedGeneration:
+    """Invalidation counter shared by every process on the host.
+
+    The generation is the mtime of a marker file in the instance folder, so
+    checking it costs one stat() call and bumping it is seen by all gunicorn
+    workers on their next check.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def current(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def bump(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        previous = self.current()
+        with open(self.path, 'a'):
+            pass
+        now = max(time.time_ns(), previous + 1)
+        os.utime(self.path, ns=(now, now))
+
+
+def detached_copy(instance):
+    """Copy an instance's column values into a detached object that can be
+    attached to any session with ``session.merge(obj, load=False)``"""
+    mapper = inspect(type(instance))
+    copy = mapper.class_manager.new_instance()
+    for attr in mapper.column_attrs:
+        setattr(copy, attr.key, getattr(instance, attr.key))
+    make_transient_to_detached(copy)
+    return copy
+
+
+class IdentityCache:
+    """Per-process cache of the User rows loaded by Flask-Login.
+
+    Entries expire after IDENTITY_CACHE_TTL seconds. invalidate() drops a
+    user locally and bumps a shared generation so every other worker
+    discards its cache on its next request. Cached users are merged into
+    the request's session without a query, so relationships still work.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._generation = None
+        self._seen_generation = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('IDENTITY_CACHE_TTL', 300)
+        app.config.setdefault('IDENTITY_CACHE_SIZE', 10000)
+        self.app = app
+        self._generation = SharedGeneration(os.path.join(app.instance_path, 'cache', 'identity.gen'))
+        app.extensions['identity_cache'] = self
+
+    def load(self, user_id):
+        self._check_generation()
+
+        entry = self._entries.get(user_id)
+        if entry is not None and entry[0] > time.monotonic():
+            return db.session.merge(entry[1], load=False)
+
+        user = User.query.get(user_id)
+        if user is not None:
+            self._store(user)
+        return user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+        self._generation.bump()
+
+    def _check_generation(self):
+        generation = self._generation.current()
+        if generation != self._seen_generation:
+            with self._lock:
+                self._entries.clear()
+                self._seen_generation = generation
+
+    def _store(self, user):
+        expires = time.monotonic() + self.app.config['IDENTITY_CACHE_TTL']
+        copy = detached_copy(user)
+        with self._lock:
+            if len(self._entries) >= self.app.config['IDENTITY_CACHE_SIZE']:
+                # Dicts keep insertion order, so this drops the oldest entry
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[user.id] = (expires, copy)
+
+
+identity_cache = IdentityCache()
+
+
+DirectoryEntry = namedtuple('DirectoryEntry', 'id full_name role is_active')
+
+
+class UserDirectory:
+    """Per-process list of every user as (id, full_name, role, is_active)
+    tuples, for filling select fields without loading User rows.
+
+    The list is read with one column query, sorted by name, and kept until
+    invalidate() is called after users are created, edited or deactivated
+    (a shared generation tells the other workers) or USER_DIRECTORY_TTL
+    seconds have passed.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._cached = None
+        self._lock = threading.Lock()
+        self._generation = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('USER_DIRECTORY_TTL', 300)
+        self.app = app
+        self._generation = SharedGeneration(os.path.join(app.instance_path, 'cache', 'directory.gen'))
+        app.extensions['user_directory'] = self
+
+    def entries(self):
+        return self._load()[0]
+
+    def get(self, user_id):
+        return self._load()[1].get(user_id)
+
+    def choices(self, role, active_only=False, blank=None):
+        """[(id, full_name)] of users with ``role``, preceded by (0, blank) when given"""
+        choices = [(0, blank)] if blank is not None else []
+        choices.extend((entry.id, entry.full_name) for entry in self.entries()
+                       if entry.role == role and (entry.is_active or not active_only))
+        return choices
+
+    def invalidate(self):
+        with self._lock:
+            self._cached = None
+        self._generation.bump()
+
+    def _load(self):
+        generation = self._generation.current()
+        cached = self._cached
+        if cached is not None and cached[0] == generation and cached[1] > time.monotonic():
+            return cached[2]
+
+        rows = db.session.query(User.id, User.first_name, User.last_name, User.role, User.is_active)
+        entries = sorted((DirectoryEntry(user_id, f'{first_name} {last_name}', role, bool(is_active))
+                          for user_id, first_name, last_name, role, is_active in rows),
+                         key=lambda entry: (entry.full_name.lower(), entry.id))
+        loaded = (entries, {entry.id: entry for entry in entries})
+        expires = time.monotonic() + self.app.config['USER_DIRECTORY_TTL']
+        with self._lock:
+            self._cached = (generation, expires, loaded)
+        return loaded
+
+
+user_directory = UserDirectory()
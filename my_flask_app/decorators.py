@@ -1,26 +1,63 @@
 from flask import request, session
-from app import db
-from app.models import AuditLog
+from app.audit import audit_writer
+from datetime import datetime
 from functools import wraps
 from flask_login import current_user
 from flask import request, session, redirect, url_for
 
 
-def log_activity(action, entity_type=None, entity_id=None, old_values=None, new_values=None):
-    """Log user activity for audit purposes"""
-    if current_user.is_authenticated:
-        audit_log = AuditLog(
-            user_id=current_user.id,
-            action=action,
-            entity_type=entity_type or 'system',
-            entity_id=entity_id,
-            old_values=old_values,
-            new_values=new_values,
-            ip_address=request.environ.get('HTTP_X_REAL_IP', request.remote_addr),
-            user_agent=request.user_agent.string
-        )
-        db.session.add(audit_log)
-        db.session.commit()
+def log_activity(action, entity_type=None, entity_id=None, old_values=None, new_values=None, sync=None,
+                 user_id=None):
+    """Log user activity for audit purposes.
+
+    Entries are buffered and bulk-written in the background unless ``sync``
+    is set or the action is listed in AUDIT_SYNC_ACTIONS. ``user_id``
+    attributes the entry to a user who is not logged in, e.g. one whose
+    account is being attacked.
+    """
+    if user_id is None and current_user.is_authenticated:
+        user_id = current_user.id
+    if user_id is not None:
+        entry = {
+            'user_id': user_id,
+            'action': action,
+            'entity_type': entity_type or 'system',
+            'entity_id': entity_id,
+            'old_values': old_values,
+            'new_values': new_values,
+            'ip_address': request.remote_addr,
+            'user_agent': request.user_agent.string,
+            'timestamp': datetime.utcnow()
+        }
+        if sync is None:
+            sync = audit_writer.is_sync_action(action)
+        audit_writer.record(entry, sync=sync)
+
+def log_activities(activities, sync=None):
+    """Log several activities with one bulk insert.
+
+    ``activities`` is a list of dicts holding log_activity() keyword
+    arguments. With ``sync`` the entries are committed in the same
+    transaction as any pending changes in the session.
+    """
+    if not current_user.is_authenticated or not activities:
+        return
+    common = {
+        'user_id': current_user.id,
+        'ip_address': request.remote_addr,
+        'user_agent': request.user_agent.string,
+        'timestamp': datetime.utcnow()
+    }
+    entries = [dict(common,
+                    action=activity['action'],
+                    entity_type=activity.get('entity_type') or 'system',
+                    entity_id=activity.get('entity_id'),
+                    old_values=activity.get('old_values'),
+                    new_values=activity.get('new_values'))
+               for activity in activities]
+    if sync is None:
+        sync = any(audit_writer.is_sync_action(entry['action']) for entry in entries)
+    audit_writer.record_many(entries, sync=sync)
 
 def admin_required(f):
     """Decorator to require admin role"""
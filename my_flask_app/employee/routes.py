@@ -1,11 +1,14 @@
 # ELMS/my_flask_app/employee/routes.py
 from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_required, current_user
-from app import db
-from app.models import LeaveRequest, LeaveStatus, LeaveType
+from app.models import LeaveRequest, LeaveStatus
 from app.forms import LeaveRequestForm
 from app.decorators import log_activity
-from datetime import datetime
+from app.stats import leave_status_counts
+from app import balances
+from app import leave_actions
+from app.pagination import keyset_paginate
+from datetime import date
 
 employee_bp = Blueprint('employee', __name__)
 
@@ -16,16 +19,19 @@ def dashboard():
         return redirect(url_for('main.unauthorized'))
     
     # Get employee's leave statistics
-    total_requests = current_user.leave_requests.count()
-    pending_requests = current_user.leave_requests.filter_by(status=LeaveStatus.PENDING).count()
-    approved_requests = current_user.leave_requests.filter_by(status=LeaveStatus.APPROVED).count()
-    rejected_requests = current_user.leave_requests.filter_by(status=LeaveStatus.REJECTED).count()
+    stats = leave_status_counts(employee_id=current_user.id)
+    total_requests = stats['total']
+    pending_requests = stats[LeaveStatus.PENDING.value]
+    approved_requests = stats[LeaveStatus.APPROVED.value]
+    rejected_requests = stats[LeaveStatus.REJECTED.value]
     
     # Recent leave requests
     recent_requests = current_user.leave_requests.order_by(
         LeaveRequest.created_at.desc()
     ).limit(5).all()
     
+    leave_balances = balances.get_balances(current_user.id, date.today().year)
+    
     log_activity('employee_dashboard_viewed')
     
     return render_template('employee/dashboard.html',
@@ -33,7 +39,8 @@ def dashboard():
                          pending_requests=pending_requests,
                          approved_requests=approved_requests,
                          rejected_requests=rejected_requests,
-                         recent_requests=recent_requests)
+                         recent_requests=recent_requests,
+                         leave_balances=leave_balances)
 
 @employee_bp.route('/apply_leave', methods=['GET', 'POST'])
 @login_required
@@ -41,30 +48,14 @@ def apply_leave():
     if not current_user.is_employee():
         return redirect(url_for('main.unauthorized'))
     
-    form = LeaveRequestForm()
+    form = LeaveRequestForm(employee=current_user)
     
     if form.validate_on_submit():
-        leave_request = LeaveRequest(
-            employee_id=current_user.id,
-            leave_type=LeaveType(form.leave_type.data),
-            start_date=form.start_date.data,
-            end_date=form.end_date.data,
-            reason=form.reason.data,
-            status=LeaveStatus.PENDING
-        )
-        
-        db.session.add(leave_request)
-        db.session.commit()
-        
-        log_activity('leave_request_created', 'leave_request', leave_request.id,
-                    new_values={
-                        'leave_type': form.leave_type.data,
-                        'start_date': form.start_date.data.isoformat(),
-                        'end_date': form.end_date.data.isoformat(),
-                        'duration': leave_request.duration
-                    })
+        leave_actions.apply_leave(current_user, form)
         
         flash('Leave request submitted successfully', 'success')
+        if form.staffing_warning:
+            flash(form.staffing_warning, 'warning')
         return redirect(url_for('employee.my_leaves'))
     
     return render_template('employee/apply_leave.html', form=form)
@@ -75,20 +66,16 @@ def my_leaves():
     if not current_user.is_employee():
         return redirect(url_for('main.unauthorized'))
     
-    page = request.args.get('page', 1, type=int)
-    per_page = 10
-    
     # Filter options
     status_filter = request.args.get('status', '')
     
-    query = current_user.leave_requests.order_by(LeaveRequest.created_at.desc())
+    query = current_user.leave_requests
     
     if status_filter:
         query = query.filter_by(status=LeaveStatus[status_filter.upper()])
 
-    leave_requests = query.paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    leave_requests = keyset_paginate(query, (LeaveRequest.created_at, LeaveRequest.id),
+                                     cursor=request.args.get('cursor'), per_page=10)
     
     log_activity('my_leaves_viewed')
     
@@ -114,35 +101,14 @@ def edit_leave(request_id):
         flash('This leave request cannot be edited', 'warning')
         return redirect(url_for('employee.my_leaves'))
     
-    form = LeaveRequestForm(obj=leave_request)
+    form = LeaveRequestForm(employee=current_user, original_request=leave_request, obj=leave_request)
     
     if form.validate_on_submit():
-        old_values = {
-            'leave_type': leave_request.leave_type.value,
-            'start_date': leave_request.start_date.isoformat(),
-            'end_date': leave_request.end_date.isoformat(),
-            'reason': leave_request.reason
-        }
-        
-        leave_request.leave_type = LeaveType(form.leave_type.data)
-        leave_request.start_date = form.start_date.data
-        leave_request.end_date = form.end_date.data
-        leave_request.reason = form.reason.data
-        leave_request.updated_at = datetime.utcnow()
-        
-        db.session.commit()
-        
-        new_values = {
-            'leave_type': leave_request.leave_type.value,
-            'start_date': leave_request.start_date.isoformat(),
-            'end_date': leave_request.end_date.isoformat(),
-            'reason': leave_request.reason
-        }
-        
-        log_activity('leave_request_updated', 'leave_request', leave_request.id,
-                    old_values, new_values)
+        leave_actions.update_leave(leave_request, form)
         
         flash('Leave request updated successfully', 'success')
+        if form.staffing_warning:
+            flash(form.staffing_warning, 'warning')
         return redirect(url_for('employee.my_leaves'))
     
     return render_template('employee/edit_leave.html', form=form, leave_request=leave_request)
@@ -165,15 +131,7 @@ def cancel_leave(request_id):
         flash('This leave request cannot be cancelled', 'warning')
         return redirect(url_for('employee.my_leaves'))
     
-    old_status = leave_request.status.value
-    leave_request.status = LeaveStatus.CANCELLED
-    leave_request.updated_at = datetime.utcnow()
-    
-    db.session.commit()
-    
-    log_activity('leave_request_cancelled', 'leave_request', leave_request.id,
-                old_values={'status': old_status},
-                new_values={'status': 'cancelled'})
+    leave_actions.cancel_leave(leave_request)
     
     flash('Leave request cancelled successfully', 'success')
     return redirect(url_for('employee.my_leaves'))
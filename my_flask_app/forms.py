@@ -1,9 +1,15 @@
+from flask import current_app
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, TextAreaField, SelectField, DateField, PasswordField, BooleanField, IntegerField,SubmitField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError, Optional
 from wtforms.widgets import TextArea
 from datetime import date, datetime
 from app.models import User, UserRole, LeaveType
+from app.caching import user_directory
+from app import balances
+from app import staffing
+from app import hierarchy
 
 class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
@@ -24,8 +30,7 @@ class RegistrationForm(FlaskForm):
     def __init__(self, *args, **kwargs):
         super(RegistrationForm, self).__init__(*args, **kwargs)
         # Populate manager choices
-        managers = User.query.filter_by(role=UserRole.MANAGER).all()
-        self.manager_id.choices = [(0, 'Select Manager')] + [(m.id, m.full_name) for m in managers]
+        self.manager_id.choices = user_directory.choices(UserRole.MANAGER, blank='Select Manager')
 
     def validate_username(self, username):
         user = User.query.filter_by(username=username.data).first()
@@ -47,6 +52,43 @@ class LeaveRequestForm(FlaskForm):
     end_date = DateField('End Date', validators=[DataRequired()])
     reason = TextAreaField('Reason', validators=[Length(max=500)])
 
+    def __init__(self, employee=None, original_request=None, *args, **kwargs):
+        super(LeaveRequestForm, self).__init__(*args, **kwargs)
+        self.employee = employee
+        self.original_request = original_request
+        # Set by validate() when STAFFING_CHECK only warns
+        self.staffing_warning = None
+
+    def validate(self, extra_validators=None):
+        if not super(LeaveRequestForm, self).validate(extra_validators):
+            return False
+        if self.employee is None:
+            return True
+
+        if balances.leave_days(self.start_date.data, self.end_date.data) == 0:
+            self.end_date.errors.append('The selected dates contain no working days.')
+            return False
+
+        # Check the yearly allowance against the balance ledger
+        leave_type = LeaveType(self.leave_type.data)
+        original = balances.snapshot(self.original_request) if self.original_request else None
+        overdrawn = balances.check_allowance(self.employee.id, leave_type,
+                                             self.start_date.data, self.end_date.data, original)
+        for year, requested, remaining in overdrawn:
+            self.leave_type.errors.append(
+                f'Not enough {leave_type.value} leave left for {year}: '
+                f'{requested} days requested, {remaining} remaining.')
+        if overdrawn:
+            return False
+
+        conflicts = staffing.check_staffing(self.employee, self.start_date.data, self.end_date.data)
+        if conflicts:
+            if current_app.config.get('STAFFING_CHECK', 'warn') == 'block':
+                self.start_date.errors.append(staffing.describe(conflicts))
+                return False
+            self.staffing_warning = staffing.describe(conflicts)
+        return True
+
     def validate_start_date(self, start_date):
         if start_date.data < date.today():
             raise ValidationError('Start date cannot be in the past.')
@@ -72,8 +114,7 @@ class UserEditForm(FlaskForm):
         super(UserEditForm, self).__init__(*args, **kwargs)
         self.original_user = original_user
         # Populate manager choices
-        managers = User.query.filter_by(role=UserRole.MANAGER).all()
-        self.manager_id.choices = [(0, 'No Manager')] + [(m.id, m.full_name) for m in managers]
+        self.manager_id.choices = user_directory.choices(UserRole.MANAGER, blank='No Manager')
 
     def validate_username(self, username):
         if self.original_user and username.data != self.original_user.username:
@@ -81,6 +122,11 @@ class UserEditForm(FlaskForm):
             if user is not None:
                 raise ValidationError('Please use a different username.')
 
+    def validate_manager_id(self, manager_id):
+        if self.original_user and manager_id.data and (
+                manager_id.data == self.original_user.id or hierarchy.is_below(self.original_user.id, manager_id.data)):
+            raise ValidationError('A user cannot report to themselves or to someone in their own org.')
+
     def validate_email(self, email):
         if self.original_user and email.data != self.original_user.email:
             user = User.query.filter_by(email=email.data).first()
@@ -104,12 +150,8 @@ class ReportForm(FlaskForm):
     def __init__(self, *args, **kwargs):
         super(ReportForm, self).__init__(*args, **kwargs)
         
-        managers = User.query.filter_by(role=UserRole.MANAGER).all()
-        self.team_manager.choices = [(0, 'All Teams')] + [(m.id, m.full_name) for m in managers]
-        
-        # Populate employee choices
-        employees = User.query.filter_by(role=UserRole.EMPLOYEE).all()
-        self.employee.choices = [(0, 'All Employees')] + [(e.id, e.full_name) for e in employees]
+        self.team_manager.choices = user_directory.choices(UserRole.MANAGER, blank='All Teams')
+        self.employee.choices = user_directory.choices(UserRole.EMPLOYEE, blank='All Employees')
 
 
 class CreateUserForm(FlaskForm):
@@ -129,8 +171,7 @@ class CreateUserForm(FlaskForm):
     def __init__(self, *args, **kwargs):
         super(CreateUserForm, self).__init__(*args, **kwargs)
         # Populate manager choices with active managers
-        managers = User.query.filter_by(role=UserRole.MANAGER, is_active=True).all()
-        self.manager_id.choices = [(0, 'No Manager')] + [(m.id, m.full_name) for m in managers]
+        self.manager_id.choices = user_directory.choices(UserRole.MANAGER, active_only=True, blank='No Manager')
 
     def validate_username(self, username):
         user = User.query.filter_by(username=username.data).first()
@@ -141,3 +182,9 @@ class CreateUserForm(FlaskForm):
         user = User.query.filter_by(email=email.data).first()
         if user:
             raise ValidationError('This email address is already registered. Please choose a different one.')
+
+class UserImportForm(FlaskForm):
+    file = FileField('CSV or Excel file', validators=[
+        FileRequired(), FileAllowed(['csv', 'xlsx'], 'Upload a .csv or .xlsx file.')
+    ])
+    submit = SubmitField('Import Users')
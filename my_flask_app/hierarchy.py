@@ -0,0 +1,123 @@
+from collections import defaultdict
+from sqlalchemy import select, true
+from sqlalchemy.orm import aliased
+from app import db
+from app.models import User, UserHierarchy
+
+# Bound parameters per IN list, within SQLite's limit
+BATCH_SIZE = 900
+
+
+def org_ids(manager_id, include_self=False):
+    """SELECT of the ids of everyone below ``manager_id`` at any depth,
+    served by the user_hierarchy primary key"""
+    query = select(UserHierarchy.descendant_id).where(UserHierarchy.ancestor_id == manager_id)
+    if not include_self:
+        query = query.where(UserHierarchy.depth > 0)
+    return query
+
+
+def in_org(column, manager_id, include_self=False):
+    """Filter keeping rows whose user id ``column`` is in the manager's org"""
+    return column.in_(org_ids(manager_id, include_self))
+
+
+def org_id_set(manager_id, include_self=False):
+    return {user_id for user_id, in db.session.execute(org_ids(manager_id, include_self))}
+
+
+def ancestor_id_set(user_ids):
+    """Ids of ``user_ids`` and of everyone above them at any depth"""
+    user_ids = list(set(user_ids))
+    ancestors = set(user_ids)
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        ancestors.update(ancestor_id for ancestor_id, in db.session.query(UserHierarchy.ancestor_id).filter(
+            UserHierarchy.descendant_id.in_(user_ids[start:start + BATCH_SIZE])))
+    return ancestors
+
+
+def is_below(manager_id, user_id):
+    """True when ``user_id`` reports to ``manager_id``, directly or not"""
+    return db.session.query(UserHierarchy.query.filter(
+        UserHierarchy.ancestor_id == manager_id,
+        UserHierarchy.descendant_id == user_id,
+        UserHierarchy.depth > 0
+    ).exists()).scalar()
+
+
+def add_users(user_ids):
+    """Insert the hierarchy rows of newly created users.
+
+    Their managers may be existing users or other users of the same batch,
+    as in a bulk import. Rows are flushed, not committed.
+    """
+    user_ids = list(set(user_ids))
+    managers = {}
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        managers.update(db.session.query(User.id, User.manager_id)
+                        .filter(User.id.in_(user_ids[start:start + BATCH_SIZE])))
+
+    # Ancestors of the managers that were already in the table
+    outside = list({manager_id for manager_id in managers.values()
+                    if manager_id is not None and manager_id not in managers})
+    known = defaultdict(list)
+    for start in range(0, len(outside), BATCH_SIZE):
+        for descendant_id, ancestor_id, depth in db.session.query(
+                UserHierarchy.descendant_id, UserHierarchy.ancestor_id, UserHierarchy.depth
+        ).filter(UserHierarchy.descendant_id.in_(outside[start:start + BATCH_SIZE])):
+            known[descendant_id].append((ancestor_id, depth))
+
+    chains = {}
+    for user_id in user_ids:
+        # Walk up through the batch until reaching a user whose chain is known
+        path, current = [], user_id
+        while current in managers and current not in chains:
+            if current in path:
+                raise ValueError(f'circular manager chain through user {current}')
+            path.append(current)
+            current = managers[current]
+        tail = chains[current] if current in chains else known.get(current, [])
+        for member in reversed(path):
+            tail = [(member, 0)] + [(ancestor_id, depth + 1) for ancestor_id, depth in tail]
+            chains[member] = tail
+
+    rows = [{'ancestor_id': ancestor_id, 'descendant_id': user_id, 'depth': depth}
+            for user_id in user_ids for ancestor_id, depth in chains[user_id]]
+    for start in range(0, len(rows), 10000):
+        db.session.bulk_insert_mappings(UserHierarchy, rows[start:start + 10000])
+    return len(rows)
+
+
+def move_user(user_id, manager_id):
+    """Re-attach ``user_id`` and everyone below them under ``manager_id``
+    (None detaches them). Only the rows linking the moved subtree to its
+    old and new ancestors change. Flushed, not committed.
+    """
+    if manager_id is not None and (manager_id == user_id or is_below(user_id, manager_id)):
+        raise ValueError('a user cannot report to themselves or to someone in their own org')
+
+    subtree = org_ids(user_id, include_self=True)
+    UserHierarchy.query.filter(
+        UserHierarchy.descendant_id.in_(subtree),
+        ~UserHierarchy.ancestor_id.in_(subtree)
+    ).delete(synchronize_session=False)
+
+    if manager_id is not None:
+        above, below = aliased(UserHierarchy), aliased(UserHierarchy)
+        links = select(
+            above.ancestor_id, below.descendant_id, above.depth + below.depth + 1
+        ).select_from(above).join(below, true()).where(
+            above.descendant_id == manager_id,
+            below.ancestor_id == user_id
+        )
+        db.session.execute(UserHierarchy.__table__.insert().from_select(
+            ['ancestor_id', 'descendant_id', 'depth'], links))
+    db.session.flush()
+
+
+def rebuild_hierarchy():
+    """Recreate the whole table from users.manager_id and return its row count"""
+    UserHierarchy.query.delete(synchronize_session=False)
+    count = add_users([user_id for user_id, in db.session.query(User.id)])
+    db.session.commit()
+    return count
@@ -0,0 +1,84 @@
+from app import db
+from app.models import LeaveRequest, LeaveStatus, LeaveType
+from app.decorators import log_activity
+from app import balances
+from app import rollups
+from app.team_calendar import team_calendar
+from datetime import datetime
+
+
+def apply_leave(employee, form):
+    """Create a pending request from a validated LeaveRequestForm, with its
+    balance change and audit entry, and return it"""
+    leave_request = LeaveRequest(
+        employee_id=employee.id,
+        leave_type=LeaveType(form.leave_type.data),
+        start_date=form.start_date.data,
+        end_date=form.end_date.data,
+        reason=form.reason.data,
+        status=LeaveStatus.PENDING
+    )
+
+    db.session.add(leave_request)
+    balances.record_change(leave_request)
+    rollups.record_changes([leave_request])
+    db.session.commit()
+    team_calendar.invalidate_teams([employee.manager_id])
+
+    log_activity('leave_request_created', 'leave_request', leave_request.id,
+                new_values={
+                    'leave_type': form.leave_type.data,
+                    'start_date': form.start_date.data.isoformat(),
+                    'end_date': form.end_date.data.isoformat(),
+                    'duration': leave_request.duration
+                })
+    return leave_request
+
+
+def update_leave(leave_request, form):
+    """Apply a validated LeaveRequestForm to an editable request"""
+    old_values = {
+        'leave_type': leave_request.leave_type.value,
+        'start_date': leave_request.start_date.isoformat(),
+        'end_date': leave_request.end_date.isoformat(),
+        'reason': leave_request.reason
+    }
+    before = balances.snapshot(leave_request)
+
+    leave_request.leave_type = LeaveType(form.leave_type.data)
+    leave_request.start_date = form.start_date.data
+    leave_request.end_date = form.end_date.data
+    leave_request.reason = form.reason.data
+    leave_request.updated_at = datetime.utcnow()
+
+    balances.record_change(leave_request, before)
+    rollups.record_changes([leave_request])
+    db.session.commit()
+    team_calendar.invalidate_teams([leave_request.employee.manager_id])
+
+    new_values = {
+        'leave_type': leave_request.leave_type.value,
+        'start_date': leave_request.start_date.isoformat(),
+        'end_date': leave_request.end_date.isoformat(),
+        'reason': leave_request.reason
+    }
+
+    log_activity('leave_request_updated', 'leave_request', leave_request.id,
+                old_values, new_values)
+
+
+def cancel_leave(leave_request):
+    """Cancel a pending or approved request that has not started yet"""
+    old_status = leave_request.status.value
+    before = balances.snapshot(leave_request)
+    leave_request.status = LeaveStatus.CANCELLED
+    leave_request.updated_at = datetime.utcnow()
+
+    balances.record_change(leave_request, before)
+    rollups.record_changes([leave_request])
+    db.session.commit()
+    team_calendar.invalidate_teams([leave_request.employee.manager_id])
+
+    log_activity('leave_request_cancelled', 'leave_request', leave_request.id,
+                old_values={'status': old_status},
+                new_values={'status': 'cancelled'})
@@ -1,11 +1,20 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 from app import db
 from app.models import User, LeaveRequest, LeaveStatus, UserRole
 from app.forms import ApprovalForm, ReportForm
 from app.decorators import manager_or_admin_required, log_activity
-from datetime import datetime
+from app import balances
+from app import rollups
+from app.pagination import keyset_paginate
+from app.reviews import review_requests
+from app.team_calendar import team_calendar, absence_dict
+from app.caching import user_directory
+from app.hierarchy import in_org
+from app.permissions import approvable_employee_ids
+from datetime import datetime, date, timedelta
 from sqlalchemy import and_
+from sqlalchemy.orm import joinedload
 
 manager_bp = Blueprint('manager', __name__)
 
@@ -15,31 +24,20 @@ manager_bp = Blueprint('manager', __name__)
 def dashboard():
     # Get manager's team statistics
     if current_user.is_manager():
-        team_members = current_user.employees
-        pending_requests = LeaveRequest.query.join(User,LeaveRequest.employee_id == User.id).filter(
-            User.manager_id == current_user.id,
-            LeaveRequest.status == LeaveStatus.PENDING
-        ).count()
-        
-        approved_requests = LeaveRequest.query.join(User, LeaveRequest.employee_id == User.id).filter(
-            User.manager_id == current_user.id,
-            LeaveRequest.status == LeaveStatus.APPROVED
-        ).count()
-        
-        total_requests = LeaveRequest.query.join(User, LeaveRequest.employee_id == User.id).filter(
-            User.manager_id == current_user.id
-        ).count()
-        
+        team_members = current_user.get_subordinates()
+        stats = rollups.status_counts(manager_id=current_user.id)
     else:  # Admin has access to all data
         team_members = User.query.filter_by(role=UserRole.EMPLOYEE).all()
-        pending_requests = LeaveRequest.query.filter_by(status=LeaveStatus.PENDING).count()
-        approved_requests = LeaveRequest.query.filter_by(status=LeaveStatus.APPROVED).count()
-        total_requests = LeaveRequest.query.count()
+        stats = rollups.status_counts()
+    
+    pending_requests = stats[LeaveStatus.PENDING.value]
+    approved_requests = stats[LeaveStatus.APPROVED.value]
+    total_requests = stats['total']
     
     # Recent requests for review
     if current_user.is_manager():
-        recent_requests = LeaveRequest.query.join(User, LeaveRequest.employee_id == User.id).filter(
-            User.manager_id == current_user.id,
+        recent_requests = LeaveRequest.query.filter(
+            in_org(LeaveRequest.employee_id, current_user.id),
             LeaveRequest.status == LeaveStatus.PENDING
         ).order_by(LeaveRequest.created_at.desc()).limit(5).all()
     else:
@@ -62,26 +60,18 @@ def dashboard():
 def leave_requests():
     # Handle POST request for Accept/Reject actions
     if request.method == 'POST':
-        req_id = request.form.get('request_id')
-        action = request.form.get('action')
-        leave_request = LeaveRequest.query.get(req_id)
-        if leave_request:
-            if action == 'accept':
-                leave_request.status = LeaveStatus.APPROVED
-            elif action == 'reject':
-                leave_request.status = LeaveStatus.REJECTED
-            db.session.commit()      
+        req_id = request.form.get('request_id', type=int)
+        action = {'accept': 'approve', 'reject': 'reject'}.get(request.form.get('action'))
+        if req_id and action:
+            review_requests(current_user, [req_id], action)
         return redirect(url_for('manager.leave_requests'))
     
-    page = request.args.get('page', 1, type=int)
-    per_page = 10
-    
     # Filter options
     status_filter = request.args.get('status', '')
     employee_filter = request.args.get('employee', '', type=int)
     
     if current_user.is_manager():
-        query = LeaveRequest.query.join(User, LeaveRequest.employee_id == User.id).filter(User.manager_id == current_user.id)
+        query = LeaveRequest.query.filter(in_org(LeaveRequest.employee_id, current_user.id))
     else:  # Admin can see all requests
         query = LeaveRequest.query
     
@@ -96,32 +86,73 @@ def leave_requests():
     if employee_filter:
         query = query.filter(LeaveRequest.employee_id == employee_filter)
     
-    # Order by creation date
-    query = query.order_by(LeaveRequest.created_at.desc())
+    # Newest first, seeking on (created_at, id) rather than OFFSET
+    requests = keyset_paginate(query, (LeaveRequest.created_at, LeaveRequest.id),
+                               cursor=request.args.get('cursor'), per_page=10,
+                               with_total=request.args.get('count') == '1')
     
-    requests = query.paginate(page=page, per_page=per_page, error_out=False)
+    # Employees on this page whose pending requests get review controls
+    approvable = approvable_employee_ids(current_user, {req.employee_id for req in requests.items})
     
-    # Get employees for filter dropdown
-    if current_user.is_manager():
-        employees = current_user.employees
-    else:
-        employees = User.query.filter_by(role=UserRole.EMPLOYEE).all()
+    # Name shown in the employee filter's search box
+    selected = user_directory.get(employee_filter) if employee_filter else None
+    employee_name = selected.full_name if selected else ''
     
     log_activity('leave_requests_viewed')
     
     return render_template('manager/leave_requests.html',
                          requests=requests,
-                         employees=employees,
+                         form=ApprovalForm(),
+                         approvable=approvable,
+                         employee_name=employee_name,
                          status_filter=status_filter,
                          employee_filter=employee_filter)
 
+@manager_bp.route('/leave_requests/bulk_review', methods=['POST'])
+@login_required
+@manager_or_admin_required
+def bulk_review():
+    """Approve or reject several requests at once.
+
+    Takes ``request_ids`` plus the ApprovalForm fields, as form data from
+    the leave requests page or as a JSON body, and answers JSON requests
+    with the ids that were reviewed and skipped.
+    """
+    form = ApprovalForm()
+    if request.is_json:
+        request_ids = (request.get_json(silent=True) or {}).get('request_ids') or []
+    else:
+        request_ids = request.form.getlist('request_ids')
+    try:
+        request_ids = [int(request_id) for request_id in request_ids]
+    except (TypeError, ValueError):
+        request_ids = []
+    
+    if not form.validate_on_submit() or not request_ids:
+        if request.is_json:
+            return jsonify({'error': 'Select at least one request and a valid action', 'errors': form.errors}), 400
+        flash('Select at least one request and a valid action', 'warning')
+        return redirect(url_for('manager.leave_requests'))
+    
+    reviewed, skipped = review_requests(current_user, request_ids, form.action.data, form.comments.data)
+    
+    if request.is_json:
+        return jsonify({'reviewed': reviewed, 'skipped': skipped})
+    if reviewed:
+        flash(f'{len(reviewed)} leave request(s) {form.action.data}d successfully', 'success')
+    if skipped:
+        flash(f'{len(skipped)} request(s) were skipped because they are no longer pending '
+              f'or you cannot review them', 'warning')
+    return redirect(url_for('manager.leave_requests'))
+
 @manager_bp.route('/review_request/<int:request_id>', methods=['GET', 'POST'])
 @login_required
 @manager_or_admin_required
 def review_request(request_id):
-    leave_request = LeaveRequest.query.get_or_404(request_id)
+    # The employee is needed by the page and lets the permission check skip its query for direct reports
+    leave_request = LeaveRequest.query.options(joinedload(LeaveRequest.employee)).get_or_404(request_id)
     
-    if not current_user.can_approve_leave(leave_request.employee_id):
+    if not current_user.can_approve_leave(leave_request):
         flash('You do not have permission to review this request', 'danger')
         return redirect(url_for('manager.leave_requests'))
     
@@ -137,6 +168,7 @@ def review_request(request_id):
 
         if action in ['approve', 'reject']:
             old_status = leave_request.status.value
+            before = balances.snapshot(leave_request)
             
             if action == 'approve':
                 leave_request.status = LeaveStatus.APPROVED
@@ -148,7 +180,10 @@ def review_request(request_id):
             leave_request.manager_comments = form.comments.data
             leave_request.updated_at = datetime.utcnow()
             
+            balances.record_change(leave_request, before)
+            rollups.record_changes([leave_request])
             db.session.commit()
+            team_calendar.invalidate_teams([leave_request.employee.manager_id])
             
             log_activity(f'leave_request_{action}d', 'leave_request', leave_request.id,
                         old_values={'status': old_status},
@@ -185,7 +220,10 @@ def team_reports():
     
     log_activity('team_reports_viewed')
     
-    return render_template('manager/team_reports.html', form=form)
+    today = date.today()
+    summary = rollups.month_summary(today.year, today.month,
+                                    manager_id=current_user.id if current_user.is_manager() else None)
+    return render_template('manager/team_reports.html', form=form, summary=summary, summary_month=today)
 
 def generate_manager_monthly_report(month, year, format_type):
     from app.admin.routes import generate_monthly_report
@@ -205,9 +243,80 @@ def generate_manager_team_report(format_type):
 @manager_or_admin_required
 def team_members():
     if current_user.is_manager():
-        members = current_user.employees
+        members = current_user.get_subordinates()
     else:  
         members = User.query.filter_by(role=UserRole.EMPLOYEE).all()
     
     log_activity('team_members_viewed')
     return render_template('manager/team_members.html', members=members)
+
+def calendar_scope():
+    """Manager whose org the calendar shows, None for admins (everyone)"""
+    return current_user.id if current_user.is_manager() else None
+
+@manager_bp.route('/team_calendar')
+@login_required
+@manager_or_admin_required
+def calendar():
+    view = request.args.get('view', 'month')
+    if view not in ['month', 'week']:
+        view = 'month'
+    try:
+        anchor = datetime.strptime(request.args.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        anchor = date.today()
+    
+    if view == 'week':
+        start = anchor - timedelta(days=anchor.weekday())
+        end = start + timedelta(days=6)
+        prev_date, next_date = start - timedelta(days=7), start + timedelta(days=7)
+    else:
+        month_start = anchor.replace(day=1)
+        month_end = (month_start + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+        # Whole weeks, Monday to Sunday, covering the month
+        start = month_start - timedelta(days=month_start.weekday())
+        end = month_end + timedelta(days=6 - month_end.weekday())
+        prev_date, next_date = (month_start - timedelta(days=1)).replace(day=1), month_end + timedelta(days=1)
+    
+    absences = team_calendar.absences(calendar_scope(), start, end, org=True)
+    by_day = {}
+    for absence in absences:
+        day = max(absence.start_date, start)
+        while day <= min(absence.end_date, end):
+            by_day.setdefault(day, []).append(absence)
+            day += timedelta(days=1)
+    
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    weeks = [days[index:index + 7] for index in range(0, len(days), 7)]
+    
+    log_activity('team_calendar_viewed')
+    
+    return render_template('manager/team_calendar.html',
+                         view=view,
+                         anchor=anchor,
+                         weeks=weeks,
+                         by_day=by_day,
+                         absences=absences,
+                         today=date.today(),
+                         prev_date=prev_date,
+                         next_date=next_date)
+
+@manager_bp.route('/team_calendar/absences')
+@login_required
+@manager_or_admin_required
+def calendar_absences():
+    """JSON list of approved and pending absences overlapping ?start=&end= (YYYY-MM-DD)"""
+    try:
+        start = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+        end = datetime.strptime(request.args.get('end', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'start and end must be dates in YYYY-MM-DD format'}), 400
+    if end < start or (end - start).days > 366:
+        return jsonify({'error': 'end must be on or after start and at most 366 days later'}), 400
+    
+    absences = team_calendar.absences(calendar_scope(), start, end, org=True)
+    return jsonify({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'absences': [absence_dict(absence) for absence in absences]
+    })
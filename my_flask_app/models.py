@@ -1,6 +1,6 @@
 from app import db
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from app.passwords import password_hasher
 from datetime import datetime, date
 from enum import Enum
 
@@ -23,6 +23,12 @@ class LeaveType(Enum):
     PATERNITY = 'paternity'
     EMERGENCY = 'emergency'
 
+class ReportJobStatus(Enum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     
@@ -38,7 +44,7 @@ class User(UserMixin, db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Manager relationship
-    manager_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    manager_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
     manager = db.relationship('User', remote_side=[id], backref='employees')
     
     # Leave requests
@@ -46,10 +52,17 @@ class User(UserMixin, db.Model):
     approved_requests = db.relationship('LeaveRequest', foreign_keys='LeaveRequest.approved_by', backref='approver', lazy='dynamic')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
+        if self.id is not None:
+            # Drop cached login identities holding the old hash
+            from app.caching import identity_cache
+            identity_cache.invalidate(self.id)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self.password_hash)
     
     @property
     def full_name(self):
@@ -64,26 +77,64 @@ class User(UserMixin, db.Model):
     def is_employee(self):
         return self.role == UserRole.EMPLOYEE
     
-    def can_approve_leave(self, employee_id):
+    def can_approve_leave(self, employee):
+        """``employee`` is an employee id, a User or a LeaveRequest, see permissions"""
+        from app.permissions import can_approve_leave
+        return can_approve_leave(self, employee)
+    
+    def reviewable_leave_requests(self, request_ids):
+        """Query for the requests among ``request_ids`` this user may approve,
+        so permission for a whole batch is checked in one query"""
+        query = LeaveRequest.query.filter(LeaveRequest.id.in_(request_ids))
         if self.is_admin():
-            return True
+            return query
         if self.is_manager():
-            employee = User.query.get(employee_id)
-            return employee and employee.manager_id == self.id
-        return False
+            from app.hierarchy import in_org
+            return query.filter(in_org(LeaveRequest.employee_id, self.id))
+        return query.filter(db.false())
     
     def get_subordinates(self):
         if self.is_admin():
             return User.query.filter_by(role=UserRole.EMPLOYEE).all()
         elif self.is_manager():
-            return self.employees
+            # Everyone below this manager, at any depth
+            from app.hierarchy import in_org
+            return User.query.filter(in_org(User.id, self.id)).all()
         return []
     
     def __repr__(self):
         return f'<User {self.username}>'
 
+class UserHierarchy(db.Model):
+    """Closure table of the manager tree, see hierarchy: one row for every
+    (ancestor, descendant) pair, including each user with itself at depth 0"""
+    __tablename__ = 'user_hierarchy'
+    __table_args__ = (
+        # Ancestors of a user, nearest first
+        db.Index('ix_user_hierarchy_descendant_depth', 'descendant_id', 'depth'),
+    )
+    
+    ancestor_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    descendant_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    depth = db.Column(db.Integer, nullable=False)
+    
+    def __repr__(self):
+        return f'<UserHierarchy {self.ancestor_id} -> {self.descendant_id} ({self.depth})>'
+
 class LeaveRequest(db.Model):
     __tablename__ = 'leave_requests'
+    __table_args__ = (
+        # Manager/employee listings: filter by employee (and status), newest first
+        db.Index('ix_leave_requests_employee_status_created', 'employee_id', 'status', 'created_at'),
+        db.Index('ix_leave_requests_employee_created', 'employee_id', 'created_at'),
+        # Admin listings and dashboards: filter by status, newest first
+        db.Index('ix_leave_requests_status_created', 'status', 'created_at'),
+        # Monthly reports range-scan the start date
+        db.Index('ix_leave_requests_start_date', 'start_date'),
+        # Team calendar overlap queries: end_date >= :start AND start_date <= :end
+        db.Index('ix_leave_requests_end_start', 'end_date', 'start_date'),
+        db.Index('ix_leave_requests_employee_end', 'employee_id', 'end_date', 'start_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -95,12 +146,18 @@ class LeaveRequest(db.Model):
     approved_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     approval_date = db.Column(db.DateTime, nullable=True)
     manager_comments = db.Column(db.Text)
+    # Kept in step with the dates by balances.record_changes(), see working_days
+    working_days = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     @property
     def duration(self):
-        return (self.end_date - self.start_date).days + 1
+        """Working days taken, excluding weekends and holidays"""
+        if self.working_days is not None:
+            return self.working_days
+        from app.working_days import working_calendar
+        return working_calendar.count(self.start_date, self.end_date)
     
     @property
     def is_pending(self):
@@ -125,8 +182,107 @@ class LeaveRequest(db.Model):
     def __repr__(self):
         return f'<LeaveRequest {self.id} - {self.employee.username}>'
 
+class Holiday(db.Model):
+    __tablename__ = 'holidays'
+    __table_args__ = (
+        db.UniqueConstraint('calendar', 'date', name='uq_holidays_calendar_date'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    calendar = db.Column(db.String(50), nullable=False, default='default')
+    date = db.Column(db.Date, nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    
+    def __repr__(self):
+        return f'<Holiday {self.calendar} {self.date}>'
+
+class LeaveBalance(db.Model):
+    __tablename__ = 'leave_balances'
+    __table_args__ = (
+        db.UniqueConstraint('employee_id', 'leave_type', 'year', name='uq_leave_balances_employee_type_year'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    employee_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    leave_type = db.Column(db.Enum(LeaveType), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    days_pending = db.Column(db.Integer, nullable=False, default=0)
+    days_used = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    employee = db.relationship('User', backref=db.backref('leave_balances', lazy='dynamic'))
+    
+    def __repr__(self):
+        return f'<LeaveBalance {self.employee_id} {self.leave_type.value} {self.year}>'
+
+class LeaveRollup(db.Model):
+    """Leave requests and working days per month, team, type and status, see rollups"""
+    __tablename__ = 'leave_rollups'
+    
+    month = db.Column(db.Date, primary_key=True)
+    # 0 for employees without a manager
+    manager_id = db.Column(db.Integer, primary_key=True, index=True)
+    leave_type = db.Column(db.Enum(LeaveType), primary_key=True)
+    status = db.Column(db.Enum(LeaveStatus), primary_key=True)
+    requests = db.Column(db.Integer, nullable=False, default=0)
+    days = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<LeaveRollup {self.month} {self.manager_id} {self.leave_type.value} {self.status.value}>'
+
+class LeaveRollupEntry(db.Model):
+    """What each leave request currently contributes to leave_rollups"""
+    __tablename__ = 'leave_rollup_entries'
+    
+    request_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    manager_id = db.Column(db.Integer, nullable=False)
+    leave_type = db.Column(db.Enum(LeaveType), nullable=False)
+    status = db.Column(db.Enum(LeaveStatus), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+
+class RollupState(db.Model):
+    __tablename__ = 'rollup_state'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    # Rows updated before this were included in the last refresh
+    watermark = db.Column(db.DateTime, nullable=True)
+
+class ReportJob(db.Model):
+    __tablename__ = 'report_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_key = db.Column(db.String(64), nullable=False, index=True)
+    report_type = db.Column(db.String(20), nullable=False)
+    params = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.Enum(ReportJobStatus), nullable=False, default=ReportJobStatus.QUEUED)
+    filename = db.Column(db.String(255), nullable=True)
+    artifact_path = db.Column(db.String(500), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    requested_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    requester = db.relationship('User')
+    
+    @property
+    def is_done(self):
+        return self.status == ReportJobStatus.DONE
+    
+    @property
+    def is_finished(self):
+        return self.status in [ReportJobStatus.DONE, ReportJobStatus.FAILED]
+    
+    def __repr__(self):
+        return f'<ReportJob {self.id} - {self.report_type} {self.status.value}>'
+
 class AuditLog(db.Model):
     __tablename__ = 'audit_logs'
+    __table_args__ = (
+        db.Index('ix_audit_logs_timestamp', 'timestamp'),
+        db.Index('ix_audit_logs_user_timestamp', 'user_id', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -137,7 +293,8 @@ class AuditLog(db.Model):
     new_values = db.Column(db.JSON, nullable=True)
     ip_address = db.Column(db.String(45), nullable=True)
     user_agent = db.Column(db.String(255), nullable=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # Partition key on PostgreSQL, see audit_store
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
     user = db.relationship('User', backref='audit_logs')
     
@@ -0,0 +1,142 @@
+import base64
+import binascii
+import json
+from datetime import datetime, date
+from sqlalchemy import and_, or_
+
+
+class KeysetPage:
+    """One page of results from keyset_paginate()"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None, per_page=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+    return value
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({'k': [_encode_value(v) for v in values], 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Return (values, direction) for a cursor token, or (None, 'next') if it is missing or malformed"""
+    if not token:
+        return None, 'next'
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values = [_decode_value(v) for v in payload['k']]
+        direction = payload['d'] if payload['d'] in ('next', 'prev') else 'next'
+        return values, direction
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        return None, 'next'
+
+
+def cursor_matches(columns, values):
+    """Whether decoded cursor ``values`` fit ``columns``: one value per column,
+    each of the column's Python type. A crafted cursor must not reach the
+    database with values it cannot compare."""
+    if values is None or len(values) != len(columns):
+        return False
+    for column, value in zip(columns, values):
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            continue
+        if not isinstance(value, python_type) or (isinstance(value, bool) and python_type is not bool):
+            return False
+    return True
+
+
+def after_cursor(columns, values, descending):
+    """Row-value comparison (c1, c2, ...) > (v1, v2, ...) spelled out portably"""
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        beyond = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal, beyond))
+    return or_(*clauses)
+
+
+def keyset_paginate(query, columns, cursor=None, per_page=10, descending=True, with_total=False):
+    """Paginate ``query`` by seeking on ``columns`` instead of using OFFSET.
+
+    ``columns`` must end with a unique column (normally the primary key) so
+    the order is total, e.g. (AuditLog.timestamp, AuditLog.id). ``cursor``
+    is an opaque token from a previous page's next_cursor/prev_cursor; a
+    malformed one gives the first page.
+    The total row count is only computed when ``with_total`` is set, since
+    that COUNT(*) is what made deep offset pages slow.
+    """
+    values, direction = decode_cursor(cursor)
+    if values is not None and not cursor_matches(columns, values):
+        values, direction = None, 'next'
+
+    total = query.order_by(None).count() if with_total else None
+
+    # Walking backwards means seeking the other way and flipping the results
+    forward = direction == 'next'
+    seek_descending = descending if forward else not descending
+    if values is not None:
+        query = query.filter(after_cursor(columns, values, seek_descending))
+    order = [c.desc() if seek_descending else c.asc() for c in columns]
+    rows = query.order_by(None).order_by(*order).limit(per_page + 1).all()
+
+    return page_from_rows(rows, lambda item: [getattr(item, column.key) for column in columns],
+                          values, direction, per_page, total=total)
+
+
+def page_from_rows(rows, key, values, direction, per_page, total=None):
+    """Build a KeysetPage from up to ``per_page + 1`` rows fetched in seek order.
+
+    ``values`` and ``direction`` come from decode_cursor(), and ``key(row)``
+    returns the row's sort key. This is the second half of keyset_paginate(),
+    split out for row sources that are not a single query.
+    """
+    forward = direction == 'next'
+    has_more = len(rows) > per_page
+    items = list(rows[:per_page])
+    if not forward:
+        items.reverse()
+
+    if forward:
+        has_next, has_prev = has_more, values is not None
+    else:
+        has_next, has_prev = values is not None, has_more
+
+    next_cursor = prev_cursor = None
+    if items:
+        if has_next:
+            next_cursor = encode_cursor(key(items[-1]), 'next')
+        if has_prev:
+            prev_cursor = encode_cursor(key(items[0]), 'prev')
+
+    return KeysetPage(items, next_cursor=next_cursor, prev_cursor=prev_cursor, total=total, per_page=per_page)
@@ -0,0 +1,95 @@
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordHasher:
+    """Hashes and checks passwords in a bounded process pool.
+
+    Hashing is deliberately slow, so doing it on the request thread stalls
+    the worker. The pool runs it in PASSWORD_HASH_PROCESSES separate
+    processes (0 hashes inline) while the request thread waits on the
+    result without holding the GIL. PASSWORD_HASH_METHOD takes any werkzeug
+    method string, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000";
+    needs_rehash() tells whether a stored hash uses other parameters.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._current_params = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+        app.config.setdefault('PASSWORD_HASH_SALT_LENGTH', 16)
+        app.config.setdefault('PASSWORD_HASH_PROCESSES', min(4, os.cpu_count() or 1))
+        self.app = app
+        self._current_params = None
+        app.extensions['password_hasher'] = self
+        atexit.register(self.shutdown)
+
+    def hash(self, password):
+        return self._call(generate_password_hash, password, *self._hash_args())
+
+    def hash_many(self, passwords):
+        """Hash a batch of passwords, spread over the whole pool"""
+        passwords = list(passwords)
+        pool = self._executor()
+        args = self._hash_args()
+        if pool is None or len(passwords) < 2:
+            return [generate_password_hash(password, *args) for password in passwords]
+        workers = self.app.config['PASSWORD_HASH_PROCESSES']
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(pool.map(generate_password_hash, passwords,
+                             *[[arg] * len(passwords) for arg in args], chunksize=chunksize))
+
+    def verify(self, password_hash, password):
+        return self._call(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with a method or cost other than the configured one"""
+        return password_hash.split('$', 1)[0] != self._params()
+
+    def shutdown(self):
+        if self._pid != os.getpid():
+            return
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+    def _hash_args(self):
+        if self.app is None:
+            return ()
+        return self.app.config['PASSWORD_HASH_METHOD'], self.app.config['PASSWORD_HASH_SALT_LENGTH']
+
+    def _params(self):
+        # Werkzeug fills in default costs, so hash once to learn the exact
+        # prefix it writes for the configured method
+        if self._current_params is None:
+            self._current_params = generate_password_hash('', *self._hash_args()).split('$', 1)[0]
+        return self._current_params
+
+    def _call(self, fn, *args):
+        pool = self._executor()
+        if pool is None:
+            return fn(*args)
+        return pool.submit(fn, *args).result()
+
+    def _executor(self):
+        if self.app is None or not self.app.config['PASSWORD_HASH_PROCESSES']:
+            return None
+        # Pools do not survive a fork, so each gunicorn worker builds its own.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(max_workers=self.app.config['PASSWORD_HASH_PROCESSES'])
+                    self._pid = os.getpid()
+        return self._pool
+
+
+password_hasher = PasswordHasher()
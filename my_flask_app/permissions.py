@@ -0,0 +1,58 @@
+from flask import g, has_app_context
+from app.models import User, LeaveRequest
+from app.hierarchy import org_id_set
+
+
+def visible_employee_ids(user):
+    """Ids of everyone ``user`` manages at any depth, None for admins (everyone).
+
+    Read with one query and kept on ``g`` for the rest of the request, so
+    any number of permission checks in a request cost at most that query.
+    """
+    if user.is_admin():
+        return None
+    if not user.is_manager():
+        return set()
+    if not has_app_context():
+        return org_id_set(user.id)
+    cache = g.setdefault('visible_employee_ids', {})
+    if user.id not in cache:
+        cache[user.id] = org_id_set(user.id)
+    return cache[user.id]
+
+
+def approvable_employee_ids(user, employee_ids):
+    """The ids among ``employee_ids`` whose leave ``user`` may review"""
+    employee_ids = set(employee_ids)
+    visible = visible_employee_ids(user)
+    return employee_ids if visible is None else employee_ids & visible
+
+
+def _loaded_employee(target):
+    """The employee User behind ``target`` if it is already in memory"""
+    if isinstance(target, User):
+        return target
+    if isinstance(target, LeaveRequest):
+        # Only use the relationship when loading it would not cost a query
+        return target.__dict__.get('employee')
+    return None
+
+
+def can_approve_leave(user, target):
+    """Whether ``user`` may review leave of ``target``: an employee id, a
+    User or a LeaveRequest. A loaded direct report is answered without a
+    query, everything else from visible_employee_ids()."""
+    if user.is_admin():
+        return True
+    if not user.is_manager():
+        return False
+    employee = _loaded_employee(target)
+    if employee is not None and employee.manager_id == user.id:
+        return True
+    if isinstance(target, LeaveRequest):
+        employee_id = target.employee_id
+    elif isinstance(target, User):
+        employee_id = target.id
+    else:
+        employee_id = target
+    return employee_id in visible_employee_ids(user)
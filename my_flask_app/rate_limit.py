@@ -0,0 +1,146 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class MemoryBuckets:
+    """Token bucket state for the current process only"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill_seconds, cost, now):
+        """Refill ``key``, remove ``cost`` tokens if that many are left and
+        return the tokens remaining before the removal"""
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) / refill_seconds)
+            if cost and tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+            elif key in self._buckets:
+                self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.pop(next(iter(self._buckets)))
+            return tokens
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+
+class SQLiteBuckets:
+    """Token bucket state in a SQLite file, shared by every worker on the host"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def take(self, key, capacity, refill_seconds, cost, now):
+        conn = self._connection()
+        with conn:
+            # Take the write lock up front so concurrent workers serialise
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row is not None else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated) / refill_seconds)
+            if cost and tokens >= cost:
+                conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                             (key, tokens - cost, now))
+            return tokens
+
+    def reset(self, key):
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM buckets WHERE key = ?', (key,))
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS buckets '
+                         '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+
+class LoginRateLimiter:
+    """Per-IP and per-username token buckets for failed logins.
+
+    Every failed login takes a token from the client IP's bucket and from
+    the username's bucket. Buckets hold LOGIN_IP_BURST and
+    LOGIN_USERNAME_BURST tokens and regain one every LOGIN_*_REFILL_SECONDS.
+    retry_after() only reads the buckets, so over-limit attempts are turned
+    away before the user is loaded or a password is hashed. State lives in
+    process memory, or in a SQLite file under the instance folder when
+    LOGIN_RATE_LIMIT_STORAGE is "sqlite" so all workers share one limit.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._storage = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOGIN_RATE_LIMIT_ENABLED', True)
+        app.config.setdefault('LOGIN_RATE_LIMIT_STORAGE', 'memory')
+        app.config.setdefault('LOGIN_RATE_LIMIT_PATH', os.path.join(app.instance_path, 'cache', 'login_limits.sqlite3'))
+        app.config.setdefault('LOGIN_IP_BURST', 20)
+        app.config.setdefault('LOGIN_IP_REFILL_SECONDS', 3)
+        app.config.setdefault('LOGIN_USERNAME_BURST', 5)
+        app.config.setdefault('LOGIN_USERNAME_REFILL_SECONDS', 60)
+        self.app = app
+        if app.config['LOGIN_RATE_LIMIT_STORAGE'] == 'sqlite':
+            self._storage = SQLiteBuckets(app.config['LOGIN_RATE_LIMIT_PATH'])
+        else:
+            self._storage = MemoryBuckets()
+        app.extensions['login_rate_limiter'] = self
+
+    def retry_after(self, ip, username):
+        """Seconds until a login for ``username`` from ``ip`` is allowed, 0 if it is now"""
+        if not self.app.config['LOGIN_RATE_LIMIT_ENABLED']:
+            return 0
+        now = time.time()
+        wait = 0
+        for key, capacity, refill in self._buckets(ip, username):
+            tokens = self._storage.take(key, capacity, refill, 0, now)
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) * refill)
+        return wait
+
+    def record_failure(self, ip, username):
+        """Charge a failed login and return the scopes ('ip', 'username')
+        this attempt has just locked out"""
+        if not self.app.config['LOGIN_RATE_LIMIT_ENABLED']:
+            return []
+        now = time.time()
+        locked = []
+        for key, capacity, refill in self._buckets(ip, username):
+            tokens = self._storage.take(key, capacity, refill, 1, now)
+            if 1 <= tokens < 2:
+                locked.append(key.split(':', 1)[0])
+        return locked
+
+    def record_success(self, username):
+        """Forget failed attempts against ``username`` after it logs in"""
+        if self.app.config['LOGIN_RATE_LIMIT_ENABLED']:
+            self._storage.reset(self._username_key(username))
+
+    def _buckets(self, ip, username):
+        config = self.app.config
+        return [
+            (f'ip:{ip}', config['LOGIN_IP_BURST'], config['LOGIN_IP_REFILL_SECONDS']),
+            (self._username_key(username), config['LOGIN_USERNAME_BURST'], config['LOGIN_USERNAME_REFILL_SECONDS']),
+        ]
+
+    def _username_key(self, username):
+        return f'username:{(username or "").strip().lower()}'
+
+
+login_rate_limiter = LoginRateLimiter()
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import threading
+
+
+def cache_key(report_type, params, format_type, version, title):
+    """Content address for a rendered report.
+
+    ``version`` is the data-version token from reports.data_version(), so any
+    change to the rows in scope produces a new key and old entries simply
+    age out of the cache.
+    """
+    payload = json.dumps({
+        'type': report_type,
+        'params': params,
+        'format': format_type,
+        'version': version,
+        'title': title
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ReportCache:
+    """Size-bounded, least-recently-used store for rendered reports on local disk.
+
+    Entries are plain files named after their cache key. Reads bump the file's
+    mtime, and writes evict the oldest files once the directory grows past
+    REPORT_CACHE_MAX_BYTES. Because every process works on the same
+    directory, gunicorn workers share hits.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._evict_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('REPORT_CACHE_DIR', os.path.join(app.instance_path, 'report_cache'))
+        app.config.setdefault('REPORT_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+        self.app = app
+        app.extensions['report_cache'] = self
+
+    @property
+    def directory(self):
+        return self.app.config['REPORT_CACHE_DIR']
+
+    def path_for(self, key, ext):
+        return os.path.join(self.directory, f'{key}.{ext}')
+
+    def get(self, key, ext):
+        """Return a cached report opened for binary reading, or None on a miss.
+
+        The file is opened here rather than handing out its path, so an
+        eviction racing with the download cannot remove it in between.
+        """
+        path = self.path_for(key, ext)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return f
+
+    def put(self, key, ext, content):
+        """Store a complete report and return its path"""
+        return self._commit(key, ext, [content])
+
+    def store_stream(self, key, ext, chunks):
+        """Yield ``chunks`` unchanged while copying them into the cache.
+
+        The entry is only published once the stream has been fully consumed,
+        so a client that disconnects half-way never leaves a truncated report.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._tmp_path(key, ext)
+        completed = False
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if completed:
+                os.replace(tmp_path, self.path_for(key, ext))
+                self._evict()
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _commit(self, key, ext, chunks):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._tmp_path(key, ext)
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        path = self.path_for(key, ext)
+        os.replace(tmp_path, path)
+        self._evict()
+        return path
+
+    def _tmp_path(self, key, ext):
+        return f'{self.path_for(key, ext)}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+    def _evict(self):
+        max_bytes = self.app.config['REPORT_CACHE_MAX_BYTES']
+        with self._evict_lock:
+            entries = []
+            total = 0
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.is_file() or entry.name.endswith('.tmp'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+report_cache = ReportCache()
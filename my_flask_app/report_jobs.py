@@ -0,0 +1,114 @@
+import atexit
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from app import db
+from app.models import ReportJob, ReportJobStatus
+from app.reports import build_report, report_summary, render_pdf, pdf_filename
+from app.report_cache import report_cache
+
+
+def can_access(job, user):
+    """Admins, the requester and the manager the report is scoped to may see a job"""
+    if user.is_admin() or job.requested_by == user.id:
+        return True
+    return user.is_manager() and job.params.get('manager_id') == user.id
+
+
+class ReportJobQueue:
+    """Runs PDF report generation outside the request.
+
+    Jobs are persisted in the report_jobs table so any web worker can report
+    their status. A small thread pool loads the report rows inside an app
+    context, and a process pool does the CPU-heavy WeasyPrint rendering.
+    Finished PDFs are stored in the report cache under the job's key.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._dispatcher = None
+        self._renderer = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('REPORT_JOB_THREADS', 2)
+        app.config.setdefault('REPORT_RENDER_PROCESSES', 2)
+        # Queued or running jobs older than this are assumed lost (e.g. the
+        # worker that owned them was restarted) and are not reused.
+        app.config.setdefault('REPORT_JOB_TIMEOUT', 600)
+        self.app = app
+        app.extensions['report_jobs'] = self
+        atexit.register(self.shutdown)
+
+    def submit(self, report_type, params, user, key):
+        """Queue a PDF report, or return an existing job with the same cache key"""
+        job = ReportJob.query.filter_by(job_key=key).order_by(ReportJob.created_at.desc()).first()
+        if job is not None and self._reusable(job):
+            return job
+
+        job = ReportJob(job_key=key, report_type=report_type, params=params,
+                        status=ReportJobStatus.QUEUED, requested_by=user.id)
+        db.session.add(job)
+        db.session.commit()
+
+        self._ensure_executors()
+        self._dispatcher.submit(self._run, job.id)
+        return job
+
+    def shutdown(self):
+        if self._pid != os.getpid():
+            return
+        if self._dispatcher is not None:
+            self._dispatcher.shutdown(wait=True)
+        if self._renderer is not None:
+            self._renderer.shutdown(wait=True)
+
+    def _reusable(self, job):
+        if job.status == ReportJobStatus.DONE:
+            return job.artifact_path is not None and os.path.exists(job.artifact_path)
+        if job.status in [ReportJobStatus.QUEUED, ReportJobStatus.RUNNING]:
+            timeout = timedelta(seconds=self.app.config['REPORT_JOB_TIMEOUT'])
+            return job.created_at > datetime.utcnow() - timeout
+        return False
+
+    def _ensure_executors(self):
+        # Pools do not survive a fork, so each gunicorn worker builds its own.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._dispatcher = ThreadPoolExecutor(max_workers=self.app.config['REPORT_JOB_THREADS'],
+                                                  thread_name_prefix='report-job')
+            self._renderer = ProcessPoolExecutor(max_workers=self.app.config['REPORT_RENDER_PROCESSES'])
+            self._pid = os.getpid()
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            job = ReportJob.query.get(job_id)
+            job.status = ReportJobStatus.RUNNING
+            job.started_at = datetime.utcnow()
+            db.session.commit()
+
+            try:
+                title, _, columns, rows = build_report(job.report_type, job.params)
+                summary = report_summary(job.report_type, job.params)
+                pdf = self._renderer.submit(render_pdf, columns, list(rows), title, summary=summary).result()
+                job.artifact_path = report_cache.put(job.job_key, 'pdf', pdf)
+                job.filename = pdf_filename(title)
+                job.status = ReportJobStatus.DONE
+            except Exception as exc:
+                self.app.logger.exception('Report job %s failed', job_id)
+                db.session.rollback()
+                job.status = ReportJobStatus.FAILED
+                job.error = str(exc)[:1000]
+
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+
+
+report_jobs = ReportJobQueue()
@@ -0,0 +1,277 @@
+from app import db
+from app.models import User, LeaveRequest, UserRole
+from app.balances import leave_days
+from app.hierarchy import in_org
+from app import rollups
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
+from datetime import datetime, timedelta
+from weasyprint import HTML
+import pandas as pd
+
+# Rows fetched per round trip when streaming a report; yield_per also makes
+# the driver use a server-side cursor so results are not buffered in full.
+REPORT_BATCH_SIZE = 1000
+
+MONTHLY_REPORT_COLUMNS = ('Employee', 'Leave Type', 'Start Date', 'End Date', 'Duration', 'Status', 'Approved By')
+TEAM_REPORT_COLUMNS = ('Employee', 'Manager', 'Leave Type', 'Start Date', 'End Date', 'Duration', 'Status')
+USER_REPORT_COLUMNS = ('Employee', 'Leave Type', 'Start Date', 'End Date', 'Duration', 'Status', 'Reason')
+MONTHLY_SUMMARY_COLUMNS = ('Leave Type', 'Status', 'Requests', 'Working Days in Month')
+
+Employee = aliased(User, name='employee')
+Manager = aliased(User, name='manager')
+Approver = aliased(User, name='approver')
+
+
+def _full_name(user):
+    return (user.first_name + ' ' + user.last_name)
+
+
+def _duration(leave):
+    # Rows written before working_days was stored fall back to the calendar
+    if leave.working_days is not None:
+        return leave.working_days
+    return leave_days(leave.start_date, leave.end_date)
+
+
+def leave_report_query(start_date=None, end_date=None, manager_id=None, employee_id=None,
+                       employee_role=None):
+    """Leave requests joined with employee, manager and approver names.
+
+    Returns a query yielding flat row tuples with the columns id,
+    employee_id, employee_name, manager_name, approver_name, leave_type,
+    start_date, end_date, working_days, status, reason and created_at, all
+    fetched in a single SELECT. start_date/end_date bound the leave start date,
+    manager_id restricts to everyone below that manager at any depth.
+    """
+    query = db.session.query(
+        LeaveRequest.id,
+        LeaveRequest.employee_id,
+        _full_name(Employee).label('employee_name'),
+        _full_name(Manager).label('manager_name'),
+        _full_name(Approver).label('approver_name'),
+        LeaveRequest.leave_type,
+        LeaveRequest.start_date,
+        LeaveRequest.end_date,
+        LeaveRequest.working_days,
+        LeaveRequest.status,
+        LeaveRequest.reason,
+        LeaveRequest.created_at
+    ).join(
+        Employee, LeaveRequest.employee_id == Employee.id
+    ).outerjoin(
+        Manager, Employee.manager_id == Manager.id
+    ).outerjoin(
+        Approver, LeaveRequest.approved_by == Approver.id
+    )
+
+    if start_date is not None:
+        query = query.filter(LeaveRequest.start_date >= start_date)
+    if end_date is not None:
+        query = query.filter(LeaveRequest.start_date <= end_date)
+    if manager_id is not None:
+        query = query.filter(in_org(Employee.id, manager_id))
+    if employee_id is not None:
+        query = query.filter(LeaveRequest.employee_id == employee_id)
+    if employee_role is not None:
+        query = query.filter(Employee.role == employee_role)
+
+    return query
+
+
+def team_leave_query(manager_id=None):
+    """Leave rows for everyone below one manager, or for every employee when manager_id is None"""
+    if manager_id:
+        query = leave_report_query(manager_id=manager_id)
+    else:
+        query = leave_report_query(employee_role=UserRole.EMPLOYEE)
+    return query.order_by(Employee.id, LeaveRequest.id)
+
+
+def monthly_report_rows(start_date, end_date, manager_id=None):
+    """Yield MONTHLY_REPORT_COLUMNS tuples for leave starting between the two dates"""
+    query = leave_report_query(start_date=start_date, end_date=end_date, manager_id=manager_id)
+    for leave in query.order_by(LeaveRequest.start_date, LeaveRequest.id).yield_per(REPORT_BATCH_SIZE):
+        yield (
+            leave.employee_name,
+            leave.leave_type.value.title(),
+            leave.start_date.strftime('%Y-%m-%d'),
+            leave.end_date.strftime('%Y-%m-%d'),
+            _duration(leave),
+            leave.status.value.title(),
+            leave.approver_name or 'N/A'
+        )
+
+
+def team_report_rows(manager_id=None):
+    """Yield TEAM_REPORT_COLUMNS tuples for a manager's org, or all employees"""
+    for leave in team_leave_query(manager_id).yield_per(REPORT_BATCH_SIZE):
+        yield (
+            leave.employee_name,
+            leave.manager_name or 'N/A',
+            leave.leave_type.value.title(),
+            leave.start_date.strftime('%Y-%m-%d'),
+            leave.end_date.strftime('%Y-%m-%d'),
+            _duration(leave),
+            leave.status.value.title()
+        )
+
+
+def user_report_rows(employee_id=None):
+    """Yield USER_REPORT_COLUMNS tuples for one employee, or everyone"""
+    query = leave_report_query(employee_id=employee_id).order_by(LeaveRequest.id)
+    for leave in query.yield_per(REPORT_BATCH_SIZE):
+        yield (
+            leave.employee_name,
+            leave.leave_type.value.title(),
+            leave.start_date.strftime('%Y-%m-%d'),
+            leave.end_date.strftime('%Y-%m-%d'),
+            _duration(leave),
+            leave.status.value.title(),
+            leave.reason or 'N/A'
+        )
+
+
+def month_bounds(month, year):
+    """First and last day of a month"""
+    start_date = datetime(year, month, 1)
+    if month == 12:
+        end_date = datetime(year + 1, 1, 1) - timedelta(days=1)
+    else:
+        end_date = datetime(year, month + 1, 1) - timedelta(days=1)
+    return start_date.date(), end_date.date()
+
+
+def build_report(report_type, params):
+    """Resolve a report request into (title, filename_prefix, columns, rows).
+
+    ``params`` is the JSON-serialisable dict stored on report jobs: month,
+    year and manager_id for 'monthly', manager_id for 'team' and
+    employee_id for 'user'. Rows are a lazy generator. Raises LookupError
+    when the selected manager or employee does not exist.
+    """
+    if report_type == 'monthly':
+        month, year = params['month'], params['year']
+        start_date, end_date = month_bounds(month, year)
+        title = f'Monthly Leave Report - {datetime(year, month, 1).strftime("%B %Y")}'
+        rows = monthly_report_rows(start_date, end_date, manager_id=params.get('manager_id'))
+        return title, f'monthly_report_{month}_{year}', MONTHLY_REPORT_COLUMNS, rows
+
+    if report_type == 'team':
+        manager_id = params.get('manager_id')
+        if manager_id:
+            manager = User.query.get(manager_id)
+            if not manager:
+                raise LookupError('Selected manager not found')
+            title = f'Team Report - {manager.full_name}'
+            filename_prefix = f'team_report_{manager.full_name.replace(" ", "_").lower()}'
+        else:
+            title = 'All Teams Report'
+            filename_prefix = 'all_teams_report'
+        return title, filename_prefix, TEAM_REPORT_COLUMNS, team_report_rows(manager_id)
+
+    if report_type == 'user':
+        employee_id = params.get('employee_id')
+        if employee_id:
+            employee = User.query.get(employee_id)
+            if not employee:
+                raise LookupError('Selected employee not found')
+            title = f'User Report - {employee.full_name}'
+            filename_prefix = f'user_report_{employee.full_name.replace(" ", "_").lower()}'
+        else:
+            title = 'All Users Report'
+            filename_prefix = 'all_users_report'
+        return title, filename_prefix, USER_REPORT_COLUMNS, user_report_rows(employee_id)
+
+    raise ValueError(f'Unknown report type: {report_type}')
+
+
+def report_summary(report_type, params):
+    """(columns, rows) of the summary printed above a report's details, or None.
+
+    The monthly report is summarised from the leave rollups: requests that
+    start in the month and the working days that fall in it, per leave
+    type and status.
+    """
+    if report_type != 'monthly':
+        return None
+    rows = [(leave_type.value.title(), status.value.title(), requests, days)
+            for leave_type, status, requests, days
+            in rollups.month_summary(params['year'], params['month'], manager_id=params.get('manager_id'))]
+    return MONTHLY_SUMMARY_COLUMNS, rows
+
+
+def data_version(report_type, params):
+    """Cheap token that changes whenever the data behind a report changes.
+
+    Combines the row count with the latest updated_at of the leave requests
+    and the users whose names appear in the report, computed with a single
+    aggregate over the same scope as the report itself.
+    """
+    if report_type == 'monthly':
+        # Every leave overlapping the month: the detail rows start in it, and
+        # the summary also counts days of leave that started earlier
+        start_date, end_date = month_bounds(params['month'], params['year'])
+        query = leave_report_query(manager_id=params.get('manager_id')).filter(
+            LeaveRequest.start_date <= end_date, LeaveRequest.end_date >= start_date)
+    elif report_type == 'team':
+        query = team_leave_query(params.get('manager_id'))
+    elif report_type == 'user':
+        query = leave_report_query(employee_id=params.get('employee_id'))
+    else:
+        raise ValueError(f'Unknown report type: {report_type}')
+
+    row = query.order_by(None).with_entities(
+        func.count(LeaveRequest.id),
+        func.max(LeaveRequest.updated_at),
+        func.max(Employee.updated_at),
+        func.max(Manager.updated_at),
+        func.max(Approver.updated_at)
+    ).one()
+    count, timestamps = row[0], row[1:]
+    return ':'.join([str(count)] + [ts.isoformat() if ts else '-' for ts in timestamps])
+
+
+def pdf_filename(title):
+    return f'{title.replace(" ", "_").lower()}.pdf'
+
+
+def render_pdf(columns, rows, title, generated_at=None, summary=None):
+    """Render report rows to PDF bytes, after the (columns, rows) of report_summary()
+    if given. Kept free of app state so it can run in a worker process."""
+    df = pd.DataFrame(list(rows), columns=list(columns))
+    generated_at = generated_at or datetime.now()
+    summary_html = ''
+    if summary is not None:
+        summary_columns, summary_rows = summary
+        summary_df = pd.DataFrame(list(summary_rows), columns=list(summary_columns))
+        if not summary_df.empty:
+            summary_html = '<h2>Summary</h2>' + summary_df.to_html(index=False, table_id='summary-table',
+                                                                  classes='table', escape=False)
+    html_string = f'''
+    <html>
+    <head>
+        <style>
+            body {{ font-family: Arial, sans-serif; margin: 20px; }}
+            h1 {{ color: #333; text-align: center; margin-bottom: 20px; }}
+            h2 {{ color: #333; font-size: 16px; margin-top: 20px; }}
+            .report-info {{ text-align: center; margin-bottom: 30px; color: #666; }}
+            table {{ border-collapse: collapse; width: 100%; margin-top: 20px; }}
+            th, td {{ border: 1px solid #ddd; padding: 12px; text-align: left; font-size: 12px; }}
+            th {{ background-color: #f2f2f2; font-weight: bold; }}
+            tr:nth-child(even) {{ background-color: #f9f9f9; }}
+            .no-data {{ text-align: center; color: #666; margin-top: 50px; font-style: italic; }}
+        </style>
+    </head>
+    <body>
+        <h1>{title}</h1>
+        <div class="report-info">
+            <p>Generated on: {generated_at.strftime('%Y-%m-%d %H:%M:%S')}</p>
+            <p>Total Records: {len(df)}</p>
+        </div>
+        {summary_html}
+        {df.to_html(index=False, table_id='report-table', classes='table', escape=False) if not df.empty else '<div class="no-data"><p>No data available for the selected criteria</p></div>'}
+    </body>
+    </html>
+    '''
+    return HTML(string=html_string).write_pdf()
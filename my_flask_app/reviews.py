@@ -0,0 +1,61 @@
+from app import db
+from app.models import LeaveRequest, LeaveStatus
+from app.decorators import log_activities
+from app import balances
+from app import rollups
+from app.team_calendar import team_calendar
+from datetime import datetime
+
+REVIEW_STATUSES = {
+    'approve': LeaveStatus.APPROVED,
+    'reject': LeaveStatus.REJECTED,
+}
+
+
+def review_requests(reviewer, request_ids, action, comments=None):
+    """Approve or reject a batch of pending leave requests.
+
+    Permission for every id is checked in one query, the status, balance
+    and rollup changes and the audit entries are written in one
+    transaction, and the pending rows are locked so two reviewers cannot
+    both act on them. Returns (reviewed, skipped): ids that were updated and ids that
+    were missing, not reviewable by ``reviewer`` or no longer pending.
+    """
+    status = REVIEW_STATUSES[action]
+    request_ids = set(request_ids)
+    leave_requests = reviewer.reviewable_leave_requests(request_ids).filter(
+        LeaveRequest.status == LeaveStatus.PENDING
+    ).order_by(LeaveRequest.id).with_for_update(of=LeaveRequest).all()
+
+    now = datetime.utcnow()
+    changes = []
+    activities = []
+    for leave_request in leave_requests:
+        changes.append((leave_request, balances.snapshot(leave_request)))
+        leave_request.status = status
+        leave_request.approved_by = reviewer.id
+        leave_request.approval_date = now
+        leave_request.manager_comments = comments
+        leave_request.updated_at = now
+        activities.append({
+            'action': f'leave_request_{action}d',
+            'entity_type': 'leave_request',
+            'entity_id': leave_request.id,
+            'old_values': {'status': LeaveStatus.PENDING.value},
+            'new_values': {'status': status.value, 'comments': comments}
+        })
+
+    balances.record_changes(changes)
+    rollups.record_changes(leave_requests)
+    if activities:
+        # Commits the status changes and the audit entries together
+        log_activities(activities, sync=True)
+    else:
+        db.session.commit()
+
+    if leave_requests:
+        team_calendar.invalidate_for_employees(leave_request.employee_id for leave_request in leave_requests)
+
+    reviewed = [leave_request.id for leave_request in leave_requests]
+    skipped = sorted(request_ids - set(reviewed))
+    return reviewed, skipped
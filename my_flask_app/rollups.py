@@ -0,0 +1,237 @@
+from datetime import date, datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import User, LeaveRequest, LeaveStatus, LeaveRollup, LeaveRollupEntry, RollupState
+from app.working_days import working_calendar
+from app.hierarchy import org_ids
+
+# manager_id recorded for employees without a manager
+UNASSIGNED = 0
+
+STATE_NAME = 'leave_rollups'
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def contributions(manager_id, leave_type, status, start_date, end_date):
+    """{(month, manager_id, leave_type, status): (requests, days)} for one request.
+
+    The request is counted once, in the month it starts; its working days
+    are split over the months they fall in.
+    """
+    result = {}
+    month = month_start(start_date)
+    while month <= end_date:
+        first = max(start_date, month)
+        last = min(end_date, next_month(month) - timedelta(days=1))
+        requests = 1 if month == month_start(start_date) else 0
+        result[(month, manager_id, leave_type, status)] = (requests, working_calendar.count(first, last))
+        month = next_month(month)
+    return result
+
+
+def _entry_contributions(entry):
+    return contributions(entry.manager_id, entry.leave_type, entry.status, entry.start_date, entry.end_date)
+
+
+def _lock_state():
+    """The watermark row, locked so concurrent refreshes run one after the other"""
+    state = RollupState.query.filter_by(name=STATE_NAME).with_for_update().first()
+    if state is None:
+        state = RollupState(name=STATE_NAME)
+        db.session.add(state)
+        db.session.flush()
+    return state
+
+
+def _add_row(month, manager_id, leave_type, status, requests, days):
+    """Update-then-insert one rollup row. The insert runs in a savepoint so a
+    concurrent transaction creating the same row only costs a retry."""
+    def update():
+        return LeaveRollup.query.filter_by(
+            month=month, manager_id=manager_id, leave_type=leave_type, status=status
+        ).update({
+            LeaveRollup.requests: LeaveRollup.requests + requests,
+            LeaveRollup.days: LeaveRollup.days + days
+        }, synchronize_session=False)
+
+    if update():
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(LeaveRollup(month=month, manager_id=manager_id, leave_type=leave_type,
+                                       status=status, requests=requests, days=days))
+    except IntegrityError:
+        update()
+
+
+def _apply(deltas):
+    for (month, manager_id, leave_type, status), (requests, days) in deltas.items():
+        if requests or days:
+            _add_row(month, manager_id, leave_type, status, requests, days)
+    db.session.flush()
+
+
+def _request_rows():
+    """(request_id, manager_id, leave_type, status, start_date, end_date) of leave requests"""
+    return db.session.query(
+        LeaveRequest.id, User.manager_id, LeaveRequest.leave_type, LeaveRequest.status,
+        LeaveRequest.start_date, LeaveRequest.end_date
+    ).join(User, LeaveRequest.employee_id == User.id)
+
+
+def _sync(rows, previous):
+    """Move each request's contribution to the state in ``rows``.
+
+    ``previous`` maps request ids to their LeaveRollupEntry, if they have
+    one: its contribution is subtracted before the new one is added, so
+    syncing a request again is harmless.
+    """
+    deltas = {}
+
+    def add(key_values, sign):
+        for key, (requests, days) in key_values.items():
+            old_requests, old_days = deltas.get(key, (0, 0))
+            deltas[key] = (old_requests + sign * requests, old_days + sign * days)
+
+    new_entries = []
+    for request_id, manager_id, leave_type, status, start_date, end_date in rows:
+        manager_id = manager_id or UNASSIGNED
+        entry = previous.get(request_id)
+        if entry is not None:
+            if (entry.manager_id, entry.leave_type, entry.status, entry.start_date, entry.end_date) == \
+                    (manager_id, leave_type, status, start_date, end_date):
+                continue
+            add(_entry_contributions(entry), -1)
+            entry.manager_id, entry.leave_type, entry.status = manager_id, leave_type, status
+            entry.start_date, entry.end_date = start_date, end_date
+        else:
+            new_entries.append({'request_id': request_id, 'manager_id': manager_id, 'leave_type': leave_type,
+                                'status': status, 'start_date': start_date, 'end_date': end_date})
+        add(contributions(manager_id, leave_type, status, start_date, end_date), 1)
+
+    if new_entries:
+        db.session.bulk_insert_mappings(LeaveRollupEntry, new_entries)
+    _apply(deltas)
+
+
+def _locked_entries(request_ids):
+    """{request_id: LeaveRollupEntry} for ``request_ids``, locked in id order so
+    writers and refreshes touching the same request take turns"""
+    entries = {}
+    request_ids = sorted(request_ids)
+    for start in range(0, len(request_ids), 1000):
+        batch = LeaveRollupEntry.query.filter(
+            LeaveRollupEntry.request_id.in_(request_ids[start:start + 1000])
+        ).order_by(LeaveRollupEntry.request_id).with_for_update()
+        entries.update((entry.request_id, entry) for entry in batch)
+    return entries
+
+
+def record_changes(leave_requests):
+    """Apply the rollup deltas of new or changed leave requests.
+
+    Runs in the caller's session, like balances.record_changes(), so the
+    rollups are committed in the same transaction as the requests and
+    dashboards see a change as soon as it is committed.
+    """
+    db.session.flush()
+    request_ids = {leave_request.id for leave_request in leave_requests}
+    if request_ids:
+        _sync(_request_rows().filter(LeaveRequest.id.in_(request_ids)).all(), _locked_entries(request_ids))
+
+
+def record_employee_change(employee_id):
+    """Move an employee's requests to their current manager's team, in the
+    caller's session; call it when an employee's manager changes"""
+    db.session.flush()
+    rows = _request_rows().filter(LeaveRequest.employee_id == employee_id).all()
+    if rows:
+        _sync(rows, _locked_entries(row.id for row in rows))
+
+
+def refresh_rollups(full=False):
+    """Repair or backfill the rollup tables and return the number of requests processed.
+
+    Writes keep the rollups current through record_changes(); this catches
+    up on anything that bypassed it, such as working days recounted after a
+    holiday change. Incremental runs only look at leave requests updated
+    since the last watermark, plus the requests of employees updated since
+    then (their manager may have changed). ``full`` rebuilds both tables
+    from scratch.
+    """
+    started = datetime.utcnow()
+    state = _lock_state()
+
+    query = _request_rows()
+    full = full or state.watermark is None
+    if full:
+        LeaveRollup.query.delete(synchronize_session=False)
+        LeaveRollupEntry.query.delete(synchronize_session=False)
+    else:
+        # Overlap the previous run a little so rows from transactions that
+        # committed late are not missed
+        since = state.watermark - timedelta(seconds=current_app.config.get('ROLLUP_WATERMARK_OVERLAP', 300))
+        query = query.filter(or_(LeaveRequest.updated_at >= since, User.updated_at >= since))
+
+    rows = query.all()
+    _sync(rows, {} if full else _locked_entries(row.id for row in rows))
+
+    state.watermark = started
+    db.session.commit()
+    return len(rows)
+
+
+def _in_org(manager_id):
+    # Rows are keyed by direct manager: the manager's org is the teams of
+    # the manager and of every manager below them
+    return LeaveRollup.manager_id.in_(org_ids(manager_id, include_self=True))
+
+
+def status_counts(manager_id=None):
+    """leave_status_counts() answered from the rollups: requests per status
+    for a manager's org, or the whole organisation"""
+    query = db.session.query(LeaveRollup.status, func.sum(LeaveRollup.requests))
+    if manager_id is not None:
+        query = query.filter(_in_org(manager_id))
+
+    counts = {status.value: 0 for status in LeaveStatus}
+    total = 0
+    for status, count in query.group_by(LeaveRollup.status):
+        counts[status.value] = int(count or 0)
+        total += int(count or 0)
+    counts['total'] = total
+    return counts
+
+
+def month_summary(year, month, manager_id=None):
+    """[(leave_type, status, requests, days)] for one month, by type and status"""
+    query = db.session.query(
+        LeaveRollup.leave_type, LeaveRollup.status,
+        func.sum(LeaveRollup.requests), func.sum(LeaveRollup.days)
+    ).filter(LeaveRollup.month == date(year, month, 1))
+    if manager_id is not None:
+        query = query.filter(_in_org(manager_id))
+    query = query.group_by(LeaveRollup.leave_type, LeaveRollup.status)
+    return sorted(((leave_type, status, int(requests or 0), int(days or 0))
+                   for leave_type, status, requests, days in query),
+                  key=lambda row: (row[0].value, row[1].value))
+
+
+def year_rows(year):
+    """Rollup rows of one year as (month, manager_id, leave_type, status, requests, days)"""
+    return db.session.query(
+        LeaveRollup.month, LeaveRollup.manager_id, LeaveRollup.leave_type, LeaveRollup.status,
+        LeaveRollup.requests, LeaveRollup.days
+    ).filter(
+        LeaveRollup.month >= date(year, 1, 1),
+        LeaveRollup.month <= date(year, 12, 1)
+    ).all()
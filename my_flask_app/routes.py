@@ -1,7 +1,8 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, send_file, abort
 from flask_login import current_user, login_required
-from app.models import User, LeaveRequest, AuditLog, LeaveStatus, UserRole
+from app.models import User, LeaveRequest, AuditLog, LeaveStatus, UserRole, ReportJob
 from app.decorators import log_activity
+from app.report_jobs import can_access
 from sqlalchemy import func
 from flask_login import current_user
 
@@ -37,3 +38,47 @@ def unauthorized():
 def profile():
     log_activity('profile_viewed')
     return render_template('profile.html', user=current_user)
+
+@main_bp.route('/reports/jobs/<int:job_id>')
+@login_required
+def report_job(job_id):
+    job = ReportJob.query.get_or_404(job_id)
+    if not can_access(job, current_user):
+        return redirect(url_for('main.unauthorized'))
+    return render_template('report_job.html', job=job)
+
+@main_bp.route('/reports/jobs/<int:job_id>/status')
+@login_required
+def report_job_status(job_id):
+    job = ReportJob.query.get_or_404(job_id)
+    if not can_access(job, current_user):
+        abort(403)
+    return jsonify({
+        'id': job.id,
+        'report_type': job.report_type,
+        'status': job.status.value,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'download_url': url_for('main.download_report', job_id=job.id) if job.is_done else None
+    })
+
+@main_bp.route('/reports/jobs/<int:job_id>/download')
+@login_required
+def download_report(job_id):
+    job = ReportJob.query.get_or_404(job_id)
+    if not can_access(job, current_user):
+        return redirect(url_for('main.unauthorized'))
+    if not job.is_done:
+        flash('This report is not ready yet', 'warning')
+        return redirect(url_for('main.report_job', job_id=job.id))
+    try:
+        # Opened before sending so a concurrent eviction cannot remove it in between
+        artifact = open(job.artifact_path, 'rb')
+    except FileNotFoundError:
+        # Evicted from the report cache; the report has to be generated again
+        flash('This report has expired. Please generate it again.', 'warning')
+        return redirect(url_for('main.dashboard'))
+    log_activity('report_downloaded', 'report_job', job.id)
+    return send_file(artifact, mimetype='application/pdf',
+                     as_attachment=True, download_name=job.filename)
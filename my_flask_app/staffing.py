@@ -0,0 +1,79 @@
+import numpy as np
+from datetime import timedelta
+from flask import current_app
+from app import db
+from app.models import User
+from app.team_calendar import team_calendar
+
+
+def occupancy(absences, start, end):
+    """Number of distinct people off on each day of [start, end], as a NumPy array.
+
+    Every absence becomes a +1/-1 pair in a per-person difference matrix, so
+    the per-day counts come from one cumulative sum rather than a loop over
+    days; people with overlapping requests are only counted once per day.
+    """
+    days = (end - start).days + 1
+    if not absences:
+        return np.zeros(days, dtype=np.int64)
+
+    people = {}
+    rows = np.array([people.setdefault(absence.employee_id, len(people)) for absence in absences])
+    first = np.array([max((absence.start_date - start).days, 0) for absence in absences])
+    last = np.array([min((absence.end_date - start).days, days - 1) for absence in absences])
+
+    diff = np.zeros((len(people), days + 1), dtype=np.int64)
+    np.add.at(diff, (rows, first), 1)
+    np.add.at(diff, (rows, last + 1), -1)
+    return (np.cumsum(diff, axis=1)[:, :days] > 0).sum(axis=0)
+
+
+def allowed_absent(team_size):
+    """Most people of a team of ``team_size`` (applicant included) who may be off on one day"""
+    max_absent = current_app.config.get('STAFFING_MAX_ABSENT')
+    max_ratio = current_app.config.get('STAFFING_MAX_ABSENT_RATIO', 0.5)
+    limits = []
+    if max_absent is not None:
+        limits.append(max_absent)
+    if max_ratio is not None:
+        limits.append(int(team_size * max_ratio))
+    # Somebody can always be off, otherwise a one-person team could never take leave
+    return max(1, min(limits)) if limits else None
+
+
+def check_staffing(employee, start, end):
+    """Return [(day, absent_teammates)] for each day on which ``employee``
+    being off as well would exceed the team's staffing threshold.
+
+    The team is everyone sharing the employee's manager. Approved and
+    pending absences are fetched with a single overlap lookup. The limit is
+    STAFFING_MAX_ABSENT people and/or STAFFING_MAX_ABSENT_RATIO of the
+    team (default 0.5); STAFFING_CHECK is "warn" (default), "block" or "off".
+    """
+    if current_app.config.get('STAFFING_CHECK', 'warn') == 'off' or employee.manager_id is None:
+        return []
+
+    team_size = db.session.query(db.func.count(User.id)).filter(
+        User.manager_id == employee.manager_id,
+        User.is_active.is_(True)
+    ).scalar()
+    allowed = allowed_absent(team_size)
+    if allowed is None:
+        return []
+
+    teammates = [absence for absence in team_calendar.absences(employee.manager_id, start, end)
+                 if absence.employee_id != employee.id]
+    counts = occupancy(teammates, start, end)
+    over = np.flatnonzero(counts + 1 > allowed)
+    return [(start + timedelta(days=int(offset)), int(counts[offset])) for offset in over]
+
+
+def describe(conflicts):
+    """One-line summary of check_staffing() results for a flash message or form error"""
+    first, last = conflicts[0][0], conflicts[-1][0]
+    peak = max(absent for _, absent in conflicts)
+    if first == last:
+        when = f'On {first:%d %b %Y}'
+    else:
+        when = f'On {len(conflicts)} day(s) between {first:%d %b %Y} and {last:%d %b %Y}'
+    return f'{when} your team would be short-staffed: up to {peak} teammate(s) are already off.'
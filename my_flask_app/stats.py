@@ -0,0 +1,28 @@
+from app import db
+from app.models import LeaveRequest, LeaveStatus
+from sqlalchemy import func
+from app.hierarchy import in_org
+
+
+def leave_status_counts(employee_id=None, manager_id=None):
+    """Count leave requests per status in a single grouped query.
+
+    Returns a dict keyed by LeaveStatus value plus 'total'. Pass employee_id
+    for one employee's requests, manager_id for everyone below a manager,
+    or neither for the whole organisation.
+    """
+    query = db.session.query(LeaveRequest.status, func.count(LeaveRequest.id))
+
+    if employee_id is not None:
+        query = query.filter(LeaveRequest.employee_id == employee_id)
+    if manager_id is not None:
+        query = query.filter(in_org(LeaveRequest.employee_id, manager_id))
+
+    counts = {status.value: 0 for status in LeaveStatus}
+    total = 0
+    for status, count in query.group_by(LeaveRequest.status):
+        if status is not None:
+            counts[status.value] = count
+        total += count
+    counts['total'] = total
+    return counts
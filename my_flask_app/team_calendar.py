@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+from app import db
+from app.models import User, LeaveRequest, LeaveStatus
+from app.caching import SharedGeneration
+from app.hierarchy import in_org, ancestor_id_set
+
+CALENDAR_STATUSES = (LeaveStatus.APPROVED, LeaveStatus.PENDING)
+
+Absence = namedtuple('Absence', 'request_id employee_id employee_name leave_type status start_date end_date')
+
+
+def absence_dict(absence):
+    return {
+        'request_id': absence.request_id,
+        'employee_id': absence.employee_id,
+        'employee_name': absence.employee_name,
+        'leave_type': absence.leave_type.value,
+        'status': absence.status.value,
+        'start_date': absence.start_date.isoformat(),
+        'end_date': absence.end_date.isoformat()
+    }
+
+
+def overlap_query(manager_id, start, end, org=False):
+    """Approved and pending absences overlapping [start, end], both inclusive.
+
+    ``manager_id`` limits the result to that manager's direct reports, or
+    with ``org`` to everyone below them at any depth; None means every
+    active employee. Served by ix_leave_requests_end_start and
+    ix_leave_requests_employee_end.
+    """
+    query = db.session.query(
+        LeaveRequest.id, LeaveRequest.employee_id, User.first_name, User.last_name,
+        LeaveRequest.leave_type, LeaveRequest.status, LeaveRequest.start_date, LeaveRequest.end_date
+    ).join(User, LeaveRequest.employee_id == User.id).filter(
+        LeaveRequest.status.in_(CALENDAR_STATUSES),
+        LeaveRequest.start_date <= end,
+        LeaveRequest.end_date >= start,
+        User.is_active.is_(True)
+    )
+    if manager_id is not None:
+        query = query.filter(in_org(User.id, manager_id) if org else User.manager_id == manager_id)
+    query = query.order_by(LeaveRequest.start_date, LeaveRequest.id)
+    return [Absence(request_id, employee_id, f'{first_name} {last_name}', leave_type, status, start_date, end_date)
+            for request_id, employee_id, first_name, last_name, leave_type, status, start_date, end_date in query]
+
+
+class IntervalTree:
+    """Static interval tree over absences, answering overlap queries.
+
+    The intervals are sorted by start date and read as an implicit balanced
+    binary tree (the middle element of each range is its root). Every node
+    knows the latest end date in its subtree, so subtrees that end before
+    the query range are skipped, and everything right of a node that starts
+    after the range is skipped too.
+    """
+
+    def __init__(self, absences):
+        self._items = sorted(absences, key=lambda absence: (absence.start_date, absence.request_id))
+        self._max_end = [None] * len(self._items)
+        self._build(0, len(self._items))
+
+    def __len__(self):
+        return len(self._items)
+
+    def overlapping(self, start, end):
+        """Absences overlapping [start, end], ordered by start date"""
+        found = []
+        self._search(0, len(self._items), start, end, found)
+        return found
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        max_end = self._items[mid].end_date
+        for child in (self._build(lo, mid), self._build(mid + 1, hi)):
+            if child is not None and child > max_end:
+                max_end = child
+        self._max_end[mid] = max_end
+        return max_end
+
+    def _search(self, lo, hi, start, end, found):
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        if self._max_end[mid] < start:
+            return
+        self._search(lo, mid, start, end, found)
+        item = self._items[mid]
+        if item.start_date > end:
+            return
+        if item.end_date >= start:
+            found.append(item)
+        self._search(mid + 1, hi, start, end, found)
+
+
+class TeamCalendar:
+    """Per-process cache of one interval tree per team or org.
+
+    A team is a manager's direct reports, an org everyone below them. Each
+    tree holds its absences within TEAM_CALENDAR_WINDOW_DAYS of today.
+    Ranges inside that window are answered from the tree, anything further
+    out goes to overlap_query(). Leave and team changes call
+    invalidate_teams(), which bumps a shared generation for the team and
+    for the org of every manager above it, so every worker rebuilds those
+    trees on its next lookup; trees also expire after
+    TEAM_CALENDAR_CACHE_TTL seconds.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._trees = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TEAM_CALENDAR_CACHE_TTL', 300)
+        app.config.setdefault('TEAM_CALENDAR_WINDOW_DAYS', 400)
+        self.app = app
+        self._trees = {}
+        self._generations = {}
+        app.extensions['team_calendar'] = self
+
+    def absences(self, manager_id, start, end, org=False):
+        """Approved and pending absences of a team, or with ``org`` of the
+        manager's whole org (None: everyone), overlapping [start, end]"""
+        window = timedelta(days=self.app.config['TEAM_CALENDAR_WINDOW_DAYS'])
+        today = date.today()
+        lo, hi = today - window, today + window
+        if start < lo or end > hi:
+            return overlap_query(manager_id, start, end, org)
+        return self._tree(manager_id, lo, hi, org).overlapping(start, end)
+
+    def invalidate_teams(self, manager_ids):
+        """Drop the cached trees of these managers' teams, of the orgs of
+        these managers and everyone above them, and of the all-employees view"""
+        manager_ids = {manager_id for manager_id in manager_ids if manager_id is not None}
+        scopes = {self._scope(manager_id) for manager_id in manager_ids}
+        if manager_ids:
+            scopes.update(self._scope(manager_id, org=True) for manager_id in ancestor_id_set(manager_ids))
+        scopes.add(self._scope(None))
+        with self._lock:
+            for scope in scopes:
+                self._trees.pop(scope, None)
+        for scope in scopes:
+            self._generation(scope).bump()
+
+    def invalidate_for_employees(self, employee_ids):
+        """invalidate_teams() for the managers of these employees"""
+        employee_ids = list(set(employee_ids))
+        manager_ids = []
+        if employee_ids:
+            manager_ids = [manager_id for manager_id, in db.session.query(User.manager_id)
+                           .filter(User.id.in_(employee_ids)).distinct()]
+        self.invalidate_teams(manager_ids)
+
+    def _tree(self, manager_id, lo, hi, org=False):
+        scope = self._scope(manager_id, org)
+        generation = self._generation(scope).current()
+        entry = self._trees.get(scope)
+        if entry is not None:
+            cached_generation, expires, cached_lo, tree = entry
+            if cached_generation == generation and cached_lo == lo and expires > time.monotonic():
+                return tree
+
+        tree = IntervalTree(overlap_query(manager_id, lo, hi, org))
+        expires = time.monotonic() + self.app.config['TEAM_CALENDAR_CACHE_TTL']
+        with self._lock:
+            self._trees[scope] = (generation, expires, lo, tree)
+        return tree
+
+    def _scope(self, manager_id, org=False):
+        if manager_id is None:
+            return 'all'
+        return f'org-{manager_id}' if org else f'manager-{manager_id}'
+
+    def _generation(self, scope):
+        generation = self._generations.get(scope)
+        if generation is None:
+            path = os.path.join(self.app.instance_path, 'cache', 'team_calendar', f'{scope}.gen')
+            generation = self._generations.setdefault(scope, SharedGeneration(path))
+        return generation
+
+
+team_calendar = TeamCalendar()
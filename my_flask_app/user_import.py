@@ -0,0 +1,270 @@
+import csv
+import io
+from email_validator import validate_email, EmailNotValidError
+from flask import current_app
+from openpyxl import load_workbook
+from sqlalchemy import String, any_, bindparam, or_
+from sqlalchemy.dialects.postgresql import ARRAY
+from app import db
+from app.models import User, UserRole
+from app.passwords import password_hasher
+from app.caching import user_directory
+from app import hierarchy
+
+REQUIRED_COLUMNS = ('username', 'email', 'first_name', 'last_name', 'password')
+OPTIONAL_COLUMNS = ('role', 'manager', 'is_active')
+# Checked against the users column lengths, so an over-long value is a row
+# error instead of failing the whole insert
+LENGTH_CHECKED_COLUMNS = ('username', 'email', 'first_name', 'last_name')
+
+# Values per IN (...) lookup where each value is its own bind parameter;
+# keeps SQLite under its variable limit
+LOOKUP_CHUNK_SIZE = 500
+
+
+class ImportResult:
+    """Outcome of an import: how many users were created and why the other rows were not"""
+
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    def add_error(self, row_number, username, message):
+        self.errors.append((row_number, username, message))
+
+
+def read_rows(stream, filename):
+    """Yield (row_number, row) from a CSV or XLSX upload.
+
+    Header names are lower-cased with spaces turned into underscores, so
+    "First Name" and "first_name" both work. Row numbers match what the
+    user sees in their spreadsheet, counting the header as row 1.
+    """
+    if filename.lower().endswith('.xlsx'):
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+        sheet_rows = workbook.active.iter_rows(values_only=True)
+    else:
+        sheet_rows = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+
+    header = next(sheet_rows, None)
+    if header is None:
+        return
+    header = [str(name or '').strip().lower().replace(' ', '_') for name in header]
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f'Missing column(s): {", ".join(missing)}')
+
+    for row_number, values in enumerate(sheet_rows, start=2):
+        row = {name: '' if value is None else str(value).strip() for name, value in zip(header, values)}
+        if any(row.values()):
+            yield row_number, row
+
+
+def _validate(row):
+    """Normalise one row into column values for the users table, or raise ValueError"""
+    for column in REQUIRED_COLUMNS:
+        if not row.get(column):
+            raise ValueError(f'{column} is required')
+    if not 3 <= len(row['username']) <= 64:
+        raise ValueError('username must be between 3 and 64 characters')
+    if len(row['password']) < 6:
+        raise ValueError('password must be at least 6 characters')
+    try:
+        email = validate_email(row['email'], check_deliverability=False).normalized
+    except EmailNotValidError as e:
+        raise ValueError(f'invalid email: {e}')
+
+    role_name = (row.get('role') or UserRole.EMPLOYEE.value).lower()
+    try:
+        role = UserRole(role_name)
+    except ValueError:
+        raise ValueError(f'unknown role "{row.get("role")}"')
+
+    is_active = (row.get('is_active') or 'true').lower() in ['true', 'yes', 'y', '1']
+
+    values = {
+        'username': row['username'],
+        'email': email,
+        'first_name': row['first_name'],
+        'last_name': row['last_name'],
+        'role': role,
+        'is_active': is_active,
+        'manager_id': None
+    }
+    for column in LENGTH_CHECKED_COLUMNS:
+        limit = User.__table__.c[column].type.length
+        if len(values[column]) > limit:
+            raise ValueError(f'{column} must be at most {limit} characters')
+    return values
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _batches(values):
+    """Split lookup values into the batches _matches() can take in one statement"""
+    values = list(values)
+    if db.engine.dialect.name == 'postgresql':
+        return [values] if values else []
+    return list(_chunks(values, LOOKUP_CHUNK_SIZE))
+
+
+def _matches(column, values):
+    # PostgreSQL gets the whole list as a single array parameter
+    if db.engine.dialect.name == 'postgresql':
+        return column == any_(bindparam(None, values, type_=ARRAY(String)))
+    return column.in_(values)
+
+
+def _existing(usernames, emails):
+    """Usernames and emails already registered. On PostgreSQL this is one
+    query for the whole batch."""
+    taken_usernames, taken_emails = set(), set()
+    username_batches, email_batches = _batches(usernames), _batches(emails)
+    for index in range(max(len(username_batches), len(email_batches))):
+        username_batch = username_batches[index] if index < len(username_batches) else []
+        email_batch = email_batches[index] if index < len(email_batches) else []
+        rows = db.session.query(User.username, User.email).filter(
+            or_(_matches(User.username, username_batch), _matches(User.email, email_batch))
+        )
+        for username, email in rows:
+            taken_usernames.add(username)
+            taken_emails.add(email)
+    return taken_usernames, taken_emails
+
+
+def _ids_by_username(usernames, roles=None):
+    ids = {}
+    for batch in _batches(usernames):
+        query = db.session.query(User.username, User.id).filter(_matches(User.username, batch))
+        if roles is not None:
+            query = query.filter(User.role.in_(roles))
+        ids.update(query)
+    return ids
+
+
+def import_users(rows):
+    """Create users from (row_number, row) pairs as produced by read_rows().
+
+    Uniqueness of usernames and emails is checked for the whole batch, in
+    the file and against the database, with set-based queries. Managers are
+    referenced by username and may be existing managers or manager rows of
+    the same file. Passwords are hashed in the password hasher's process
+    pool and the users are inserted in chunks of USER_IMPORT_CHUNK_SIZE
+    (default 1000), all in one transaction. Invalid rows are skipped and reported in the result.
+    """
+    result = ImportResult()
+
+    candidates = []
+    seen_usernames, seen_emails = {}, {}
+    for row_number, row in rows:
+        try:
+            values = _validate(row)
+        except ValueError as e:
+            result.add_error(row_number, row.get('username', ''), str(e))
+            continue
+        if values['username'] in seen_usernames:
+            result.add_error(row_number, values['username'],
+                             f'duplicate username (also on row {seen_usernames[values["username"]]})')
+            continue
+        if values['email'] in seen_emails:
+            result.add_error(row_number, values['username'],
+                             f'duplicate email (also on row {seen_emails[values["email"]]})')
+            continue
+        seen_usernames[values['username']] = row_number
+        seen_emails[values['email']] = row_number
+        candidates.append((row_number, row, values))
+
+    taken_usernames, taken_emails = _existing(seen_usernames, seen_emails)
+    accepted = []
+    for row_number, row, values in candidates:
+        if values['username'] in taken_usernames:
+            result.add_error(row_number, values['username'], 'username is already taken')
+        elif values['email'] in taken_emails:
+            result.add_error(row_number, values['username'], 'email is already registered')
+        else:
+            accepted.append((row_number, row, values))
+
+    # Managers: existing accounts, or manager/admin rows accepted from this file
+    in_file_managers = {values['username'] for _, _, values in accepted
+                        if values['role'] in (UserRole.MANAGER, UserRole.ADMIN)}
+    references = {row.get('manager') for _, row, _ in accepted if row.get('manager')}
+    existing_managers = _ids_by_username(references - in_file_managers, roles=[UserRole.MANAGER, UserRole.ADMIN])
+
+    kept = []
+    for row_number, row, values in accepted:
+        manager = row.get('manager')
+        if manager and manager == values['username']:
+            result.add_error(row_number, values['username'], 'a user cannot be their own manager')
+            continue
+        if manager in existing_managers:
+            values['manager_id'] = existing_managers[manager]
+        elif manager and manager not in in_file_managers:
+            result.add_error(row_number, values['username'], f'unknown manager "{manager}"')
+            continue
+        kept.append((row_number, row, values))
+
+    # Rows whose manager chain inside the file loops back on itself have no
+    # valid hierarchy; reject them before anything is inserted
+    file_managers = {values['username']: row['manager'] for _, row, values in kept
+                     if row.get('manager') in in_file_managers}
+    in_cycle, checked = set(), set()
+    for username in file_managers:
+        path = {}
+        while username in file_managers and username not in checked and username not in path:
+            path[username] = len(path)
+            username = file_managers[username]
+        if username in path:
+            in_cycle.update(name for name, position in path.items() if position >= path[username])
+        checked.update(path)
+    for row_number, row, values in kept:
+        if values['username'] in in_cycle:
+            result.add_error(row_number, values['username'], 'circular manager chain')
+    kept = [entry for entry in kept if entry[2]['username'] not in in_cycle]
+
+    # A manager from the file only exists if their own row is imported, so
+    # drop the reports of rejected manager rows until nothing changes
+    while True:
+        kept_usernames = {values['username'] for _, _, values in kept}
+        orphans = {row_number for row_number, row, _ in kept
+                   if row.get('manager') in in_file_managers and row['manager'] not in kept_usernames}
+        if not orphans:
+            break
+        for row_number, row, values in kept:
+            if row_number in orphans:
+                result.add_error(row_number, values['username'], f'unknown manager "{row["manager"]}"')
+        kept = [entry for entry in kept if entry[0] not in orphans]
+
+    to_insert = [(row, values) for _, row, values in kept]
+    manager_links = [(values['username'], row['manager']) for _, row, values in kept
+                     if row.get('manager') in in_file_managers]
+    result.errors.sort(key=lambda error: error[0])
+
+    if not to_insert:
+        return result
+
+    hashes = password_hasher.hash_many([row['password'] for row, _ in to_insert])
+    users = User.__table__
+    try:
+        for chunk in _chunks(zip(to_insert, hashes), current_app.config.get('USER_IMPORT_CHUNK_SIZE', 1000)):
+            db.session.execute(users.insert(), [dict(values, password_hash=password_hash)
+                                                for (_, values), password_hash in chunk])
+
+        if manager_links:
+            ids = _ids_by_username({name for link in manager_links for name in link})
+            db.session.execute(
+                users.update().where(users.c.id == bindparam('user_id')).values(manager_id=bindparam('manager')),
+                [{'user_id': ids[username], 'manager': ids[manager]} for username, manager in manager_links]
+            )
+        hierarchy.add_users(_ids_by_username({values['username'] for _, values in to_insert}).values())
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    user_directory.invalidate()
+
+    result.created = len(to_insert)
+    return result
@@ -0,0 +1,191 @@
+import bisect
+import heapq
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import String, case, func, literal_column, or_
+from app import db
+from app.models import User
+from app.caching import SharedGeneration
+from app.hierarchy import in_org
+from app.permissions import visible_employee_ids
+
+SearchHit = namedtuple('SearchHit', 'id username email full_name role is_active manager_id')
+
+# Word boundaries inside usernames, emails and names
+WORD_SPLIT = re.compile(r'[\s@._+-]+')
+
+
+def hit_dict(hit):
+    return {
+        'id': hit.id,
+        'name': hit.full_name,
+        'username': hit.username,
+        'email': hit.email,
+        'role': hit.role.value,
+        'is_active': hit.is_active
+    }
+
+
+def escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def visible_ids(viewer):
+    """Visibility rule of the search: admins see everyone (None), managers
+    everyone below them, anyone else only themselves"""
+    if viewer.is_admin():
+        return None
+    if viewer.is_manager():
+        return visible_employee_ids(viewer)
+    return {viewer.id}
+
+
+def visible_filter(viewer, query):
+    """visible_ids() as a filter on a query over User"""
+    if viewer.is_admin():
+        return query
+    if viewer.is_manager():
+        return query.filter(in_org(User.id, viewer.id))
+    return query.filter(User.id == viewer.id)
+
+
+def _rank(hit, term):
+    """0 when the username, full name or last name starts with the term"""
+    prefix = (hit.username.lower().startswith(term) or hit.full_name.lower().startswith(term)
+              or hit.full_name.lower().rsplit(' ', 1)[-1].startswith(term))
+    return (0 if prefix else 1, hit.full_name.lower(), hit.id)
+
+
+class PrefixIndex:
+    """Sorted (key, user_id) pairs for prefix lookups with bisect.
+
+    The keys are each user's lower-cased username, email and full name,
+    plus every word inside them, so "smi" finds "john.smith@example.com"
+    as well as "Anna Smith". Matching happens at word starts, not inside
+    words.
+    """
+
+    def __init__(self, hits):
+        self.hits = {hit.id: hit for hit in hits}
+        keys = set()
+        for hit in hits:
+            for value in (hit.username, hit.email, hit.full_name):
+                value = value.lower()
+                keys.add((value, hit.id))
+                keys.update((word, hit.id) for word in WORD_SPLIT.split(value) if word)
+        self._keys = sorted(keys)
+
+    def __len__(self):
+        return len(self.hits)
+
+    def matching(self, term):
+        """Hits with a key starting with ``term``"""
+        found = set()
+        position = bisect.bisect_left(self._keys, (term,))
+        while position < len(self._keys) and self._keys[position][0].startswith(term):
+            found.add(self._keys[position][1])
+            position += 1
+        return [self.hits[user_id] for user_id in found]
+
+
+class UserSearch:
+    """Typeahead search over username, email, first and last name.
+
+    USER_SEARCH_BACKEND picks how: "trigram" runs LIKE '%term%' queries
+    served by the pg_trgm indexes on users, "memory" answers prefix lookups
+    from a per-process PrefixIndex, and "auto" (default) uses trigram on
+    PostgreSQL and memory elsewhere. The index shares the user directory's
+    generation, so the user_directory.invalidate() calls made when users
+    change also rebuild it in every worker.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._index = None
+        self._lock = threading.Lock()
+        self._generation = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('USER_SEARCH_BACKEND', 'auto')
+        app.config.setdefault('USER_SEARCH_LIMIT', 10)
+        app.config.setdefault('USER_SEARCH_MAX_LIMIT', 50)
+        app.config.setdefault('USER_SEARCH_MIN_CHARS', 2)
+        self.app = app
+        self._generation = SharedGeneration(os.path.join(app.instance_path, 'cache', 'directory.gen'))
+        app.extensions['user_search'] = self
+
+    def backend(self):
+        backend = self.app.config['USER_SEARCH_BACKEND']
+        if backend == 'auto':
+            return 'trigram' if db.engine.dialect.name == 'postgresql' else 'memory'
+        return backend
+
+    def search(self, viewer, term, limit=None, role=None, include_inactive=False):
+        """Up to ``limit`` SearchHits for ``term`` that ``viewer`` may see,
+        prefix matches on username or name first, then by name"""
+        term = (term or '').strip().lower()
+        if len(term) < self.app.config['USER_SEARCH_MIN_CHARS']:
+            return []
+        limit = max(1, min(limit or self.app.config['USER_SEARCH_LIMIT'], self.app.config['USER_SEARCH_MAX_LIMIT']))
+        if self.backend() == 'trigram':
+            return self._search_sql(viewer, term, limit, role, include_inactive)
+        return self._search_memory(viewer, term, limit, role, include_inactive)
+
+    def _search_sql(self, viewer, term, limit, role, include_inactive):
+        pattern = f'%{escape_like(term)}%'
+        prefix = f'{escape_like(term)}%'
+        # Spelled like the ix_users_full_name_trgm expression so the index applies
+        full_name = func.lower(User.first_name + literal_column("' '", String) + User.last_name)
+        username = func.lower(User.username)
+
+        query = db.session.query(
+            User.id, User.username, User.email, User.first_name, User.last_name,
+            User.role, User.is_active, User.manager_id
+        ).filter(or_(
+            username.like(pattern, escape='\\'),
+            func.lower(User.email).like(pattern, escape='\\'),
+            full_name.like(pattern, escape='\\')
+        ))
+        query = visible_filter(viewer, query)
+        if role is not None:
+            query = query.filter(User.role == role)
+        if not include_inactive:
+            query = query.filter(User.is_active.is_(True))
+
+        rank = case((or_(username.like(prefix, escape='\\'), full_name.like(prefix, escape='\\'),
+                         func.lower(User.last_name).like(prefix, escape='\\')), 0), else_=1)
+        query = query.order_by(rank, User.first_name, User.last_name, User.id).limit(limit)
+        return [SearchHit(user_id, username, email, f'{first_name} {last_name}', role, bool(is_active), manager_id)
+                for user_id, username, email, first_name, last_name, role, is_active, manager_id in query]
+
+    def _search_memory(self, viewer, term, limit, role, include_inactive):
+        visible = visible_ids(viewer)
+        hits = [hit for hit in self._load().matching(term)
+                if (role is None or hit.role == role) and (include_inactive or hit.is_active)
+                and (visible is None or hit.id in visible)]
+        return heapq.nsmallest(limit, hits, key=lambda hit: _rank(hit, term))
+
+    def _load(self):
+        generation = self._generation.current()
+        cached = self._index
+        if cached is not None and cached[0] == generation and cached[1] > time.monotonic():
+            return cached[2]
+
+        rows = db.session.query(User.id, User.username, User.email, User.first_name, User.last_name,
+                                User.role, User.is_active, User.manager_id)
+        index = PrefixIndex([SearchHit(user_id, username, email, f'{first_name} {last_name}', role,
+                                       bool(is_active), manager_id)
+                             for user_id, username, email, first_name, last_name, role, is_active, manager_id
+                             in rows])
+        expires = time.monotonic() + self.app.config['USER_DIRECTORY_TTL']
+        with self._lock:
+            self._index = (generation, expires, index)
+        return index
+
+
+user_search = UserSearch()
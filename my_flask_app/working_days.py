@@ -0,0 +1,120 @@
+import os
+import threading
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+from sqlalchemy import bindparam
+from app import db
+from app.models import Holiday, LeaveRequest
+from app.caching import SharedGeneration
+
+
+class WorkingCalendar:
+    """Counts working days in O(1) per calendar year a range touches.
+
+    For each year it builds a prefix-sum array whose i-th entry is the
+    number of working days among the first i days of the year, skipping the
+    weekdays in WORKING_WEEKEND (Saturday and Sunday by default) and the
+    holidays stored under HOLIDAY_CALENDAR. Arrays are built on first use
+    and kept until holidays change, which bumps a shared generation so every
+    worker rebuilds them.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._years = {}
+        self._seen_generation = None
+        self._generation = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('WORKING_WEEKEND', (5, 6))
+        app.config.setdefault('HOLIDAY_CALENDAR', 'default')
+        self.app = app
+        self._generation = SharedGeneration(os.path.join(app.instance_path, 'cache', 'working_days.gen'))
+        app.extensions['working_calendar'] = self
+
+    def count(self, start_date, end_date):
+        """Working days from start_date to end_date, both inclusive"""
+        if end_date < start_date:
+            return 0
+        self._check_generation()
+        total = 0
+        for year in range(start_date.year, end_date.year + 1):
+            prefix = self._prefix(year)
+            first = max(start_date, date(year, 1, 1))
+            last = min(end_date, date(year, 12, 31))
+            total += prefix[last.timetuple().tm_yday] - prefix[first.timetuple().tm_yday - 1]
+        return total
+
+    def year_flags(self, year):
+        """1 for each working day of ``year`` and 0 for the rest, in date order"""
+        self._check_generation()
+        prefix = self._prefix(year)
+        return [after - before for before, after in zip(prefix, prefix[1:])]
+
+    def is_working_day(self, day):
+        return self.count(day, day) == 1
+
+    def invalidate(self):
+        with self._lock:
+            self._years.clear()
+        self._generation.bump()
+
+    def _check_generation(self):
+        generation = self._generation.current()
+        if generation != self._seen_generation:
+            with self._lock:
+                self._years.clear()
+                self._seen_generation = generation
+
+    def _prefix(self, year):
+        prefix = self._years.get(year)
+        if prefix is None:
+            holidays = {day for day, in db.session.query(Holiday.date).filter(
+                Holiday.calendar == self.app.config['HOLIDAY_CALENDAR'],
+                Holiday.date >= date(year, 1, 1),
+                Holiday.date <= date(year, 12, 31)
+            )}
+            weekend = set(self.app.config['WORKING_WEEKEND'])
+            first = date(year, 1, 1)
+            days = (date(year + 1, 1, 1) - first).days
+            flags = (0 if (first + timedelta(days=offset)).weekday() in weekend
+                     or first + timedelta(days=offset) in holidays else 1
+                     for offset in range(days))
+            prefix = [0] + list(accumulate(flags))
+            with self._lock:
+                self._years[year] = prefix
+        return prefix
+
+
+def refresh_working_days(start_date=None, end_date=None):
+    """Recompute the stored working_days of leave requests overlapping the
+    given range (all requests when no range is given), e.g. after holidays
+    changed. Only rows whose value changes are written. Returns that count."""
+    query = db.session.query(LeaveRequest.id, LeaveRequest.start_date, LeaveRequest.end_date,
+                             LeaveRequest.working_days)
+    if start_date is not None:
+        query = query.filter(LeaveRequest.end_date >= start_date)
+    if end_date is not None:
+        query = query.filter(LeaveRequest.start_date <= end_date)
+
+    changes = []
+    for request_id, first, last, stored in query.yield_per(1000):
+        days = working_calendar.count(first, last)
+        if days != stored:
+            changes.append({'request_id': request_id, 'days': days})
+
+    if changes:
+        table = LeaveRequest.__table__
+        db.session.execute(
+            table.update().where(table.c.id == bindparam('request_id')).values(
+                working_days=bindparam('days'), updated_at=datetime.utcnow()),
+            changes
+        )
+    db.session.commit()
+    return len(changes)
+
+
+working_calendar = WorkingCalendar()
@@ -1,7 +1,16 @@
 import os
+import csv
+import click
 from flask.cli import FlaskGroup
 from app import create_app, db
-from app.models import User, LeaveRequest, AuditLog, UserRole, LeaveType, LeaveStatus
+from app.models import User, LeaveRequest, AuditLog, UserRole, LeaveType, LeaveStatus, Holiday
+from app import balances
+from app import user_import
+from app import rollups
+from app import hierarchy
+from app.audit_store import audit_store
+from app.caching import user_directory
+from app.working_days import working_calendar, refresh_working_days
 from datetime import date, datetime
 
 app = create_app()
@@ -36,9 +45,12 @@ def init_db():
     )
     admin.set_password('admin123')
     db.session.add(admin)
+    db.session.flush()
+    hierarchy.add_users([admin.id])
     
     # Commit all users
     db.session.commit()  
+    user_directory.invalidate()
 @cli.command("create-admin")
 def create_admin():
     """Create an admin user."""
@@ -57,9 +69,118 @@ def create_admin():
     )
     admin.set_password(password)
     db.session.add(admin)
+    db.session.flush()
+    hierarchy.add_users([admin.id])
     db.session.commit()
+    user_directory.invalidate()
     
     print(f"Admin user '{username}' created successfully!")
 
+@cli.command("rebuild-balances")
+def rebuild_balances():
+    """Recompute the leave balance ledger from all leave requests."""
+    count = balances.rebuild_balances()
+    print(f"Leave balances rebuilt ({count} rows).")
+
+@cli.command("rebuild-hierarchy")
+def rebuild_hierarchy():
+    """Recreate the manager hierarchy table from users.manager_id."""
+    count = hierarchy.rebuild_hierarchy()
+    print(f"User hierarchy rebuilt ({count} rows).")
+
+def holidays_changed(day):
+    """Recount leave around a holiday that was added or removed, and the balances built on it"""
+    working_calendar.invalidate()
+    count = refresh_working_days(date(day.year, 1, 1), date(day.year, 12, 31))
+    balances.rebuild_balances()
+    rollups.refresh_rollups(full=True)
+    print(f"Working days updated on {count} leave request(s); leave balances and rollups rebuilt.")
+
+@cli.command("add-holiday")
+@click.argument("day", type=click.DateTime(formats=["%Y-%m-%d"]))
+@click.argument("name")
+@click.option("--calendar", default=None, help="Holiday calendar, defaults to HOLIDAY_CALENDAR.")
+def add_holiday(day, name, calendar):
+    """Add a public holiday, which stops counting as a leave day."""
+    calendar = calendar or app.config['HOLIDAY_CALENDAR']
+    db.session.add(Holiday(calendar=calendar, date=day.date(), name=name))
+    db.session.commit()
+    print(f"Holiday '{name}' added on {day.date()} ({calendar}).")
+    holidays_changed(day.date())
+
+@cli.command("remove-holiday")
+@click.argument("day", type=click.DateTime(formats=["%Y-%m-%d"]))
+@click.option("--calendar", default=None, help="Holiday calendar, defaults to HOLIDAY_CALENDAR.")
+def remove_holiday(day, calendar):
+    """Remove a public holiday."""
+    calendar = calendar or app.config['HOLIDAY_CALENDAR']
+    deleted = Holiday.query.filter_by(calendar=calendar, date=day.date()).delete()
+    db.session.commit()
+    if not deleted:
+        raise click.ClickException(f"No holiday on {day.date()} ({calendar}).")
+    print(f"Holiday on {day.date()} removed ({calendar}).")
+    holidays_changed(day.date())
+
+@cli.command("refresh-working-days")
+def refresh_working_days_command():
+    """Recompute the stored working days of every leave request and rebuild balances."""
+    working_calendar.invalidate()
+    count = refresh_working_days()
+    balances.rebuild_balances()
+    rollups.refresh_rollups(full=True)
+    print(f"Working days updated on {count} leave request(s); leave balances and rollups rebuilt.")
+
+@cli.command("refresh-rollups")
+@click.option("--full", is_flag=True, help="Rebuild the rollups from every leave request.")
+def refresh_rollups(full):
+    """Update the monthly leave rollups from requests changed since the last run."""
+    count = rollups.refresh_rollups(full=full)
+    print(f"Leave rollups {'rebuilt' if full else 'refreshed'} ({count} request(s) processed).")
+
+@cli.command("archive-audit-logs")
+@click.option("--dry-run", is_flag=True, help="Only show what the retention policy would do.")
+def archive_audit_logs(dry_run):
+    """Archive audit log months past the retention window and prune old archives."""
+    if dry_run:
+        to_archive, to_delete = audit_store.retention_plan()
+        for month in to_archive:
+            print(f"Would archive {month:%Y-%m}")
+        for month in to_delete:
+            print(f"Would delete archive {month:%Y-%m}")
+        return
+    
+    result = audit_store.apply_retention()
+    for name in result['created']:
+        print(f"Created partition {name}")
+    for month, count in result['archived'].items():
+        print(f"Archived {month:%Y-%m} ({count} entries)")
+    for month in result['deleted']:
+        print(f"Deleted archive {month:%Y-%m}")
+    print("Audit log retention applied.")
+
+@cli.command("import-users")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--report", type=click.Path(dir_okay=False), help="Write rows that were not imported to this CSV file.")
+def import_users(path, report):
+    """Create users from a CSV or XLSX file."""
+    with open(path, 'rb') as fh:
+        try:
+            rows = list(user_import.read_rows(fh, path))
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    
+    result = user_import.import_users(rows)
+    print(f"{result.created} user(s) imported, {len(result.errors)} row(s) rejected.")
+    
+    if report:
+        with open(report, 'w', newline='') as out:
+            writer = csv.writer(out)
+            writer.writerow(['row', 'username', 'error'])
+            writer.writerows(result.errors)
+        print(f"Error report written to {report}")
+    else:
+        for row_number, username, message in result.errors:
+            print(f"  row {row_number} ({username or '-'}): {message}")
+
 if __name__ == '__main__':
     cli()
@@ -0,0 +1,82 @@
+from datetime import date, timedelta
+from app import db
+from app import hierarchy
+from app.models import User, UserRole, LeaveRequest, LeaveStatus, LeaveType
+from conftest import login
+
+
+def add_user(username, role=UserRole.EMPLOYEE, manager=None):
+    user = User(username=username, email=f'{username}@example.com', password_hash='-',
+                first_name=username.title(), last_name='Test', role=role,
+                manager_id=manager.id if manager else None)
+    db.session.add(user)
+    db.session.flush()
+    hierarchy.add_users([user.id])
+    db.session.commit()
+    return user
+
+
+def add_leave(employee):
+    start = date.today() + timedelta(days=30)
+    leave_request = LeaveRequest(employee_id=employee.id, leave_type=LeaveType.VACATION,
+                                 start_date=start, end_date=start + timedelta(days=1),
+                                 status=LeaveStatus.PENDING)
+    db.session.add(leave_request)
+    db.session.commit()
+    return leave_request
+
+
+def test_unchanged_list_is_not_modified(app, client):
+    employee = add_user('emp1')
+    add_leave(employee)
+    login(client, employee)
+
+    response = client.get('/api/v1/leave_requests')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = client.get('/api/v1/leave_requests', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
+def test_list_etag_changes_when_an_employee_is_renamed(app, client):
+    manager = add_user('mgr1', UserRole.MANAGER)
+    employee = add_user('emp1', manager=manager)
+    add_leave(employee)
+    login(client, manager)
+
+    etag = client.get('/api/v1/leave_requests').headers['ETag']
+    employee.first_name = 'Renamed'
+    db.session.commit()
+
+    response = client.get('/api/v1/leave_requests', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['items'][0]['employee_name'] == 'Renamed Test'
+
+
+def test_stale_if_match_is_refused(app, client):
+    employee = add_user('emp1')
+    leave_request = add_leave(employee)
+    login(client, employee)
+    url = f'/api/v1/leave_requests/{leave_request.id}'
+    assert client.get(url).status_code == 200
+
+    response = client.patch(url, json={'reason': 'changed'}, headers={'If-Match': '"stale"'})
+    assert response.status_code == 412
+    response = client.post(f'{url}/cancel', headers={'If-Match': '"stale"'})
+    assert response.status_code == 412
+    assert LeaveRequest.query.get(leave_request.id).status == LeaveStatus.PENDING
+
+
+def test_other_users_requests_are_not_found(app, client):
+    employee = add_user('emp1')
+    other = add_user('emp2')
+    leave_request = add_leave(other)
+    login(client, employee)
+    url = f'/api/v1/leave_requests/{leave_request.id}'
+
+    assert client.get(url).status_code == 404
+    assert client.patch(url, json={'reason': 'changed'}).status_code == 404
+    assert client.post(f'{url}/cancel').status_code == 404
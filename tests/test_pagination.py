@@ -0,0 +1,82 @@
+from datetime import date, datetime
+from app import db
+from app.models import User, UserRole, LeaveRequest, LeaveStatus, LeaveType
+from app.pagination import encode_cursor, keyset_paginate
+
+COLUMNS = (LeaveRequest.created_at, LeaveRequest.id)
+
+
+def seed(created):
+    """One leave request per ``created`` timestamp; returns their ids newest first"""
+    employee = User(username='emp1', email='emp1@example.com', password_hash='-',
+                    first_name='Emp', last_name='Test', role=UserRole.EMPLOYEE)
+    db.session.add(employee)
+    db.session.flush()
+    leave_requests = [LeaveRequest(employee_id=employee.id, leave_type=LeaveType.VACATION,
+                                   start_date=date(2026, 3, 2), end_date=date(2026, 3, 2),
+                                   status=LeaveStatus.PENDING, created_at=created_at)
+                      for created_at in created]
+    db.session.add_all(leave_requests)
+    db.session.commit()
+    ordered = sorted(leave_requests, key=lambda leave_request: (leave_request.created_at, leave_request.id),
+                     reverse=True)
+    return [leave_request.id for leave_request in ordered]
+
+
+def page(cursor=None, per_page=2):
+    return keyset_paginate(LeaveRequest.query, COLUMNS, cursor=cursor, per_page=per_page)
+
+
+def ids(keyset_page):
+    return [leave_request.id for leave_request in keyset_page.items]
+
+
+def test_forward_paging_visits_every_row_once(app):
+    expected = seed([datetime(2026, 1, day) for day in range(1, 6)])
+
+    first = page()
+    assert ids(first) == expected[:2]
+    assert not first.has_prev
+    second = page(first.next_cursor)
+    assert ids(second) == expected[2:4]
+    last = page(second.next_cursor)
+    assert ids(last) == expected[4:]
+    assert not last.has_next
+    assert last.has_prev
+
+
+def test_backward_paging_returns_the_previous_page(app):
+    expected = seed([datetime(2026, 1, day) for day in range(1, 6)])
+
+    second = page(page().next_cursor)
+    last = page(second.next_cursor)
+    assert ids(page(last.prev_cursor)) == expected[2:4]
+    first = page(second.prev_cursor)
+    assert ids(first) == expected[:2]
+    assert not first.has_prev
+    assert first.has_next
+
+
+def test_ties_on_created_at_are_ordered_by_id(app):
+    same = datetime(2026, 1, 1, 9, 30)
+    expected = seed([same, same, same, datetime(2026, 1, 2), same])
+
+    seen = []
+    cursor = None
+    while True:
+        current = page(cursor)
+        seen.extend(ids(current))
+        if not current.has_next:
+            break
+        cursor = current.next_cursor
+    assert seen == expected
+
+
+def test_malformed_cursors_give_the_first_page(app):
+    expected = seed([datetime(2026, 1, day) for day in range(1, 6)])
+
+    for cursor in ('not-a-cursor', encode_cursor(['x', 'y'], 'next'), encode_cursor([1], 'next'),
+                   encode_cursor([datetime(2026, 1, 3), 'y'], 'prev'), encode_cursor([True, 1], 'next')):
+        current = page(cursor)
+        assert ids(current) == expected[:2]
+        assert not current.has_prev
@@ -0,0 +1,17 @@
+import os
+from app.report_cache import report_cache
+
+
+def test_hits_stay_readable_after_eviction(app, tmp_path):
+    app.config['REPORT_CACHE_DIR'] = str(tmp_path / 'report_cache')
+    path = report_cache.put('key', 'pdf', b'%PDF-1.7 report')
+
+    cached = report_cache.get('key', 'pdf')
+    os.remove(path)
+    with cached:
+        assert cached.read() == b'%PDF-1.7 report'
+
+
+def test_miss_returns_none(app, tmp_path):
+    app.config['REPORT_CACHE_DIR'] = str(tmp_path / 'report_cache')
+    assert report_cache.get('missing', 'csv') is None
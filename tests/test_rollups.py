@@ -0,0 +1,54 @@
+from datetime import date
+from app import db
+from app import hierarchy
+from app import rollups
+from app.models import User, UserRole, LeaveRequest, LeaveStatus, LeaveType
+
+
+def add_user(username, role, manager=None):
+    user = User(username=username, email=f'{username}@example.com', password_hash='-',
+                first_name=username.title(), last_name='Test', role=role,
+                manager_id=manager.id if manager else None)
+    db.session.add(user)
+    db.session.flush()
+    hierarchy.add_users([user.id])
+    return user
+
+
+def test_writes_update_the_rollups_in_their_transaction(app):
+    manager = add_user('mgr1', UserRole.MANAGER)
+    employee = add_user('emp1', UserRole.EMPLOYEE, manager)
+    leave_request = LeaveRequest(employee_id=employee.id, leave_type=LeaveType.VACATION,
+                                 start_date=date(2026, 3, 2), end_date=date(2026, 3, 6),
+                                 status=LeaveStatus.PENDING)
+    db.session.add(leave_request)
+    rollups.record_changes([leave_request])
+    db.session.commit()
+
+    counts = rollups.status_counts(manager_id=manager.id)
+    assert counts[LeaveStatus.PENDING.value] == 1
+    assert counts['total'] == 1
+
+    leave_request.status = LeaveStatus.APPROVED
+    rollups.record_changes([leave_request])
+    db.session.commit()
+
+    counts = rollups.status_counts(manager_id=manager.id)
+    assert counts[LeaveStatus.PENDING.value] == 0
+    assert counts[LeaveStatus.APPROVED.value] == 1
+    assert counts['total'] == 1
+
+
+def test_refresh_agrees_with_the_write_path(app):
+    manager = add_user('mgr1', UserRole.MANAGER)
+    employee = add_user('emp1', UserRole.EMPLOYEE, manager)
+    leave_request = LeaveRequest(employee_id=employee.id, leave_type=LeaveType.SICK,
+                                 start_date=date(2026, 1, 28), end_date=date(2026, 2, 3),
+                                 status=LeaveStatus.PENDING)
+    db.session.add(leave_request)
+    rollups.record_changes([leave_request])
+    db.session.commit()
+    live = sorted(rollups.year_rows(2026))
+
+    rollups.refresh_rollups(full=True)
+    assert sorted(rollups.year_rows(2026)) == live
@@ -0,0 +1,53 @@
+from datetime import date, timedelta
+from app import db
+from app import hierarchy
+from app.models import User, UserRole, LeaveRequest, LeaveStatus, LeaveType
+from app.team_calendar import team_calendar
+
+
+def add_user(username, role, manager=None):
+    user = User(username=username, email=f'{username}@example.com', password_hash='-',
+                first_name=username.title(), last_name='Test', role=role,
+                manager_id=manager.id if manager else None)
+    db.session.add(user)
+    db.session.flush()
+    hierarchy.add_users([user.id])
+    return user
+
+
+def add_leave(employee, start, days=2):
+    leave_request = LeaveRequest(employee_id=employee.id, leave_type=LeaveType.VACATION,
+                                 start_date=start, end_date=start + timedelta(days=days - 1),
+                                 status=LeaveStatus.APPROVED)
+    db.session.add(leave_request)
+    db.session.commit()
+    return leave_request
+
+
+def test_org_calendar_covers_the_whole_subtree(app):
+    director = add_user('director', UserRole.MANAGER)
+    manager = add_user('mgr1', UserRole.MANAGER, director)
+    employee = add_user('emp1', UserRole.EMPLOYEE, manager)
+    start = date.today() + timedelta(days=7)
+    leave_request = add_leave(employee, start)
+
+    end = start + timedelta(days=30)
+    assert [absence.request_id for absence in team_calendar.absences(director.id, start, end, org=True)] == \
+        [leave_request.id]
+    # The director's team is only their direct reports
+    assert team_calendar.absences(director.id, start, end) == []
+
+
+def test_invalidating_a_team_refreshes_the_orgs_above_it(app):
+    director = add_user('director', UserRole.MANAGER)
+    manager = add_user('mgr1', UserRole.MANAGER, director)
+    employee = add_user('emp1', UserRole.EMPLOYEE, manager)
+    start = date.today() + timedelta(days=7)
+    end = start + timedelta(days=30)
+    assert team_calendar.absences(director.id, start, end, org=True) == []
+
+    leave_request = add_leave(employee, start)
+    team_calendar.invalidate_teams([employee.manager_id])
+
+    assert [absence.request_id for absence in team_calendar.absences(director.id, start, end, org=True)] == \
+        [leave_request.id]
@@ -0,0 +1,71 @@
+from app.models import User, UserRole
+from app.user_import import import_users
+
+
+def row(username, role='employee', manager=''):
+    return {
+        'username': username,
+        'email': f'{username}@example.com',
+        'first_name': username.title(),
+        'last_name': 'Test',
+        'password': 'secret123',
+        'role': role,
+        'manager': manager
+    }
+
+
+def test_manager_rows_from_the_file(app):
+    result = import_users([(2, row('mgr1', role='manager')), (3, row('emp1', manager='mgr1'))])
+
+    assert result.created == 2
+    assert result.errors == []
+    manager = User.query.filter_by(username='mgr1').one()
+    assert User.query.filter_by(username='emp1').one().manager_id == manager.id
+
+
+def test_reports_of_a_rejected_manager_row_are_rejected(app):
+    result = import_users([(2, row('mgr1', role='manager', manager='nobody')),
+                           (3, row('emp1', manager='mgr1'))])
+
+    assert result.created == 0
+    assert result.errors == [(2, 'mgr1', 'unknown manager "nobody"'),
+                             (3, 'emp1', 'unknown manager "mgr1"')]
+    assert User.query.count() == 0
+
+
+def test_rejection_follows_the_manager_chain(app):
+    result = import_users([(2, row('boss', role='manager', manager='nobody')),
+                           (3, row('lead', role='manager', manager='boss')),
+                           (4, row('emp1', manager='lead')),
+                           (5, row('emp2'))])
+
+    assert result.created == 1
+    assert [error[0] for error in result.errors] == [2, 3, 4]
+    assert User.query.one().username == 'emp2'
+    assert User.query.one().role == UserRole.EMPLOYEE
+
+
+def test_circular_manager_rows_are_rejected(app):
+    result = import_users([(2, row('aaa', role='manager', manager='bbb')),
+                           (3, row('bbb', role='manager', manager='aaa')),
+                           (4, row('emp1', manager='aaa')),
+                           (5, row('emp2'))])
+
+    assert result.created == 1
+    assert result.errors == [(2, 'aaa', 'circular manager chain'),
+                             (3, 'bbb', 'circular manager chain'),
+                             (4, 'emp1', 'unknown manager "aaa"')]
+    assert User.query.one().username == 'emp2'
+
+
+def test_over_long_values_are_row_errors(app):
+    long_email = row('emp1')
+    long_email['email'] = f'emp1@{"b" * 60}.{"c" * 60}.com'
+    long_name = row('emp2')
+    long_name['last_name'] = 'x' * 51
+
+    result = import_users([(2, long_email), (3, long_name), (4, row('emp3'))])
+
+    assert result.created == 1
+    assert result.errors == [(2, 'emp1', 'email must be at most 120 characters'),
+                             (3, 'emp2', 'last_name must be at most 50 characters')]